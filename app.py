@@ -1,14 +1,48 @@
 # app.py – Admin Royale（登录页使用自定义背景图 + 玻璃卡片 + 未登录隐藏侧栏 + 亮/暗主题 + 操作列右对齐）
-from flask import Flask, request, render_template, redirect, url_for, session, flash, abort, send_file, Response
-from jinja2 import DictLoader, TemplateNotFound
+from flask import Flask, request, render_template, redirect, url_for, session, flash, abort, Response, g, jsonify, stream_with_context, send_file
+from flask import has_app_context, has_request_context, before_render_template, template_rendered
+from jinja2 import DictLoader, TemplateNotFound, FileSystemBytecodeCache
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3, os, io, csv
-from datetime import datetime, timedelta
+from werkzeug.exceptions import HTTPException
+import sqlite3, os, sys, io, re, csv, json, uuid, itertools, threading, queue, time, hashlib, gzip, mimetypes, functools, traceback
+import click
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+try: import fcntl
+except ImportError: fcntl = None  # Windows 本地开发：不加文件锁
+try: import brotli
+except ImportError: brotli = None  # 可选：未安装时只提供 gzip
 
 APP_DB = os.environ.get("APP_DB", "data.db")
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
 SECRET_KEY    = os.environ.get("SECRET_KEY", "dev-secret")
+DB_POOL_SIZE    = int(os.environ.get("DB_POOL_SIZE", "4"))        # 每个 worker 进程最多保持的连接数
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # 连接用尽时最多等待（秒）
+DB_PROFILE      = os.environ.get("DB_PROFILE", "wal")             # 存储参数档位：wal / safe / legacy
+DB_WRITE_BATCH  = int(os.environ.get("DB_WRITE_BATCH", "64"))     # 写队列单次事务最多合并的写操作数
+DB_WRITE_TIMEOUT = float(os.environ.get("DB_WRITE_TIMEOUT", "600")) # 等写线程执行完最多多少秒，超时抛 TimeoutError
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jinja_cache"))
+TEMPLATE_WARMUP = os.environ.get("TEMPLATE_WARMUP", "1") == "1"   # 启动时预热模板，worker 接流量前完成
+PAGE_SIZE       = int(os.environ.get("PAGE_SIZE", "50"))          # 列表页默认每页行数（?size= 可改）
+PAGE_SIZE_MAX   = int(os.environ.get("PAGE_SIZE_MAX", "500"))
+EXPORT_BATCH    = int(os.environ.get("EXPORT_BATCH", "1000"))     # CSV 导出每次 fetchmany 的行数
+IMPORT_BATCH    = int(os.environ.get("IMPORT_BATCH", "1000"))     # CSV 导入每次 executemany 的行数
+METRICS_ENABLED = os.environ.get("METRICS", "1") == "1"           # 请求 / SQL / 模板计时 + /metrics
+METRICS_TOKEN   = os.environ.get("METRICS_TOKEN", "")             # 设置后 /metrics 用 Bearer token 鉴权（给 Prometheus 抓取），否则要求登录
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "1000"))  # 超过即打印慢请求日志（附最耗时的 SQL），0 关闭
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))   # >0 开启采样分析器：超过该耗时的请求把调用栈写入 PROFILE_DIR
+PROFILE_DIR     = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", "256"))   # 列表页 / 编辑 partial 渲染结果的 LRU 条数，0 关闭
+JOB_WORKERS     = int(os.environ.get("JOB_WORKERS", "2"))         # 每个 worker 进程的后台任务线程数
+JOBS_DIR        = os.environ.get("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(APP_DB)), "jobs"))  # 导出文件 / 上传暂存
+JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", "7"))  # 启动时清理更早的任务记录和文件
+ARCHIVE_DIR     = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(APP_DB)), "archive"))  # 按年的归档库
+ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "12"))  # flask archive 默认只归档更早的月份
 
 # 可选：用环境变量覆盖登录背景图
 LOGIN_BG_URL = os.environ.get("LOGIN_BG_URL", "https://i.imgur.com/KYuKCyo.png")
@@ -141,6 +175,9 @@ th{{ position:sticky; top:0; background:rgba(16,24,44,.92);backdrop-filter:blur(
 td{{padding:10px;border-bottom:1px solid var(--line)}}
 tbody tr:hover{{background: linear-gradient(90deg, color-mix(in oklab, var(--gold) 10%, transparent), transparent 60%) !important}}
 tbody tr:nth-child(even){{background:rgba(255,255,255,.02)}}
+.pager{{ display:flex; justify-content:flex-end; gap:10px; margin-top:12px }}
+.filters{{ margin:12px 0 }}
+.actions{{ display:flex; flex-wrap:wrap; align-items:center; gap:10px }} .actions form{{ margin:0; display:inline-flex; align-items:center; gap:8px }}
 
 /* 简易弹窗 */
 .modal-backdrop{{ position:fixed; inset:0; display:none; align-items:center; justify-content:center; z-index:60;
@@ -181,8 +218,55 @@ tbody tr:nth-child(even){{background:rgba(255,255,255,.02)}}
 :root[data-theme="light"] .auth-card{{ background:color-mix(in oklab, #ffffff 60%, transparent); color:#0b1020 }}
 """
 
+# ----------------------- 静态资源（指纹 URL + 预压缩） -----------------------
+# 启动时把内置 STYLE_CSS 与 static/ 下的文件读入内存、计算内容哈希并预先压缩；
+# 模板用 asset_url() 生成 /assets/<hash>/<name>，哈希匹配时按 immutable 长缓存
+ASSETS = {}
+
+def register_asset(name, body, mimetype):
+    ASSETS[name] = {
+        "body": body, "mimetype": mimetype, "hash": hashlib.sha256(body).hexdigest()[:16],
+        "gzip": gzip.compress(body, 9, mtime=0), "br": brotli.compress(body) if brotli else None,
+        "last_modified": datetime.utcnow().replace(microsecond=0),
+    }
+
+def load_assets():
+    folder = app.static_folder
+    for fn in sorted(os.listdir(folder)) if folder and os.path.isdir(folder) else []:
+        path = os.path.join(folder, fn)
+        if os.path.isfile(path):
+            with open(path, "rb") as fh:
+                register_asset(fn, fh.read(), mimetypes.guess_type(fn)[0] or "application/octet-stream")
+    register_asset("style.css", STYLE_CSS.encode("utf-8"), "text/css")  # 内置样式优先于 static/style.css
+
+def asset_url(name):
+    a = ASSETS.get(name)
+    return url_for("asset", digest=a["hash"], name=name) if a else url_for("static", filename=name)
+
+def _serve_asset(name, immutable):
+    a = ASSETS.get(name)
+    if not a: abort(404)
+    enc = next((e for e in ("br", "gzip") if a[e] and request.accept_encodings[e]), None)
+    resp = Response(a[enc] if enc else a["body"], mimetype=a["mimetype"])
+    if enc: resp.headers["Content-Encoding"] = enc
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(f"{a['hash']}-{enc or 'id'}")
+    resp.last_modified = a["last_modified"]
+    if immutable:
+        resp.cache_control.public = True; resp.cache_control.max_age = 31536000; resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+@app.get("/assets/<digest>/<path:name>")
+def asset(digest, name):
+    return _serve_asset(name, immutable=digest == ASSETS.get(name, {}).get("hash"))
+
 @app.get("/static/style.css")
-def static_style(): return Response(STYLE_CSS, mimetype="text/css")
+def static_style(): return _serve_asset("style.css", immutable=False)
+
+app.jinja_env.globals["asset_url"] = asset_url
+load_assets()
 
 # ----------------------- 内置模板 -----------------------
 TEMPLATES = {
@@ -200,7 +284,7 @@ TEMPLATES = {
     } catch (e) {} })();
   </script>
   <title>{% block title %}后台 · {{ t.app_name }}{% endblock %}</title>
-  <link rel="stylesheet" href="{{ url_for('static_style') }}?v=310">
+  <link rel="stylesheet" href="{{ asset_url('style.css') }}">
 </head>
 <body>
   {% set auth_mode = (not session.get('user_id')) and request.path.startswith('/login') %}
@@ -232,8 +316,11 @@ TEMPLATES = {
             <a href="{{ url_for('workers_list') }}" class="{{ 'active' if request.path.startswith('/workers') else '' }}"><span class="icon">👨‍💼</span>工人 / 平台</a>
             <a href="{{ url_for('bank_accounts_list') }}" class="{{ 'active' if request.path.startswith('/bank-accounts') else '' }}"><span class="icon">🏦</span>银行账户</a>
             <a href="{{ url_for('card_rentals_list') }}" class="{{ 'active' if request.path.startswith('/card-rentals') else '' }}"><span class="icon">💳</span>银行卡租金</a>
+            <a href="{{ url_for('worker_balances_report') }}" class="{{ 'active' if request.path.startswith('/reports/balances') else '' }}"><span class="icon">📒</span>{{ t.worker_balances }}</a>
+            <a href="{{ url_for('rental_accruals_report') }}" class="{{ 'active' if request.path.startswith('/reports/rentals') else '' }}"><span class="icon">🧾</span>{{ t.rental_accruals }}</a>
             <a href="{{ url_for('salaries_list') }}" class="{{ 'active' if request.path.startswith('/salaries') else '' }}"><span class="icon">💵</span>出粮记录</a>
             <a href="{{ url_for('expenses_list') }}" class="{{ 'active' if request.path.startswith('/expenses') else '' }}"><span class="icon">💸</span>开销记录</a>
+            <a href="{{ url_for('jobs_list') }}" class="{{ 'active' if request.path.startswith('/jobs') else '' }}"><span class="icon">⏱</span>{{ t.jobs }}</a>
             <a href="{{ url_for('account_security') }}" class="{{ 'active' if request.path.startswith('/account') or request.path.startswith('/account-security') else '' }}"><span class="icon">🔐</span>安全设置</a>
           </nav>
         </aside>
@@ -303,24 +390,78 @@ TEMPLATES = {
       backdrop.addEventListener('click', (e)=>{ if(e.target===backdrop) close(); });
     })();
 
+    // 批量操作：全选，勾选结果同步到批量删除表单（确认弹窗后 form.submit() 不带按钮，所以用隐藏字段）
+    (function(){
+      const boxes = () => Array.from(document.querySelectorAll('input[name="ids"][form="bulkForm"]'));
+      function sync(){ const del = document.querySelector('#bulkDeleteForm input[name="ids"]'); if(del) del.value = boxes().filter(b=>b.checked).map(b=>b.value).join(','); }
+      document.addEventListener('change', function(e){
+        if(e.target.matches('.js-check-all')) boxes().forEach(b=>{ b.checked = e.target.checked; });
+        if(e.target.matches('.js-check-all, input[name="ids"][form="bulkForm"]')) sync();
+      });
+    })();
+
     // 大弹窗加载 partial 表单 + 提交
+    // 片段缓存：按 URL（含记录 id）存 {key, etag, html}，放 sessionStorage 跨页面保留，LRU 最多 FRAG_MAX 条。
+    // 链接上的 data-cache 是服务端按相关表版本号算的键，和缓存里的一致就直接渲染，不发请求；
+    // 不一致（或链接没带键）才带 If-None-Match 去验证，没变化服务端回 304。悬停 / 聚焦时预取。
     (function(){
       const big = document.getElementById('bigBackdrop');
       const content = document.getElementById('bigContent');
       const title = document.getElementById('bigTitle');
       const closeBtn = document.getElementById('bigClose');
+      const FRAG_STORE = 'fragments', FRAG_MAX = 40;
+      let frags = null; const inflight = new Map();
+      function store(){
+        if(!frags){ try{ frags = new Map(JSON.parse(sessionStorage.getItem(FRAG_STORE) || '[]')); }catch(e){ frags = new Map(); } }
+        return frags;
+      }
+      function save(){ try{ sessionStorage.setItem(FRAG_STORE, JSON.stringify(Array.from(frags))); }catch(e){ frags.clear(); } }
+      function put(url, entry){
+        const m = store(); m.delete(url); m.set(url, entry);
+        while(m.size > FRAG_MAX) m.delete(m.keys().next().value);
+        save();
+      }
+      function partialUrl(el){ const url = el.getAttribute('href') || el.dataset.href || '#'; return url + (url.includes('?') ? '&' : '?') + 'partial=1'; }
+      function fresh(url, key){ const hit = store().get(url); return hit && key && hit.key === key ? hit.html : null; }
+      function fetchFragment(url, key){
+        if(inflight.has(url)) return inflight.get(url);
+        const hit = store().get(url); const headers = {'X-Requested-With':'fetch'};
+        if(hit && hit.etag) headers['If-None-Match'] = hit.etag;
+        const p = fetch(url, {headers, cache:'no-store'}).then(async function(res){
+          if(res.status === 304 && hit){ put(url, {...hit, key}); return hit.html; }
+          const html = await res.text();
+          // 会话过期时 fetch 跟随重定向拿到的是登录页（整页），不能进缓存，否则之后键匹配时直接显示登录表单
+          if(res.ok && !res.redirected && !html.trimStart().toLowerCase().startsWith('<!doctype')) put(url, {key, etag: res.headers.get('ETag'), html});
+          return html;
+        }).finally(function(){ inflight.delete(url); });
+        inflight.set(url, p); return p;
+      }
       function open(){ big.classList.add('open'); big.setAttribute('aria-hidden','false'); document.body.style.overflow='hidden'; }
       function close(){ big.classList.remove('open'); big.setAttribute('aria-hidden','true'); document.body.style.overflow=''; content.innerHTML=''; title.textContent='📄 表单'; }
-      async function load(url, text){
-        title.textContent = text || '📄 表单'; content.innerHTML = '<div class="panel">正在加载…</div>'; open();
-        try{
-          const res = await fetch(url + (url.includes('?') ? '&' : '?') + 'partial=1', {headers:{'X-Requested-With':'fetch'}});
-          const html = await res.text(); content.innerHTML = html;
-        }catch(e){ content.innerHTML = '<div class="panel">加载失败，请重试。</div>'; }
+      async function load(el, text){
+        const url = partialUrl(el), key = el.dataset.cache || '';
+        title.textContent = text || '📄 表单'; open();
+        const html = fresh(url, key);
+        if(html !== null){ content.innerHTML = html; return; }
+        content.innerHTML = '<div class="panel">正在加载…</div>';
+        try{ content.innerHTML = await fetchFragment(url, key); }
+        catch(e){ content.innerHTML = '<div class="panel">加载失败，请重试。</div>'; }
       }
+      let hoverTimer = null;
+      function prefetch(ev){
+        clearTimeout(hoverTimer);
+        const el = ev.target.closest && ev.target.closest('a.js-open-modal, button.js-open-modal'); if(!el) return;
+        hoverTimer = setTimeout(function(){
+          const url = partialUrl(el), key = el.dataset.cache || '';
+          if(fresh(url, key) === null) fetchFragment(url, key).catch(function(){});
+        }, ev.type === 'mouseover' ? 80 : 0);  // 鼠标扫过整列时不逐行预取
+      }
+      document.addEventListener('mouseover', prefetch);
+      document.addEventListener('focusin', prefetch);
+      document.addEventListener('touchstart', prefetch, {passive:true});
       document.addEventListener('click', function(ev){
         const el = ev.target.closest('a.js-open-modal, button.js-open-modal');
-        if(el){ ev.preventDefault(); const href = el.getAttribute('href') || el.dataset.href || '#'; const tt = el.getAttribute('data-title') || el.title || el.textContent.trim(); load(href, tt); }
+        if(el){ ev.preventDefault(); const tt = el.getAttribute('data-title') || el.title || el.textContent.trim(); load(el, tt); }
       });
       big.addEventListener('submit', async function(ev){
         const f = ev.target; if(!big.contains(f)) return; ev.preventDefault();
@@ -375,11 +516,16 @@ TEMPLATES = {
 {% block title %}Dashboard · {{ t.app_name }}{% endblock %}
 {% block app_content %}
 <h1>🏠 Dashboard</h1>
+<div class="actions">
+  <a class="btn {{ 'btn-edit' if not active_only else '' }}" href="{{ url_for('dashboard') }}">{{ t.all_records }}</a>
+  <a class="btn {{ 'btn-edit' if active_only else '' }}" href="{{ url_for('dashboard', active=1) }}">{{ t.active_only }}</a>
+</div>
 <div class="cards">
   <div class="card"><div class="card-title">{{ t.total_workers }}</div><div class="card-value">{{ total_workers }}</div></div>
-  <div class="card"><div class="card-title">{{ t.total_rentals }}</div><div class="card-value">{{ '%.2f'|format(total_rentals) }}</div></div>
-  <div class="card"><div class="card-title>{{ t.total_salaries }}</div><div class="card-value">{{ '%.2f'|format(total_salaries) }}</div></div>
-  <div class="card"><div class="card-title">{{ t.total_expenses }}</div><div class="card-value">{{ '%.2f'|format(total_expenses) }}</div></div>
+  <div class="card"><div class="card-title">{{ t.total_rentals }}</div><div class="card-value">{{ total_rentals|money }}</div></div>
+  <div class="card"><div class="card-title"><a href="{{ url_for('rental_accruals_report') }}">{{ t.accrued_this_month }}</a></div><div class="card-value">{{ accrued_this_month|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.total_salaries }}</div><div class="card-value">{{ total_salaries|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.total_expenses }}</div><div class="card-value">{{ total_expenses|money }}</div></div>
 </div>
 {% endblock %}
 """,
@@ -390,30 +536,37 @@ TEMPLATES = {
 <h1>👨‍💼 {{ t.workers }}</h1>
 <div class="panel">
   <div class="actions" style="margin-bottom:12px">
-    <a class="btn btn-edit js-open-modal" href="{{ url_for('workers_add_form') }}" data-title="➕ 新增工人">➕ {{ t.add }}</a>
+    <a class="btn btn-edit js-open-modal" href="{{ url_for('workers_add_form') }}" data-cache="{{ fragment_key() }}" data-title="➕ 新增工人">➕ {{ t.add }}</a>
     <a class="btn" href="{{ url_for('export_workers') }}">⤓ {{ t.export_workers }}</a>
+    <form method="post" action="{{ url_for('jobs_export', table='workers') }}"><button class="btn" type="submit" title="{{ t.export_background_hint }}">⏱ {{ t.export_background }}</button></form>
+    {% with import_table = "workers" %}{% include "partials/import_form.html" %}{% endwith %}
+    {% with bulk_ledger = "workers" %}{% include "partials/bulk_actions.html" %}{% endwith %}
   </div>
+  {% include "partials/filters.html" %}
+  {% set edit_key = fragment_key('workers') %}
   <div class="table-wrap">
     <table>
       <thead><tr>
-        <th>ID</th><th>{{ t.name }}</th><th>{{ t.company }}</th><th>{{ t.commission }}</th><th>{{ t.expenses }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
+        <th><input type="checkbox" class="js-check-all" title="{{ t.select_all }}"></th><th>ID</th><th>{{ t.name }}</th><th>{{ t.company }}</th><th>{{ t.commission }}</th><th>{{ t.expenses }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
       </tr></thead>
       <tbody>
         {% for r in rows %}
         <tr>
-          <td>{{ r.id }}</td><td>{{ r.name }}</td><td>{{ r.company }}</td><td>{{ r.commission }}</td><td>{{ r.expenses }}</td><td>{{ r.created_at }}</td>
+          <td><input type="checkbox" name="ids" value="{{ r.id }}" form="bulkForm"></td><td>{{ r.id }}</td><td>{{ r.name }}</td><td>{{ r.company }}</td><td>{{ r.commission|money }}</td><td>{{ r.expenses|money }}</td><td>{{ r.created_at }}</td>
           <td class="actions-cell">
             <div class="actions-inline">
               <form method="post" action="{{ url_for('workers_toggle', wid=r.id) }}"><button class="btn btn-icon" type="submit" title="{{ '停用' if r.status==1 else '启用' }}">{{ '✅' if r.status==1 else '🚫' }}</button></form>
-              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('workers_edit_form', wid=r.id) }}" data-title="✏️ 编辑工人" title="编辑">✏️</a>
+              <a class="btn btn-icon" href="{{ url_for('worker_ledger', wid=r.id) }}" title="{{ t.worker_ledger }}">📒</a>
+              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('workers_edit_form', wid=r.id) }}" data-cache="{{ edit_key }}" data-title="✏️ 编辑工人" title="编辑">✏️</a>
               <form method="post" action="{{ url_for('workers_delete', wid=r.id) }}" class="confirm" data-confirm="{{ t.confirm_delete }}"><button class="btn btn-delete btn-icon" type="submit" title="删除">🗑️</button></form>
             </div>
           </td>
         </tr>
-        {% else %}<tr><td colspan="7">{{ t.empty }}</td></tr>{% endfor %}
+        {% else %}<tr><td colspan="8">{{ t.empty }}</td></tr>{% endfor %}
       </tbody>
     </table>
   </div>
+  {% include "partials/pager.html" %}
 </div>
 {% endblock %}
 """,
@@ -424,30 +577,36 @@ TEMPLATES = {
 <h1>🏦 {{ t.bank_accounts }}</h1>
 <div class="panel">
   <div class="actions" style="margin-bottom:12px">
-    <a class="btn btn-edit js-open-modal" href="{{ url_for('bank_accounts_add_form') }}" data-title="➕ 新增银行账户">➕ {{ t.add }}</a>
+    <a class="btn btn-edit js-open-modal" href="{{ url_for('bank_accounts_add_form') }}" data-cache="{{ fragment_key() }}" data-title="➕ 新增银行账户">➕ {{ t.add }}</a>
     <a class="btn" href="{{ url_for('export_bank_accounts') }}">⤓ {{ t.export_bank }}</a>
+    <form method="post" action="{{ url_for('jobs_export', table='bank_accounts') }}"><button class="btn" type="submit" title="{{ t.export_background_hint }}">⏱ {{ t.export_background }}</button></form>
+    {% with import_table = "bank_accounts" %}{% include "partials/import_form.html" %}{% endwith %}
+    {% with bulk_ledger = "bank-accounts" %}{% include "partials/bulk_actions.html" %}{% endwith %}
   </div>
+  {% include "partials/filters.html" %}
+  {% set edit_key = fragment_key('bank_accounts') %}
   <div class="table-wrap">
     <table>
       <thead><tr>
-        <th>ID</th><th>银行名</th><th>账号</th><th>户名</th><th>卡公司</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
+        <th><input type="checkbox" class="js-check-all" title="{{ t.select_all }}"></th><th>ID</th><th>银行名</th><th>账号</th><th>户名</th><th>卡公司</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
       </tr></thead>
       <tbody>
         {% for r in rows %}
         <tr>
-          <td>{{ r.id }}</td><td>{{ r.bank_name }}</td><td>{{ r.account_no }}</td><td>{{ r.holder }}</td><td>{{ r.card_company or '-' }}</td><td>{{ r.created_at }}</td>
+          <td><input type="checkbox" name="ids" value="{{ r.id }}" form="bulkForm"></td><td>{{ r.id }}</td><td>{{ r.bank_name }}</td><td>{{ r.account_no }}</td><td>{{ r.holder }}</td><td>{{ r.card_company or '-' }}</td><td>{{ r.created_at }}</td>
           <td class="actions-cell">
             <div class="actions-inline">
               <form method="post" action="{{ url_for('bank_accounts_toggle', bid=r.id) }}"><button class="btn btn-icon" type="submit" title="{{ '停用' if r.status==1 else '启用' }}">{{ '✅' if r.status==1 else '🚫' }}</button></form>
-              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('bank_accounts_edit_form', bid=r.id) }}" data-title="✏️ 编辑银行账户" title="编辑">✏️</a>
+              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('bank_accounts_edit_form', bid=r.id) }}" data-cache="{{ edit_key }}" data-title="✏️ 编辑银行账户" title="编辑">✏️</a>
               <form method="post" action="{{ url_for('bank_accounts_delete', bid=r.id) }}" class="confirm" data-confirm="{{ t.confirm_delete }}"><button class="btn btn-delete btn-icon" type="submit" title="删除">🗑️</button></form>
             </div>
           </td>
         </tr>
-        {% else %}<tr><td colspan="7">{{ t.empty }}</td></tr>{% endfor %}
+        {% else %}<tr><td colspan="8">{{ t.empty }}</td></tr>{% endfor %}
       </tbody>
     </table>
   </div>
+  {% include "partials/pager.html" %}
 </div>
 {% endblock %}
 """,
@@ -458,31 +617,139 @@ TEMPLATES = {
 <h1>💳 {{ t.card_rentals }}</h1>
 <div class="panel">
   <div class="actions" style="margin-bottom:12px">
-    <a class="btn btn-edit js-open-modal" href="{{ url_for('card_rentals_add_form') }}" data-title="➕ 新增银行卡租金">➕ {{ t.add }}</a>
+    <a class="btn btn-edit js-open-modal" href="{{ url_for('card_rentals_add_form') }}" data-cache="{{ fragment_key() }}" data-title="➕ 新增银行卡租金">➕ {{ t.add }}</a>
     <a class="btn" href="{{ url_for('export_card_rentals') }}">⤓ {{ t.export_rentals }}</a>
+    <form method="post" action="{{ url_for('jobs_export', table='card_rentals') }}"><button class="btn" type="submit" title="{{ t.export_background_hint }}">⏱ {{ t.export_background }}</button></form>
+    {% with import_table = "card_rentals" %}{% include "partials/import_form.html" %}{% endwith %}
+    {% with bulk_ledger = "card-rentals" %}{% include "partials/bulk_actions.html" %}{% endwith %}
   </div>
+  {% include "partials/filters.html" %}
+  {% set edit_key = fragment_key('card_rentals', 'bank_accounts') %}
   <div class="table-wrap">
     <table>
       <thead><tr>
-        <th>ID</th><th>银行</th><th>账号</th><th>卡公司</th><th>月租金</th><th>开始</th><th>结束</th><th>备注</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
+        <th><input type="checkbox" class="js-check-all" title="{{ t.select_all }}"></th><th>ID</th><th>银行</th><th>账号</th><th>卡公司</th><th>月租金</th><th>开始</th><th>结束</th><th>备注</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
       </tr></thead>
       <tbody>
         {% for r in rows %}
         <tr>
-          <td>{{ r.id }}</td><td>{{ r.bank_name }}</td><td>{{ r.account_no }}</td><td>{{ r.card_company or '-' }}</td>
-          <td>{{ r.monthly_rent }}</td><td>{{ r.start_date }}</td><td>{{ r.end_date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
+          <td><input type="checkbox" name="ids" value="{{ r.id }}" form="bulkForm"></td><td>{{ r.id }}</td><td>{{ r.bank_name }}</td><td>{{ r.account_no }}</td><td>{{ r.card_company or '-' }}</td>
+          <td>{{ r.monthly_rent|money }}</td><td>{{ r.start_date }}</td><td>{{ r.end_date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
           <td class="actions-cell">
             <div class="actions-inline">
               <form method="post" action="{{ url_for('card_rentals_toggle', rid=r.id) }}"><button class="btn btn-icon" type="submit" title="{{ '停用' if r.status==1 else '启用' }}">{{ '✅' if r.status==1 else '🚫' }}</button></form>
-              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('card_rentals_edit_form', rid=r.id) }}" data-title="✏️ 编辑银行卡租金" title="编辑">✏️</a>
+              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('card_rentals_edit_form', rid=r.id) }}" data-cache="{{ edit_key }}" data-title="✏️ 编辑银行卡租金" title="编辑">✏️</a>
               <form method="post" action="{{ url_for('card_rentals_delete', rid=r.id) }}" class="confirm" data-confirm="{{ t.confirm_delete }}"><button class="btn btn-delete btn-icon" type="submit" title="删除">🗑️</button></form>
             </div>
           </td>
         </tr>
-        {% else %}<tr><td colspan="10">{{ t.empty }}</td></tr>{% endfor %}
+        {% else %}<tr><td colspan="11">{{ t.empty }}</td></tr>{% endfor %}
       </tbody>
     </table>
   </div>
+  {% include "partials/pager.html" %}
+</div>
+{% endblock %}
+""",
+
+"rental_accruals.html": """{% extends "base.html" %}
+{% block title %}{{ t.rental_accruals }} · {{ t.app_name }}{% endblock %}
+{% block app_content %}
+<h1>🧾 {{ t.rental_accruals }}</h1>
+<div class="panel">
+  <form class="form filters" method="get" action="{{ url_for('rental_accruals_report') }}">
+    <input name="from" type="month" value="{{ report.from }}" title="{{ t.date_from }}">
+    <input name="to" type="month" value="{{ report.to }}" title="{{ t.date_to }}">
+    <select name="mode">
+      <option value="daily" {% if report.mode == 'daily' %}selected{% endif %}>{{ t.accrual_daily }}</option>
+      <option value="monthly" {% if report.mode == 'monthly' %}selected{% endif %}>{{ t.accrual_monthly }}</option>
+    </select>
+    <button class="btn" type="submit">🔍 {{ t.search }}</button>
+    <a class="btn" href="{{ url_for('api_rental_accruals', **{'from': report.from, 'to': report.to, 'mode': report.mode}) }}">JSON</a>
+  </form>
+  <div class="cards">
+    <div class="card"><div class="card-title">{{ t.accrued_total }}</div><div class="card-value">{{ report.total|money }}</div></div>
+  </div>
+  <div class="table-wrap">
+    <table>
+      <thead><tr><th>{{ t.month }}</th><th>{{ t.accrual_rentals }}</th><th>{{ t.accrued }}</th></tr></thead>
+      <tbody>
+        {% for m in report.months %}<tr><td>{{ m.month }}</td><td>{{ m.rentals }}</td><td>{{ m.accrued|money }}</td></tr>{% endfor %}
+      </tbody>
+    </table>
+  </div>
+  <div class="table-wrap">
+    <table>
+      <thead><tr><th>ID</th><th>银行</th><th>账号</th><th>月租金</th><th>开始</th><th>结束</th><th>{{ t.accrual_months }}</th><th>{{ t.accrual_days }}</th><th>{{ t.accrued }}</th></tr></thead>
+      <tbody>
+        {% for r in report.rentals %}
+        <tr><td>{{ r.id }}</td><td>{{ r.bank_name }}</td><td>{{ r.account_no }}</td><td>{{ r.monthly_rent|money }}</td><td>{{ r.start_date }}</td><td>{{ r.end_date }}</td>
+            <td>{{ r.months }}</td><td>{{ r.days }}</td><td>{{ r.accrued|money }}</td></tr>
+        {% else %}<tr><td colspan="9">{{ t.empty }}</td></tr>{% endfor %}
+      </tbody>
+    </table>
+  </div>
+</div>
+{% endblock %}
+""",
+
+"worker_ledger.html": """{% extends "base.html" %}
+{% block title %}{{ w.name }} · {{ t.worker_ledger }} · {{ t.app_name }}{% endblock %}
+{% block app_content %}
+<h1>📒 {{ w.name }} <small>{{ w.company or '' }}</small></h1>
+<div class="cards">
+  <div class="card"><div class="card-title">{{ t.commission }}</div><div class="card-value">{{ w.commission|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.expenses }}</div><div class="card-value">{{ w.expenses|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.expense_records }} ({{ w.exp_n }})</div><div class="card-value">{{ w.exp|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.salaries_paid }} ({{ w.sal_n }})</div><div class="card-value">{{ w.sal|money }}</div></div>
+  <div class="card"><div class="card-title">{{ t.balance }}</div><div class="card-value">{{ w.balance|money }}</div></div>
+</div>
+<div class="panel">
+  <p>{{ t.balance_formula }}{% if w.archived %} · {{ t.archived_entries }}: {{ w.archived }}{% endif %}</p>
+  <div class="table-wrap">
+    <table>
+      <thead><tr><th>{{ t.date }}</th><th>{{ t.entry_kind }}</th><th>ID</th><th>{{ t.amount }}</th><th>{{ t.note }}</th><th>{{ t.status }}</th><th>{{ t.balance }}</th></tr></thead>
+      <tbody>
+        {% for r in page.rows %}
+        <tr>
+          <td>{{ r.d }}</td><td>{{ t.salaries_paid if r.k == 's' else t.expense_records }}</td><td>{{ r.id }}</td>
+          <td>{{ ('-' if r.k == 's' else '+') ~ (r.amount|money) }}</td><td>{{ r.note }}</td><td>{{ '✅' if r.status == 1 else '🚫' }}</td><td>{{ r.balance|money }}</td>
+        </tr>
+        {% else %}<tr><td colspan="7">{{ t.empty }}</td></tr>{% endfor %}
+      </tbody>
+    </table>
+  </div>
+  {% include "partials/pager.html" %}
+</div>
+{% endblock %}
+""",
+
+"worker_balances.html": """{% extends "base.html" %}
+{% block title %}{{ t.worker_balances }} · {{ t.app_name }}{% endblock %}
+{% block app_content %}
+<h1>📒 {{ t.worker_balances }}</h1>
+<div class="actions">
+  <a class="btn {{ 'btn-edit' if not active_only else '' }}" href="{{ url_for('worker_balances_report') }}">{{ t.all_records }}</a>
+  <a class="btn {{ 'btn-edit' if active_only else '' }}" href="{{ url_for('worker_balances_report', active=1) }}">{{ t.active_only }}</a>
+</div>
+<div class="panel">
+  <p>{{ t.balance_formula }}</p>
+  <div class="table-wrap">
+    <table>
+      <thead><tr><th>ID</th><th>{{ t.name }}</th><th>{{ t.company }}</th><th>{{ t.commission }}</th><th>{{ t.expenses }}</th><th>{{ t.expense_records }}</th><th>{{ t.salaries_paid }}</th><th>{{ t.balance }}</th><th>{{ t.actions }}</th></tr></thead>
+      <tbody>
+        {% for r in rows %}
+        <tr>
+          <td>{{ r.id }}</td><td>{{ r.name }}</td><td>{{ r.company }}</td><td>{{ r.commission|money }}</td><td>{{ r.expenses|money }}</td>
+          <td>{{ r.exp|money }} ({{ r.exp_n }})</td><td>{{ r.sal|money }} ({{ r.sal_n }})</td><td>{{ r.balance|money }}</td>
+          <td class="actions-cell"><a class="btn btn-icon" href="{{ url_for('worker_ledger', wid=r.id) }}" title="{{ t.worker_ledger }}">📒</a></td>
+        </tr>
+        {% else %}<tr><td colspan="9">{{ t.empty }}</td></tr>{% endfor %}
+      </tbody>
+      {% if rows %}<tfoot><tr><th colspan="3">{{ t.total }}</th><th>{{ totals.commission|money }}</th><th>{{ totals.expenses|money }}</th>
+        <th>{{ totals.exp|money }}</th><th>{{ totals.sal|money }}</th><th>{{ totals.balance|money }}</th><th></th></tr></tfoot>{% endif %}
+    </table>
+  </div>
 </div>
 {% endblock %}
 """,
@@ -493,30 +760,36 @@ TEMPLATES = {
 <h1>💵 {{ t.salaries }}</h1>
 <div class="panel">
   <div class="actions" style="margin-bottom:12px">
-    <a class="btn btn-edit js-open-modal" href="{{ url_for('salaries_add_form') }}" data-title="➕ 新增出粮记录">➕ {{ t.add }}</a>
+    <a class="btn btn-edit js-open-modal" href="{{ url_for('salaries_add_form') }}" data-cache="{{ fragment_key('workers') }}" data-title="➕ 新增出粮记录">➕ {{ t.add }}</a>
     <a class="btn" href="{{ url_for('export_salaries') }}">⤓ {{ t.export_salaries }}</a>
+    <form method="post" action="{{ url_for('jobs_export', table='salaries') }}"><button class="btn" type="submit" title="{{ t.export_background_hint }}">⏱ {{ t.export_background }}</button></form>
+    {% with import_table = "salaries" %}{% include "partials/import_form.html" %}{% endwith %}
+    {% with bulk_ledger = "salaries" %}{% include "partials/bulk_actions.html" %}{% endwith %}
   </div>
+  {% include "partials/filters.html" %}
+  {% set edit_key = fragment_key('salaries', 'workers') %}
   <div class="table-wrap">
     <table>
       <thead><tr>
-        <th>ID</th><th>{{ t.worker }}</th><th>{{ t.salary_amount }}</th><th>{{ t.pay_date }}</th><th>{{ t.note }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
+        <th><input type="checkbox" class="js-check-all" title="{{ t.select_all }}"></th><th>ID</th><th>{{ t.worker }}</th><th>{{ t.salary_amount }}</th><th>{{ t.pay_date }}</th><th>{{ t.note }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
       </tr></thead>
       <tbody>
         {% for r in rows %}
         <tr>
-          <td>{{ r.id }}</td><td>{{ r.worker_name }}</td><td>{{ r.amount }}</td><td>{{ r.pay_date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
+          <td><input type="checkbox" name="ids" value="{{ r.id }}" form="bulkForm"></td><td>{{ r.id }}</td><td>{{ r.worker_name }}</td><td>{{ r.amount|money }}</td><td>{{ r.pay_date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
           <td class="actions-cell">
             <div class="actions-inline">
               <form method="post" action="{{ url_for('salaries_toggle', sid=r.id) }}"><button class="btn btn-icon" type="submit" title="{{ '停用' if r.status==1 else '启用' }}">{{ '✅' if r.status==1 else '🚫' }}</button></form>
-              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('salaries_edit_form', sid=r.id) }}" data-title="✏️ 编辑出粮记录" title="编辑">✏️</a>
+              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('salaries_edit_form', sid=r.id) }}" data-cache="{{ edit_key }}" data-title="✏️ 编辑出粮记录" title="编辑">✏️</a>
               <form method="post" action="{{ url_for('salaries_delete', sid=r.id) }}" class="confirm" data-confirm="{{ t.confirm_delete }}"><button class="btn btn-delete btn-icon" type="submit" title="删除">🗑️</button></form>
             </div>
           </td>
         </tr>
-        {% else %}<tr><td colspan="7">{{ t.empty }}</td></tr>{% endfor %}
+        {% else %}<tr><td colspan="8">{{ t.empty }}</td></tr>{% endfor %}
       </tbody>
     </table>
   </div>
+  {% include "partials/pager.html" %}
 </div>
 {% endblock %}
 """,
@@ -527,27 +800,62 @@ TEMPLATES = {
 <h1>💸 {{ t.expenses }}</h1>
 <div class="panel">
   <div class="actions" style="margin-bottom:12px">
-    <a class="btn btn-edit js-open-modal" href="{{ url_for('expenses_add_form') }}" data-title="➕ 新增开销记录">➕ {{ t.add }}</a>
+    <a class="btn btn-edit js-open-modal" href="{{ url_for('expenses_add_form') }}" data-cache="{{ fragment_key('workers') }}" data-title="➕ 新增开销记录">➕ {{ t.add }}</a>
     <a class="btn" href="{{ url_for('export_expenses') }}">⤓ {{ t.export_expenses }}</a>
+    <form method="post" action="{{ url_for('jobs_export', table='expenses') }}"><button class="btn" type="submit" title="{{ t.export_background_hint }}">⏱ {{ t.export_background }}</button></form>
+    {% with import_table = "expenses" %}{% include "partials/import_form.html" %}{% endwith %}
+    {% with bulk_ledger = "expenses" %}{% include "partials/bulk_actions.html" %}{% endwith %}
   </div>
+  {% include "partials/filters.html" %}
+  {% set edit_key = fragment_key('expenses', 'workers') %}
   <div class="table-wrap">
     <table>
       <thead><tr>
-        <th>ID</th><th>{{ t.worker }}</th><th>{{ t.expense_amount }}</th><th>{{ t.date }}</th><th>{{ t.expenses_note }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
+        <th><input type="checkbox" class="js-check-all" title="{{ t.select_all }}"></th><th>ID</th><th>{{ t.worker }}</th><th>{{ t.expense_amount }}</th><th>{{ t.date }}</th><th>{{ t.expenses_note }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th>
       </tr></thead>
       <tbody>
         {% for r in rows %}
         <tr>
-          <td>{{ r.id }}</td><td>{{ r.worker_name }}</td><td>{{ r.amount }}</td><td>{{ r.date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
+          <td><input type="checkbox" name="ids" value="{{ r.id }}" form="bulkForm"></td><td>{{ r.id }}</td><td>{{ r.worker_name }}</td><td>{{ r.amount|money }}</td><td>{{ r.date }}</td><td>{{ r.note }}</td><td>{{ r.created_at }}</td>
           <td class="actions-cell">
             <div class="actions-inline">
               <form method="post" action="{{ url_for('expenses_toggle', eid=r.id) }}"><button class="btn btn-icon" type="submit" title="{{ '停用' if r.status==1 else '启用' }}">{{ '✅' if r.status==1 else '🚫' }}</button></form>
-              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('expenses_edit_form', eid=r.id) }}" data-title="✏️ 编辑开销记录" title="编辑">✏️</a>
+              <a class="btn btn-edit btn-icon js-open-modal" href="{{ url_for('expenses_edit_form', eid=r.id) }}" data-cache="{{ edit_key }}" data-title="✏️ 编辑开销记录" title="编辑">✏️</a>
               <form method="post" action="{{ url_for('expenses_delete', eid=r.id) }}" class="confirm" data-confirm="{{ t.confirm_delete }}"><button class="btn btn-delete btn-icon" type="submit" title="删除">🗑️</button></form>
             </div>
           </td>
         </tr>
-        {% else %}<tr><td colspan="7">{{ t.empty }}</td></tr>{% endfor %}
+        {% else %}<tr><td colspan="8">{{ t.empty }}</td></tr>{% endfor %}
+      </tbody>
+    </table>
+  </div>
+  {% include "partials/pager.html" %}
+</div>
+{% endblock %}
+""",
+
+"jobs.html": """{% extends "base.html" %}
+{% block title %}{{ t.jobs }} · {{ t.app_name }}{% endblock %}
+{% block app_content %}
+<h1>⏱ {{ t.jobs }}</h1>
+<div class="panel">
+  <div class="actions" style="margin-bottom:12px">
+    <form method="post" action="{{ url_for('jobs_rebuild_totals') }}"><button class="btn" type="submit">🔄 {{ t.rebuild_totals }}</button></form>
+    <form method="post" action="{{ url_for('jobs_archive') }}" class="confirm" data-confirm="{{ t.confirm_archive }}"><button class="btn" type="submit">🗄 {{ t.archive_months }}</button></form>
+  </div>
+  <div class="table-wrap">
+    <table>
+      <thead><tr><th>{{ t.job_kind }}</th><th>{{ t.status }}</th><th>{{ t.job_progress }}</th><th>{{ t.created_at }}</th><th>{{ t.actions }}</th></tr></thead>
+      <tbody>
+        {% for j in jobs %}
+        <tr>
+          <td>{{ j.kind }} {{ j.params.table or '' }}</td><td>{{ t['job_' + j.status] }}</td><td>{{ j.percent }}%</td><td>{{ j.created_at }}</td>
+          <td class="actions-cell"><div class="actions-inline">
+            <a class="btn btn-icon" href="{{ j.status_url }}" title="{{ t.job_detail }}">🔍</a>
+            {% if j.download_url %}<a class="btn btn-icon" href="{{ j.download_url }}" title="{{ t.download }}">⤓</a>{% endif %}
+          </div></td>
+        </tr>
+        {% else %}<tr><td colspan="5">{{ t.empty }}</td></tr>{% endfor %}
       </tbody>
     </table>
   </div>
@@ -555,6 +863,38 @@ TEMPLATES = {
 {% endblock %}
 """,
 
+"job.html": """{% extends "base.html" %}
+{% block title %}{{ t.jobs }} · {{ t.app_name }}{% endblock %}
+{% block app_content %}
+<h1>⏱ {{ t.jobs }}</h1>
+{% if job %}
+<div class="panel" id="jobPanel" data-status-url="{{ job.status_url }}" data-status="{{ job.status }}">
+  <p>{{ t.job_kind }}：{{ job.kind }} {{ job.params.table or '' }} · {{ t.status }}：<b>{{ t['job_' + job.status] }}</b></p>
+  <progress max="100" value="{{ job.percent }}" style="width:100%"></progress>
+  <p>{{ job.progress }}{% if job.total is not none %} / {{ job.total }}{% endif %}（{{ job.percent }}%）</p>
+  {% if job.message %}<p>{{ job.message }}</p>{% endif %}
+  {% if job.download_url %}<p><a class="btn btn-edit" href="{{ job.download_url }}">⤓ {{ t.download }} {{ job.result.filename }}</a></p>{% endif %}
+  {% if job.result and not job.download_url %}<pre>{{ job.result|tojson(indent=2) }}</pre>{% endif %}
+  <p><a class="btn" href="{{ url_for('jobs_list') }}">{{ t.jobs }}</a></p>
+</div>
+<script>
+  // 任务未结束时每 1.5 秒查询一次进度，结束后刷新页面显示结果
+  (function(){
+    const el = document.getElementById('jobPanel');
+    if(!el || ['done','failed'].includes(el.dataset.status)) return;
+    setInterval(async function(){
+      try{
+        const j = await (await fetch(el.dataset.statusUrl, {headers:{'Accept':'application/json'}})).json();
+        el.querySelector('progress').value = j.percent;
+        if(j.status === 'done' || j.status === 'failed') location.reload();
+      }catch(e){}
+    }, 1500);
+  })();
+</script>
+{% endif %}
+{% endblock %}
+""",
+
 "account_security.html": """{% extends "base.html" %}
 {% block title %}账号安全 · {{ t.app_name }}{% endblock %}
 {% block app_content %}
@@ -563,14 +903,55 @@ TEMPLATES = {
 """,
 
 # ================== partial 表单 ==================
+"partials/import_form.html": """<form method="post" action="{{ url_for('import_csv', table=import_table) }}" enctype="multipart/form-data">
+  <input type="file" name="file" accept=".csv,text/csv" required>
+  <label><input type="checkbox" name="background" value="1"> {{ t.run_in_background }}</label>
+  <button class="btn" type="submit">⤒ {{ t.import_csv }}</button>
+</form>""",
+
+"partials/bulk_actions.html": """<form id="bulkForm" method="post" action="{{ url_for('bulk_toggle', ledger=bulk_ledger) }}">
+  <button class="btn" type="submit" name="status" value="1">✅ {{ t.bulk_enable }}</button>
+  <button class="btn" type="submit" name="status" value="0">🚫 {{ t.bulk_disable }}</button>
+</form>
+<form id="bulkDeleteForm" method="post" action="{{ url_for('bulk_delete', ledger=bulk_ledger) }}" class="confirm" data-confirm="{{ t.confirm_bulk_delete }}">
+  <input type="hidden" name="ids" value="">
+  <button class="btn btn-delete" type="submit">🗑️ {{ t.bulk_delete }}</button>
+</form>""",
+
+"partials/filters.html": """{% if filters %}{% set a = request.args %}
+<form class="form filters" method="get" action="{{ url_for(request.endpoint) }}">
+  <input name="q" value="{{ a.get('q', '') }}" placeholder="{{ t.search_placeholder }}">
+  {% if filters.worker %}<select name="worker">
+    <option value="">{{ t.all_workers }}</option>
+    {% for w in filters.workers %}<option value="{{ w.id }}" {% if a.get('worker') == w.id|string %}selected{% endif %}>{{ w.name }}</option>{% endfor %}
+  </select>{% endif %}
+  {% if filters.bank %}<input name="bank" value="{{ a.get('bank', '') }}" placeholder="银行名">{% endif %}
+  {% if filters.date %}<input name="from" type="date" value="{{ a.get('from', '') }}" title="{{ t.date_from }}"><input name="to" type="date" value="{{ a.get('to', '') }}" title="{{ t.date_to }}">{% endif %}
+  <select name="status">
+    <option value="">{{ t.all_status }}</option>
+    <option value="1" {% if a.get('status') == '1' %}selected{% endif %}>{{ t.active }}</option>
+    <option value="0" {% if a.get('status') == '0' %}selected{% endif %}>{{ t.inactive }}</option>
+  </select>
+  <button class="btn" type="submit">🔍 {{ t.search }}</button>
+  {% if a %}<a class="btn" href="{{ url_for(request.endpoint) }}">{{ t.reset }}</a>{% endif %}
+</form>
+{% endif %}""",
+
+"partials/pager.html": """{% if page and (page.prev_url or page.next_url) %}
+<div class="pager">
+  {% if page.prev_url %}<a class="btn" href="{{ page.first_url }}">« {{ t.first_page }}</a><a class="btn" href="{{ page.prev_url }}">‹ {{ t.prev_page }}</a>{% endif %}
+  {% if page.next_url %}<a class="btn" href="{{ page.next_url }}">{{ t.next_page }} ›</a>{% endif %}
+</div>
+{% endif %}""",
+
 "partials/workers_form.html": """
 <div class="panel">
   <h2 style="margin-top:0">{{ '✏️ 编辑工人' if r else '➕ 新增工人' }}</h2>
   <form class="form" method="post" action="{{ url_for('workers_edit', wid=r.id) if r else url_for('workers_add') }}">
     <input name="name" value="{{ r.name if r else '' }}" placeholder="{{ t.name }}" required>
     <input name="company" value="{{ r.company if r else '' }}" placeholder="{{ t.company }}">
-    <input name="commission" type="number" step="0.01" value="{{ r.commission if r else '' }}" placeholder="{{ t.commission }}">
-    <input name="expenses" type="number" step="0.01" value="{{ r.expenses if r else '' }}" placeholder="{{ t.expenses }}">
+    <input name="commission" type="number" step="0.01" value="{{ r.commission|money if r else '' }}" placeholder="{{ t.commission }}">
+    <input name="expenses" type="number" step="0.01" value="{{ r.expenses|money if r else '' }}" placeholder="{{ t.expenses }}">
     <button class="btn btn-edit" type="submit">💾 {{ t.save if r else t.add }}</button>
   </form>
 </div>
@@ -600,7 +981,7 @@ TEMPLATES = {
     <input name="bank_name" value="{{ r.bank_name if r else '' }}" placeholder="银行名" required>
     <input name="account_no" value="{{ r.account_no if r else '' }}" placeholder="账号" required>
     <input name="card_company" value="{{ r.card_company if r else '' }}" placeholder="卡公司（Visa/Master/银联）">
-    <input name="monthly_rent" type="number" step="0.01" value="{{ r.monthly_rent if r else '' }}" placeholder="月租金" required>
+    <input name="monthly_rent" type="number" step="0.01" value="{{ r.monthly_rent|money if r else '' }}" placeholder="月租金" required>
     <input name="start_date" type="date" value="{{ r.start_date if r else '' }}" placeholder="开始日期">
     <input name="end_date" type="date" value="{{ r.end_date if r else '' }}" placeholder="结束日期">
     <textarea name="note" placeholder="备注">{{ r.note if r else '' }}</textarea>
@@ -617,7 +998,7 @@ TEMPLATES = {
     <select name="worker_id">
       {% for w in workers %}<option value="{{ w.id }}" {% if r and r.worker_id==w.id %}selected{% endif %}>{{ w.name }}</option>{% endfor %}
     </select>
-    <input name="amount" type="number" step="0.01" value="{{ r.amount if r else '' }}" placeholder="{{ t.salary_amount }}" required>
+    <input name="amount" type="number" step="0.01" value="{{ r.amount|money if r else '' }}" placeholder="{{ t.salary_amount }}" required>
     <input name="pay_date" type="date" value="{{ r.pay_date if r else '' }}" placeholder="{{ t.pay_date }}" required>
     <textarea name="note" placeholder="{{ t.note }}">{{ r.note if r else '' }}</textarea>
     <button class="btn btn-edit" type="submit">💾 {{ t.save if r else t.add }}</button>
@@ -633,7 +1014,7 @@ TEMPLATES = {
       <option value="">不关联工人</option>
       {% for w in workers %}<option value="{{ w.id }}" {% if r and r.worker_id==w.id %}selected{% endif %}>{{ w.name }}</option>{% endfor %}
     </select>
-    <input name="amount" type="number" step="0.01" value="{{ r.amount if r else '' }}" placeholder="{{ t.expense_amount }}" required>
+    <input name="amount" type="number" step="0.01" value="{{ r.amount|money if r else '' }}" placeholder="{{ t.expense_amount }}" required>
     <input name="date" type="date" value="{{ r.date if r else '' }}" placeholder="{{ t.date }}" required>
     <textarea name="note" placeholder="{{ t.expenses_note }}">{{ r.note if r else '' }}</textarea>
     <button class="btn btn-edit" type="submit">💾 {{ t.save if r else t.add }}</button>
@@ -644,11 +1025,52 @@ TEMPLATES = {
 
 app.jinja_loader = DictLoader(TEMPLATES)
 
+# 模板字节码缓存：所有 worker 共用磁盘上的同一份编译结果（按模板源码校验，改了模板会自动重编译）
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR, "tpl-%s.cache")
+
+# 预热时渲染各模板用的空数据
+_WARMUP_CONTEXT = {"rows": [], "page": None, "filters": None, "workers": [], "active_only": False,
+                   "import_table": "workers", "bulk_ledger": "workers", "jobs": [], "job": None,
+                   "total_workers": 0, "total_rentals": 0, "total_salaries": 0, "total_expenses": 0, "accrued_this_month": 0,
+                   "report": {"from": "", "to": "", "mode": "daily", "months": [], "rentals": [], "total": 0},
+                   "w": {"name": "", "company": "", "commission": 0, "expenses": 0, "exp_n": 0, "exp": 0, "sal_n": 0, "sal": 0,
+                         "balance": 0, "archived": 0}, "totals": {}}
+
+def warmup_templates(render=True):
+    # 编译（或从字节码缓存载入）并渲染每个模板一次，返回 [(模板, 编译 ms, 渲染 ms, 错误)]
+    report = []
+    with app.test_request_context("/"):
+        g._warmup = True
+        for name in sorted(TEMPLATES):
+            t0 = time.perf_counter(); err = None; render_ms = None
+            try:
+                tpl = app.jinja_env.get_template(name)
+                t1 = time.perf_counter()
+                if render:
+                    render_template(tpl, **_WARMUP_CONTEXT)
+                    render_ms = (time.perf_counter() - t1) * 1000
+            except Exception as e:
+                t1 = time.perf_counter(); err = f"{e.__class__.__name__}: {e}"
+            report.append((name, (t1 - t0) * 1000, render_ms, err))
+    return report
+
+@app.cli.command("build-templates")
+@click.option("--clean", is_flag=True, help="先清空字节码缓存，全部重新编译")
+def build_templates_cmd(clean):
+    """预编译全部模板到 JINJA_CACHE_DIR 并打印每个模板的耗时。"""
+    if clean: app.jinja_env.bytecode_cache.clear()
+    app.jinja_env.cache.clear()
+    for name, compile_ms, render_ms, err in warmup_templates():
+        print(f"{name:40s} compile {compile_ms:8.2f} ms   render {'-' if render_ms is None else f'{render_ms:8.2f} ms'}"
+              + (f"   ERROR {err}" if err else ""))
+
 @app.errorhandler(TemplateNotFound)
 def _tnf(e): return (f"Oops, template not found: <b>{e.name}</b>", 500)
 
 @app.errorhandler(Exception)
 def _any(e):
+    if isinstance(e, HTTPException): return e  # abort(400/404) 保持原状态码
     import traceback; traceback.print_exc()
     return (f"Error: <b>{e.__class__.__name__}</b><br>Message: {str(e)}", 500)
 
@@ -667,58 +1089,699 @@ I18N = {
         "export_workers": "导出工人","export_bank": "导出银行账户","export_rentals": "导出租金",
         "export_salaries": "导出工资","export_expenses": "导出开销",
         "total_workers": "工人总数","total_rentals": "总租金","total_salaries": "总工资","total_expenses": "总开销",
+        "import_csv": "导入 CSV",
+        "all_records": "全部","active_only": "仅启用",
+        "search": "搜索","search_placeholder": "搜索备注 / 姓名 / 公司 / 户名 / 账号","reset": "重置",
+        "all_workers": "全部工人","all_status": "全部状态","date_from": "开始日期","date_to": "结束日期",
+        "first_page": "首页","prev_page": "上一页","next_page": "下一页",
+        "bulk_enable": "启用所选","bulk_disable": "停用所选","bulk_delete": "删除所选","select_all": "全选",
+        "confirm_bulk_delete": "确定要删除选中的记录吗？",
+        "jobs": "后台任务","job_kind": "类型","job_progress": "进度","job_detail": "详情","download": "下载",
+        "job_queued": "排队中","job_running": "执行中","job_done": "已完成","job_failed": "失败",
+        "run_in_background": "后台执行","export_background": "后台导出","export_background_hint": "数据量大时使用，完成后在后台任务页下载",
+        "rental_accruals": "租金计提","accrual_daily": "按天折算","accrual_monthly": "按整月","accrued": "应计租金",
+        "accrued_total": "区间应计合计","accrued_this_month": "本月应计租金","accrual_rentals": "计提租约数",
+        "accrual_months": "计提月数","accrual_days": "计提天数","month": "月份",
+        "worker_ledger": "工人台账","worker_balances": "工人结余","balance": "结余","salaries_paid": "已发工资",
+        "expense_records": "开销记录","entry_kind": "类型","amount": "金额","total": "合计","archived_entries": "已归档记录",
+        "balance_formula": "结余 = 佣金 + 开销 + 开销记录 − 已发工资（只计启用的记录）",
+        "rebuild_totals": "重算汇总","archive_months": "归档旧月份",
+        "confirm_archive": "把较早月份的工资 / 开销移到归档库？归档后的记录不再出现在列表和导出中。",
     }
 }
 def get_lang(): return request.args.get("lang") or request.cookies.get("lang") or "zh"
 def T(): return I18N.get(get_lang(), I18N["zh"])
 
+# ----------------------- 金额（整数分） -----------------------
+# 金额列一律存整数分，列类型声明为 "CENTS INTEGER"：亲和性仍是 INTEGER，SUM 走精确整数运算；
+# 连接开启 PARSE_DECLTYPES 后读出来直接是 Money。表单 / CSV 里的 "12.30" 经 Money.parse 转成 1230。
+class Money(int):
+    """以分为单位的金额；str() 输出两位小数的元，如 Money(1230) -> '12.30'。"""
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, v):
+        # 元 -> 分，四舍五入到分；空值为 0，非数字或超出 SQLite INTEGER（有符号 64 位）范围抛 ValueError
+        if v is None or v == "": return cls(0)
+        try:
+            d = Decimal(str(v).strip().replace(",", ""))
+            cents = int((d * 100).quantize(Decimal(1), ROUND_HALF_UP)) if d.is_finite() else None
+        except InvalidOperation: cents = None  # 如 '1e30'：超出 Decimal 精度
+        if cents is None or not -2**63 <= cents < 2**63: raise ValueError(f"不是金额: {v!r}")
+        return cls(cents)
+
+    def __str__(self):
+        return f"{'-' if self < 0 else ''}{abs(self) // 100}.{abs(self) % 100:02d}"
+
+    def __repr__(self): return f"Money({self})"
+
+    def units(self):
+        # JSON 输出用：元为单位的 float
+        return int(self) / 100
+
+sqlite3.register_converter("CENTS", lambda b: Money(int(b)))
+
+def money(v):
+    # 模板过滤器：整数分（含 SUM 结果）-> '12.30'，None 为空串
+    return "" if v is None else str(Money(v))
+
+app.jinja_env.filters["money"] = money
+
+def form_money(name):
+    try: return Money.parse(request.form.get(name))
+    except ValueError: abort(400)
+
+# ----------------------- 日期 -----------------------
+# 业务日期一律存 'YYYY-MM-DD'（字典序即时间序，BETWEEN / substr 取月都可直接走索引），created_at 存 ISO 时间戳；
+# 未填的可选日期存 ''。写入前统一经 norm_date 规整，认不出的写法直接拒绝。
+_DATE_RE = re.compile(r"(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*日?"
+                      r"(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?|(\d{4})(\d{2})(\d{2})")  # 日期后面只允许跟时间
+
+def norm_date(v):
+    # '2024/3/5'、'2024年3月5日'、'20240305'、'2024-03-05T08:00:00' -> '2024-03-05'；空值为 ''
+    v = (v or "").strip()
+    if not v: return ""
+    m = _DATE_RE.fullmatch(v)
+    if not m: raise ValueError(f"不是日期: {v!r}")
+    y, mo, d = (int(x) for x in (m.group(1, 2, 3) if m.group(1) else m.group(4, 5, 6)))
+    try: return date(y, mo, d).isoformat()
+    except ValueError: raise ValueError(f"不是日期: {v!r}") from None
+
+def norm_timestamp(v):
+    # created_at：ISO 时间戳原样保留（统一成 'T' 分隔），只有日期的补成当天 00:00:00
+    v = (v or "").strip()
+    try: return datetime.fromisoformat(v).isoformat()
+    except ValueError: return norm_date(v) + "T00:00:00" if v else ""
+
+def form_date(name, required=False):
+    try: v = norm_date(request.form.get(name))
+    except ValueError: abort(400)
+    if required and not v: abort(400)
+    return v
+
 # ----------------------- DB 工具与初始化 -----------------------
-def conn():
-    c = sqlite3.connect(APP_DB)
+# 存储档位：每项都可用同名环境变量覆盖，例如 DB_SYNCHRONOUS=FULL、DB_MMAP_SIZE=0
+DB_PROFILES = {
+    "wal":    {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000,
+               "mmap_size": 128 * 1024 * 1024, "temp_store": "MEMORY", "busy_timeout": 5000},
+    "safe":   {"journal_mode": "WAL", "synchronous": "FULL", "cache_size": -8000,
+               "mmap_size": 0, "temp_store": "DEFAULT", "busy_timeout": 10000},
+    "legacy": {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000,
+               "mmap_size": 0, "temp_store": "DEFAULT", "busy_timeout": 5000},
+}
+
+def db_pragmas():
+    prof = dict(DB_PROFILES.get(DB_PROFILE, DB_PROFILES["wal"]))
+    for k in prof:
+        v = os.environ.get("DB_" + k.upper())
+        if v: prof[k] = v
+    return prof
+
+def db_connect(path=None, **kw):
+    c = sqlite3.connect(path or APP_DB, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES, **kw)
     c.row_factory = sqlite3.Row
+    for k, v in db_pragmas().items():
+        c.execute(f"PRAGMA {k}={v}")
     return c
 
-def ensure_column(c, table, col, decl, default_value=None):
-    cur = c.cursor()
-    cur.execute(f"PRAGMA table_info({table})")
-    cols = [r["name"] for r in cur.fetchall()]
+class ConnPool:
+    """进程内 SQLite 长连接池：请求内借出一条连接，teardown 时归还；fork 后丢弃父进程的句柄。"""
+    def __init__(self, path, size, timeout):
+        self.path, self.size, self.timeout = path, max(1, size), timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {"checkouts": 0, "waits": 0, "wait_ms": 0.0, "opened": 0, "discarded": 0}
+
+    def _bump(self, key, n=1):
+        with self._lock: self._stats[key] += n
+
+    def _connect(self):
+        c = db_connect(self.path, factory=_TimedConnection if METRICS_ENABLED else sqlite3.Connection)
+        self._bump("opened")
+        return c
+
+    def _grow(self):
+        try: return self._connect()
+        except Exception:
+            with self._lock: self._open -= 1
+            raise
+
+    def _discard(self, c):
+        try: c.close()
+        except sqlite3.Error: pass
+        with self._lock: self._open -= 1; self._stats["discarded"] += 1
+
+    @staticmethod
+    def _healthy(c):
+        try: c.execute("SELECT 1").fetchone(); return True
+        except sqlite3.Error: return False
+
+    def acquire(self):
+        if self._pid != os.getpid(): self._reset()
+        self._bump("checkouts")
+        try:
+            c = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._open < self.size
+                if grow: self._open += 1
+            if grow: return self._grow()
+            t0 = time.perf_counter()
+            try: c = self._idle.get(timeout=self.timeout)
+            except queue.Empty: raise RuntimeError(f"DB pool exhausted ({self.size} connections busy)")
+            with self._lock: self._stats["waits"] += 1; self._stats["wait_ms"] += (time.perf_counter() - t0) * 1000
+        if not self._healthy(c):
+            self._discard(c)
+            with self._lock: self._open += 1
+            return self._grow()
+        return c
+
+    def release(self, c):
+        if self._pid != os.getpid(): return
+        try:
+            if c.in_transaction: c.rollback()
+        except sqlite3.Error:
+            self._discard(c); return
+        self._idle.put(c)
+
+    def close_idle(self):
+        while True:
+            try: c = self._idle.get_nowait()
+            except queue.Empty: return
+            self._discard(c)
+
+    def snapshot(self):
+        with self._lock: st = dict(self._stats); n_open = self._open
+        idle = self._idle.qsize()
+        return {**st, "wait_ms": round(st["wait_ms"], 3), "size": self.size, "open": n_open,
+                "idle": idle, "in_use": n_open - idle, "pid": self._pid}
+
+_pool = ConnPool(APP_DB, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+def conn():
+    # 同一请求（app context）内复用同一条连接，包括 get_or_create_bank_account 这类辅助函数
+    c = g.get("_db")
+    if c is None: c = g._db = _pool.acquire()
+    return c
+
+@app.teardown_appcontext
+def _release_db(exc):
+    c = g.pop("_db", None)
+    if c is not None: _pool.release(c)
+
+class WriteQueue:
+    """进程内单写线程：所有写操作排队串行执行，同一时刻排队的写合并进一个事务一次提交。
+    每个写操作各自包在 SAVEPOINT 里，某一个失败只回滚它自己。
+    写线程本身挂掉（连不上库、非 Exception 异常）时，手上和排队中的写操作全部以该错误失败，下次 submit 重新起线程。"""
+    def __init__(self, path, batch):
+        self.path, self.batch = path, max(1, batch)
+        self._pid, self._lock, self._thread = None, threading.Lock(), None
+
+    def _start(self):
+        self._q = queue.Queue()
+        self._stats = {"jobs": 0, "commits": 0, "errors": 0, "max_batch": 0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        self._pid = os.getpid()
+
+    def submit(self, fn, *args):
+        if threading.current_thread() is self._thread:  # 写操作里再嵌套写：直接在当前事务里执行
+            return fn(self._conn, *args)
+        job = {"fn": fn, "args": args, "done": threading.Event()}
+        with self._lock:  # 与 _run 收尾互斥：不会把写操作放进已经没有线程消费的队列
+            if self._pid != os.getpid() or not self._thread.is_alive(): self._start()
+            self._q.put(job)
+        if not job["done"].wait(DB_WRITE_TIMEOUT):
+            job["abandoned"] = True  # 还没轮到的不再执行；已在执行的照常完成
+            raise TimeoutError(f"write queue did not finish within {DB_WRITE_TIMEOUT:g}s")
+        if "error" in job: raise job["error"]
+        return job.get("result")
+
+    def _run(self):
+        q, c, jobs = self._q, None, []
+        try:
+            self._conn = c = db_connect(self.path, isolation_level=None)
+            self._loop(q, c, jobs)
+        except BaseException as e:
+            traceback.print_exc()
+            err = e if isinstance(e, Exception) else RuntimeError(f"db writer stopped: {e.__class__.__name__}")
+            with self._lock:
+                if self._q is q: self._pid = None  # 下次 submit 重新起线程
+                pending = list(jobs)
+                while True:
+                    try: pending.append(q.get_nowait())
+                    except queue.Empty: break
+            for job in pending:
+                if not job["done"].is_set(): job["error"] = err; job["done"].set()
+            if c is not None:
+                try: c.close()  # 未提交的事务随连接关闭回滚
+                except sqlite3.Error: pass
+
+    def _loop(self, q, c, jobs):
+        # jobs：调用方传入的列表，原地更新为当前批次，线程出错时 _run 据此让它们失败
+        while True:
+            jobs[:] = [q.get()]
+            while len(jobs) < self.batch:
+                try: jobs.append(q.get_nowait())
+                except queue.Empty: break
+            jobs[:] = [j for j in jobs if not j.get("abandoned")]
+            if not jobs: continue
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                for job in jobs:
+                    c.execute("SAVEPOINT job")
+                    try:
+                        job["result"] = job["fn"](c, *job["args"])
+                        c.execute("RELEASE job")
+                    except Exception as e:
+                        c.execute("ROLLBACK TO job"); c.execute("RELEASE job")
+                        job["error"] = e
+                c.execute("COMMIT")
+                self._stats["commits"] += 1
+            except Exception as e:
+                try: c.execute("ROLLBACK")
+                except sqlite3.Error: pass
+                for job in jobs: job["error"] = e
+            self._stats["jobs"] += len(jobs)
+            self._stats["errors"] += sum(1 for j in jobs if "error" in j)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(jobs))
+            for job in jobs: job["done"].set()
+
+    def snapshot(self):
+        if self._pid != os.getpid(): return {"running": False}
+        return {**self._stats, "running": True, "queued": self._q.qsize()}
+
+_writer = WriteQueue(APP_DB, DB_WRITE_BATCH)
+
+def db_write(fn, *args):
+    # 写操作统一入口：fn(c, *args) 在写线程的事务里执行，返回值原样带回；不要在 fn 里 commit
+    obs = _obs_current()
+    if obs is None: return _writer.submit(fn, *args)
+    t0 = time.perf_counter()
+    try: return _writer.submit(fn, *args)
+    finally: obs["write_s"] += time.perf_counter() - t0; obs["write_n"] += 1
+
+def ensure_column(c, table, col, decl):
+    # 只在迁移里调用；ADD COLUMN 的 DEFAULT 对旧行直接生效，不需要整表 UPDATE 回填
+    cols = [r["name"] for r in c.execute(f"PRAGMA table_info({table})")]
     if col not in cols:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
-        if default_value is not None:
-            cur.execute(f"UPDATE {table} SET {col}=?", (default_value,))
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+
+# Dashboard 汇总：ledger_totals 每个账本一行，由触发器随增删改增量维护，读取代价 O(1)
+# 账本 -> 金额列（workers 只计数）
+TOTALS_LEDGERS = {"workers": None, "card_rentals": "monthly_rent", "salaries": "amount", "expenses": "amount"}
+
+def _amount(ledger, r):
+    col = TOTALS_LEDGERS[ledger]
+    return f"IFNULL({r}.{col}, 0)" if col else "0"
+
+def _totals_delta(ledger, r, sign):
+    amt = _amount(ledger, r)
+    return (f"UPDATE ledger_totals SET n = n {sign} 1, total = total {sign} {amt}, "
+            f"n_active = n_active {sign} ({r}.status IS 1), total_active = total_active {sign} {amt} * ({r}.status IS 1) "
+            f"WHERE ledger = '{ledger}';")
+
+def ensure_totals(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS ledger_totals(
+        ledger TEXT PRIMARY KEY, n INTEGER DEFAULT 0, total CENTS INTEGER DEFAULT 0, n_active INTEGER DEFAULT 0, total_active CENTS INTEGER DEFAULT 0
+    )""")
+    for t, col in TOTALS_LEDGERS.items():
+        cols = f"status, {col}" if col else "status"
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_totals_ai AFTER INSERT ON {t} BEGIN {_totals_delta(t, 'NEW', '+')} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_totals_ad AFTER DELETE ON {t} BEGIN {_totals_delta(t, 'OLD', '-')} END")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {t}_totals_au AFTER UPDATE OF {cols} ON {t} BEGIN
+            {_totals_delta(t, 'OLD', '-')} {_totals_delta(t, 'NEW', '+')} END""")
+    if c.execute("SELECT COUNT(*) n FROM ledger_totals").fetchone()["n"] < len(TOTALS_LEDGERS):
+        rebuild_totals(c)
+
+# 按月汇总：monthly_totals 以 (账本, YYYY-MM) 为键，同样由触发器维护，供 /api/summary 使用
+MONTH_LEDGERS = {"card_rentals": "start_date", "salaries": "pay_date", "expenses": "date"}
+
+def _month_delta(ledger, r, sign):
+    amt, month = _amount(ledger, r), f"substr(IFNULL({r}.{MONTH_LEDGERS[ledger]}, ''), 1, 7)"
+    return (f"INSERT INTO monthly_totals(ledger, month, n, total, n_active, total_active) "
+            f"VALUES('{ledger}', {month}, {sign}1, {sign}{amt}, {sign}({r}.status IS 1), {sign}{amt} * ({r}.status IS 1)) "
+            f"ON CONFLICT(ledger, month) DO UPDATE SET n = n + excluded.n, total = total + excluded.total, "
+            f"n_active = n_active + excluded.n_active, total_active = total_active + excluded.total_active;")
+
+def ensure_monthly(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS monthly_totals(
+        ledger TEXT, month TEXT, n INTEGER DEFAULT 0, total CENTS INTEGER DEFAULT 0, n_active INTEGER DEFAULT 0, total_active CENTS INTEGER DEFAULT 0,
+        PRIMARY KEY(ledger, month)
+    ) WITHOUT ROWID""")
+    fresh = c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='salaries_monthly_ai'").fetchone() is None
+    for t, dcol in MONTH_LEDGERS.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_monthly_ai AFTER INSERT ON {t} BEGIN {_month_delta(t, 'NEW', '+')} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_monthly_ad AFTER DELETE ON {t} BEGIN {_month_delta(t, 'OLD', '-')} END")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {t}_monthly_au AFTER UPDATE OF status, {TOTALS_LEDGERS[t]}, {dcol} ON {t} BEGIN
+            {_month_delta(t, 'OLD', '-')} {_month_delta(t, 'NEW', '+')} END""")
+    if fresh: rebuild_monthly(c)
+
+def rebuild_totals(c):
+    # 全表重算（恢复用）；平时由触发器维护
+    c.execute("DELETE FROM ledger_totals")
+    for t in TOTALS_LEDGERS:
+        a = _amount(t, t)
+        c.execute(f"""INSERT INTO ledger_totals(ledger, n, total, n_active, total_active)
+                      SELECT '{t}', COUNT(*), IFNULL(SUM({a}), 0), IFNULL(SUM(status IS 1), 0), IFNULL(SUM({a} * (status IS 1)), 0) FROM {t}""")
+
+def rebuild_monthly(c):
+    c.execute("DELETE FROM monthly_totals")
+    for t, dcol in MONTH_LEDGERS.items():
+        a = _amount(t, t)
+        c.execute(f"""INSERT INTO monthly_totals(ledger, month, n, total, n_active, total_active)
+                      SELECT '{t}', substr(IFNULL({dcol}, ''), 1, 7) m, COUNT(*), SUM({a}), SUM(status IS 1), SUM({a} * (status IS 1))
+                      FROM {t} GROUP BY m""")
+
+# 工人结余：worker_balances 以 (工人, 账本, 部分) 为键累计工资 / 开销记录的笔数与金额。
+# part='hot' 由触发器随主表增删改维护；part='archive' 是已归档记录的部分，由归档 / 撤销归档时增减。
+# 台账页与结余报表只读这张小表，不再对几万笔明细做 SUM。
+BALANCE_LEDGERS = ("salaries", "expenses")
+
+def _balance_delta(ledger, r, sign):
+    amt = _amount(ledger, r)
+    return (f"INSERT INTO worker_balances(worker_id, ledger, part, n, total, n_active, total_active) "
+            f"VALUES(IFNULL({r}.worker_id, 0), '{ledger}', 'hot', {sign}1, {sign}{amt}, {sign}({r}.status IS 1), {sign}{amt} * ({r}.status IS 1)) "
+            f"ON CONFLICT(worker_id, ledger, part) DO UPDATE SET n = n + excluded.n, total = total + excluded.total, "
+            f"n_active = n_active + excluded.n_active, total_active = total_active + excluded.total_active;")
+
+def _balance_upsert(ledger, part, src, where, sign=""):
+    # 按工人分组把 src 里符合 where 的记录加进（sign='-' 时扣出）worker_balances 的 part 部分
+    a = _amount(ledger, ledger)
+    return f"""INSERT INTO worker_balances(worker_id, ledger, part, n, total, n_active, total_active)
+               SELECT IFNULL(worker_id, 0) w, '{ledger}', '{part}', {sign}COUNT(*), {sign}SUM({a}), {sign}SUM(status IS 1), {sign}SUM({a} * (status IS 1))
+               FROM {src} WHERE {where} GROUP BY w
+               ON CONFLICT(worker_id, ledger, part) DO UPDATE SET n = n + excluded.n, total = total + excluded.total,
+               n_active = n_active + excluded.n_active, total_active = total_active + excluded.total_active"""
+
+def ensure_balances(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS worker_balances(
+        worker_id INTEGER, ledger TEXT, part TEXT, n INTEGER DEFAULT 0, total CENTS INTEGER DEFAULT 0,
+        n_active INTEGER DEFAULT 0, total_active CENTS INTEGER DEFAULT 0, PRIMARY KEY(worker_id, ledger, part)
+    ) WITHOUT ROWID""")
+    fresh = c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='salaries_balance_ai'").fetchone() is None
+    for t in BALANCE_LEDGERS:
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_balance_ai AFTER INSERT ON {t} BEGIN {_balance_delta(t, 'NEW', '+')} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_balance_ad AFTER DELETE ON {t} BEGIN {_balance_delta(t, 'OLD', '-')} END")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {t}_balance_au AFTER UPDATE OF status, worker_id, {TOTALS_LEDGERS[t]} ON {t} BEGIN
+            {_balance_delta(t, 'OLD', '-')} {_balance_delta(t, 'NEW', '+')} END""")
+    if fresh: rebuild_balances(c)
+
+def rebuild_balances(c):
+    # 只重算 hot 部分；archive 部分的明细不在主库
+    c.execute("DELETE FROM worker_balances WHERE part = 'hot'")
+    for t in BALANCE_LEDGERS: c.execute(_balance_upsert(t, "hot", t, "1"))
+
+# 二级索引（声明式）：(索引名, 表, 列, 是否唯一)；启动时缺失则创建，定义不一致则重建
+# 按日期 / 工人的 SUM 把金额列（工人台账还要 status）带进索引，聚合直接由覆盖索引完成，不回表
+INDEXES = [
+    ("ux_bank_accounts_bank_acct",   "bank_accounts", "bank_name, account_no",               True),
+    ("ix_card_rentals_bank_account", "card_rentals",  "bank_account_id",                     False),
+    ("ix_card_rentals_start_date",   "card_rentals",  "start_date, monthly_rent",            False),
+    ("ix_salaries_worker",           "salaries",      "worker_id, pay_date, amount, status", False),
+    ("ix_salaries_pay_date",         "salaries",      "pay_date, amount",                    False),
+    ("ix_expenses_worker",           "expenses",      "worker_id, date, amount, status",     False),
+    ("ix_expenses_date",             "expenses",      "date, amount",                        False),
+]
+
+# 热点查询：启动时 EXPLAIN QUERY PLAN，若退化成全表扫描就打印警告
+HOT_QUERIES = {
+    "bank_account_lookup": ("SELECT id, card_company FROM bank_accounts WHERE bank_name=? AND account_no=?", ("", "")),
+    "rentals_by_account":  ("SELECT id FROM card_rentals WHERE bank_account_id=?", (0,)),
+    "rentals_by_start":    ("SELECT SUM(monthly_rent) FROM card_rentals WHERE start_date BETWEEN ? AND ?", ("", "")),
+    "salaries_by_worker":  ("SELECT * FROM salaries WHERE worker_id=? ORDER BY pay_date", (0,)),
+    "salaries_by_date":    ("SELECT SUM(amount) FROM salaries WHERE pay_date BETWEEN ? AND ?", ("", "")),
+    "expenses_by_worker":  ("SELECT * FROM expenses WHERE worker_id=? ORDER BY date", (0,)),
+    "expenses_by_date":    ("SELECT SUM(amount) FROM expenses WHERE date BETWEEN ? AND ?", ("", "")),
+}
+
+def _index_sql(name, table, cols, unique):
+    return f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table}({cols})"
+
+def _merge_duplicate_bank_accounts(c):
+    # 建唯一索引前：同一 (bank_name, account_no) 只保留最小 id，租金记录改指向它；
+    # 被合并掉的行整行留在 bank_accounts_merged（merged_into = 保留的 id），不丢户名 / 卡公司 / 状态
+    dup = "EXISTS (SELECT 1 FROM bank_accounts o WHERE o.bank_name = b.bank_name AND o.account_no = b.account_no AND o.id < b.id)"
+    n = c.execute(f"SELECT COUNT(*) n FROM bank_accounts b WHERE {dup}").fetchone()["n"]
+    if not n: return
+    c.execute("""CREATE TABLE IF NOT EXISTS bank_accounts_merged(
+        id INTEGER, bank_name TEXT, account_no TEXT, holder TEXT, card_company TEXT, status INTEGER, created_at TEXT,
+        merged_into INTEGER, merged_at TEXT)""")
+    c.execute(f"""INSERT INTO bank_accounts_merged(id, bank_name, account_no, holder, card_company, status, created_at, merged_into, merged_at)
+                  SELECT b.id, b.bank_name, b.account_no, b.holder, b.card_company, b.status, b.created_at,
+                         (SELECT MIN(o.id) FROM bank_accounts o WHERE o.bank_name = b.bank_name AND o.account_no = b.account_no), ?
+                  FROM bank_accounts b WHERE {dup}""", (datetime.utcnow().isoformat(),))
+    c.execute(f"""UPDATE card_rentals SET bank_account_id = (
+                    SELECT MIN(o.id) FROM bank_accounts b JOIN bank_accounts o ON o.bank_name = b.bank_name AND o.account_no = b.account_no
+                    WHERE b.id = card_rentals.bank_account_id)
+                  WHERE bank_account_id IN (SELECT id FROM bank_accounts b WHERE {dup})""")
+    c.execute(f"DELETE FROM bank_accounts WHERE id IN (SELECT id FROM bank_accounts b WHERE {dup})")
+    print(f"Merged {n} duplicate bank_accounts rows before creating ux_bank_accounts_bank_acct (originals kept in bank_accounts_merged)")
+
+def ensure_indexes(c):
+    existing = {r["name"]: r["sql"] for r in c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")}
+    for name, table, cols, unique in INDEXES:
+        want = _index_sql(name, table, cols, unique)
+        if existing.get(name) == want: continue
+        if name in existing: c.execute(f"DROP INDEX {name}")
+        if table == "bank_accounts" and unique: _merge_duplicate_bank_accounts(c)
+        c.execute(want)
+
+def check_query_plans(c, verbose=False):
+    bad = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [r["detail"] for r in c.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        if verbose: print(f"{name}: {' | '.join(plan)}")
+        if any(d.startswith("SCAN ") for d in plan): bad.append(name)
+    for name in bad: print(f"WARNING: hot query '{name}' falls back to a full table scan")
+    return bad
+
+# 全文检索：每个账本一张 FTS5 外部内容表 <表>_fts（trigram 分词，中文/账号可按子串搜索），由触发器同步
+FTS_TABLES = {
+    "workers":       ("name", "company"),
+    "bank_accounts": ("bank_name", "account_no", "holder", "card_company"),
+    "card_rentals":  ("note",),
+    "salaries":      ("note",),
+    "expenses":      ("note",),
+}
+
+def ensure_fts(c):
+    try: c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        print("WARNING: SQLite built without FTS5/trigram; search falls back to LIKE"); return
+    c.execute("DROP TABLE temp._fts_probe")
+    for t, cols in FTS_TABLES.items():
+        cl = ", ".join(cols)
+        new, old = ", ".join(f"new.{x}" for x in cols), ", ".join(f"old.{x}" for x in cols)
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {t}_fts USING fts5({cl}, content='{t}', content_rowid='id', tokenize='trigram')")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_fts_ai AFTER INSERT ON {t} BEGIN INSERT INTO {t}_fts(rowid, {cl}) VALUES(new.id, {new}); END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_fts_ad AFTER DELETE ON {t} BEGIN INSERT INTO {t}_fts({t}_fts, rowid, {cl}) VALUES('delete', old.id, {old}); END")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {t}_fts_au AFTER UPDATE OF {cl} ON {t} BEGIN
+            INSERT INTO {t}_fts({t}_fts, rowid, {cl}) VALUES('delete', old.id, {old});
+            INSERT INTO {t}_fts(rowid, {cl}) VALUES(new.id, {new}); END""")
+        c.execute(f"INSERT INTO {t}_fts({t}_fts) VALUES('rebuild')")
+
+# 表版本号：任何增删改都由触发器 +1，各 gunicorn 进程据此判断自己的进程内缓存是否过期，
+# 也是列表页 ETag / Last-Modified 的来源（处理函数、CSV 导入、CLI 的写入都会触发）
+VERSIONED_TABLES = ("workers", "bank_accounts", "card_rentals", "salaries", "expenses")
+
+def ensure_versions(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS table_versions(
+        tbl TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0, changed_at TEXT
+    ) WITHOUT ROWID""")
+    for t in VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO table_versions(tbl, version, changed_at) VALUES(?, 0, ?)", (t, datetime.utcnow().isoformat()))
+        bump = f"UPDATE table_versions SET version = version + 1, changed_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE tbl = '{t}';"
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+            c.execute(f"CREATE TRIGGER IF NOT EXISTS {t}_version_{suffix} AFTER {event} ON {t} BEGIN {bump} END")
+
+@app.cli.command("check-indexes")
+def check_indexes_cmd():
+    """创建/核对 INDEXES 并打印热点查询的执行计划。"""
+    c = conn(); c.execute("BEGIN IMMEDIATE")
+    ensure_indexes(c); c.commit()
+    check_query_plans(c, verbose=True)
+
+@app.cli.command("rebuild-totals")
+def rebuild_totals_cmd():
+    """重算汇总表 ledger_totals、monthly_totals 与 worker_balances。"""
+    db_write(lambda c: (rebuild_totals(c), rebuild_monthly(c), rebuild_balances(c)))
+    print("ledger_totals / monthly_totals / worker_balances rebuilt")
+
+# ----------------------- 结构迁移 -----------------------
+# schema_version 记录已执行的步骤；版本已是最新时启动只读一行，不做任何探测
+def _m1_base(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS users(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password_hash TEXT, is_admin INTEGER DEFAULT 1
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS workers(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, company TEXT, commission REAL DEFAULT 0.0, expenses REAL DEFAULT 0.0, status INTEGER DEFAULT 1, created_at TEXT
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS bank_accounts(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, bank_name TEXT, account_no TEXT, holder TEXT, status INTEGER DEFAULT 1, created_at TEXT, card_company TEXT DEFAULT ''
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS card_rentals(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, bank_account_id INTEGER, monthly_rent REAL, start_date TEXT, end_date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS salaries(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, pay_date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS expenses(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
+    )""")
+    # 早期版本的库缺这些列
+    for table in ("workers", "bank_accounts", "card_rentals", "salaries", "expenses"):
+        ensure_column(c, table, "status", "INTEGER DEFAULT 1")
+    ensure_column(c, "bank_accounts", "card_company", "TEXT DEFAULT ''")
+    if c.execute("SELECT COUNT(*) n FROM users").fetchone()["n"] == 0:
+        c.execute("INSERT INTO users(username, password_hash, is_admin) VALUES(?,?,1)",
+                  (ADMIN_USERNAME, generate_password_hash(ADMIN_PASSWORD)))
+
+# (版本, 名称, 步骤)；只能在末尾追加，已发布的步骤不要改
+def _m8_jobs(c):
+    # 后台任务：id 为随机 hex（下载链接不可猜）；pid 记录执行进程，重启后用来判断任务是否已中断
+    c.execute("""CREATE TABLE IF NOT EXISTS jobs(
+        id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT, status TEXT NOT NULL DEFAULT 'queued',
+        progress INTEGER DEFAULT 0, total INTEGER, message TEXT, result TEXT, file TEXT,
+        owner TEXT, pid INTEGER, created_at TEXT, started_at TEXT, finished_at TEXT
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_jobs_created_at ON jobs(created_at)")
+
+MONEY_COLUMNS = {"workers": ("commission", "expenses"), "card_rentals": ("monthly_rent",),
+                 "salaries": ("amount",), "expenses": ("amount",)}
+
+def _rebuild_money_table(c, t):
+    # SQLite 改不了列类型：按 PRAGMA table_info 建新表（金额列改 CENTS INTEGER），元 * 100 拷过去再换名；
+    # id 原样保留（FTS rowid、外键引用不变），AUTOINCREMENT 序号取旧值，已删除的 id 不会被复用
+    cols = list(c.execute(f"PRAGMA table_info({t})"))
+    if all(r["type"] == "CENTS INTEGER" for r in cols if r["name"] in MONEY_COLUMNS[t]): return
+    decl, src = [], []
+    for r in cols:
+        name = r["name"]
+        if r["pk"]: decl.append(f"{name} INTEGER PRIMARY KEY AUTOINCREMENT"); src.append(name)
+        elif name in MONEY_COLUMNS[t]:
+            decl.append(f"{name} CENTS INTEGER" + (" DEFAULT 0" if r["dflt_value"] is not None else ""))
+            src.append(f"CAST(ROUND({name} * 100) AS INTEGER)")
+        else:
+            decl.append(f"{name} {r['type']}" + (" NOT NULL" if r["notnull"] else "") +
+                        (f" DEFAULT {r['dflt_value']}" if r["dflt_value"] is not None else ""))
+            src.append(name)
+    seq = c.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (t,)).fetchone()
+    names = ", ".join(r["name"] for r in cols)
+    c.execute(f"CREATE TABLE {t}__cents({', '.join(decl)})")
+    c.execute(f"INSERT INTO {t}__cents({names}) SELECT {', '.join(src)} FROM {t}")
+    c.execute(f"DROP TABLE {t}")  # 连带删掉表上的索引和触发器，下面统一重建
+    c.execute(f"ALTER TABLE {t}__cents RENAME TO {t}")
+    if seq: c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name=?", (seq["seq"], t))
+
+def _m9_cents(c):
+    for t in MONEY_COLUMNS: _rebuild_money_table(c, t)
+    # 汇总表同样改成整数分，从明细重算
+    c.execute("DROP TABLE IF EXISTS ledger_totals"); c.execute("DROP TABLE IF EXISTS monthly_totals")
+    for step in (ensure_totals, ensure_monthly, ensure_indexes, ensure_fts, ensure_versions): step(c)
+    c.execute(f"UPDATE table_versions SET version = version + 1 WHERE tbl IN ({', '.join('?' * len(MONEY_COLUMNS))})", tuple(MONEY_COLUMNS))
+
+DATE_COLUMNS = {"card_rentals": ("start_date", "end_date"), "salaries": ("pay_date",), "expenses": ("date",)}
+
+def _m10_dates(c):
+    # 旧数据里的 '2024/3/5'、NULL 等规整成 'YYYY-MM-DD' / ''；已是标准格式的行 GLOB 直接跳过
+    todo = [(t, col, norm_date, "") for t, cols in DATE_COLUMNS.items() for col in cols]
+    todo += [(t, "created_at", norm_timestamp, "T*") for t in ("workers", "bank_accounts", "card_rentals", "salaries", "expenses")]
+    bad = 0
+    for t, col, fn, tail in todo:
+        if fn is norm_date: c.execute(f"UPDATE {t} SET {col} = '' WHERE {col} IS NULL")
+        rows = c.execute(f"SELECT id, {col} v FROM {t} WHERE IFNULL({col}, '') <> '' AND {col} NOT GLOB ?",
+                         ("[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]" + tail,)).fetchall()
+        fixed = []
+        for r in rows:
+            try: fixed.append((fn(str(r["v"])), r["id"]))
+            except ValueError: bad += 1
+        c.executemany(f"UPDATE {t} SET {col} = ? WHERE id = ?", fixed)
+    c.execute("DELETE FROM monthly_totals WHERE n = 0")  # 旧写法的月份键已被扣成空行
+    if bad: print(f"WARNING: {bad} date values could not be parsed and were left unchanged")
+
+def _m11_archive(c):
+    # 已归档月份的汇总（明细在 ARCHIVE_DIR 的按年库里）；Dashboard 与 /api/summary 把它和热表汇总相加
+    c.execute("""CREATE TABLE IF NOT EXISTS archive_totals(
+        ledger TEXT, month TEXT, n INTEGER DEFAULT 0, total CENTS INTEGER DEFAULT 0, n_active INTEGER DEFAULT 0, total_active CENTS INTEGER DEFAULT 0,
+        archived_at TEXT, PRIMARY KEY(ledger, month)
+    ) WITHOUT ROWID""")
+
+def _m12_balances(c):
+    ensure_balances(c); ensure_indexes(c)
+    # 已有归档文件里的记录计入 archive 部分（迁移在事务里，不能 ATTACH，另开只读连接读汇总）
+    for year in archive_years():
+        a = sqlite3.connect(f"file:{archive_path(year)}?mode=ro", uri=True)
+        try:
+            for t in BALANCE_LEDGERS:
+                amt = _amount(t, t)
+                rows = a.execute(f"""SELECT IFNULL(worker_id, 0), COUNT(*), SUM({amt}), SUM(status IS 1), SUM({amt} * (status IS 1))
+                                     FROM {t} GROUP BY 1""").fetchall()
+                c.executemany(f"""INSERT INTO worker_balances(worker_id, ledger, part, n, total, n_active, total_active) VALUES(?, '{t}', 'archive', ?, ?, ?, ?)
+                                  ON CONFLICT(worker_id, ledger, part) DO UPDATE SET n = n + excluded.n, total = total + excluded.total,
+                                  n_active = n_active + excluded.n_active, total_active = total_active + excluded.total_active""", rows)
+        finally: a.close()
+
+MIGRATIONS = [
+    (1, "base tables", _m1_base),
+    (2, "ledger_totals", ensure_totals),
+    (3, "monthly_totals", ensure_monthly),
+    (4, "secondary indexes", ensure_indexes),
+    (5, "full-text search", ensure_fts),
+    (6, "table versions", ensure_versions),
+    (7, "ledger table versions", ensure_versions),
+    (8, "background jobs", _m8_jobs),
+    (9, "integer cents", _m9_cents),
+    (10, "iso dates", _m10_dates),
+    (11, "month archives", _m11_archive),
+    (12, "worker balances", _m12_balances),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(c):
+    try: return c.execute("SELECT MAX(version) v FROM schema_version").fetchone()["v"] or 0
+    except sqlite3.OperationalError: return 0
+
+@contextmanager
+def _migrate_lock():
+    # 多个 gunicorn worker 同时启动时只让一个执行迁移，其余等待后走快速路径
+    if fcntl is None: yield; return
+    with open(APP_DB + ".migrate.lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(fh, fcntl.LOCK_UN)
 
 def init_db():
-    with conn() as c:
-        cur = c.cursor()
-        cur.execute("""CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password_hash TEXT, is_admin INTEGER DEFAULT 1
-        )""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS workers(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, company TEXT, commission REAL DEFAULT 0.0, expenses REAL DEFAULT 0.0, status INTEGER DEFAULT 1, created_at TEXT
-        )""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS bank_accounts(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, bank_name TEXT, account_no TEXT, holder TEXT, status INTEGER DEFAULT 1, created_at TEXT, card_company TEXT
-        )""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS card_rentals(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, bank_account_id INTEGER, monthly_rent REAL, start_date TEXT, end_date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
-        )""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS salaries(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, pay_date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
-        )""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS expenses(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, date TEXT, note TEXT, status INTEGER DEFAULT 1, created_at TEXT
-        )""")
-        ensure_column(c, "workers", "status", "INTEGER DEFAULT 1", 1)
-        ensure_column(c, "bank_accounts", "status", "INTEGER DEFAULT 1", 1)
-        ensure_column(c, "bank_accounts", "card_company", "TEXT", "")
-        ensure_column(c, "card_rentals", "status", "INTEGER DEFAULT 1", 1)
-        ensure_column(c, "salaries", "status", "INTEGER DEFAULT 1", 1)
-        ensure_column(c, "expenses", "status", "INTEGER DEFAULT 1", 1)
-        cur.execute("SELECT COUNT(*) n FROM users")
-        if cur.fetchone()["n"] == 0:
-            cur.execute("INSERT INTO users(username, password_hash, is_admin) VALUES(?,?,1)",
-                        (ADMIN_USERNAME, generate_password_hash(ADMIN_PASSWORD)))
-        c.commit()
+    c = conn()
+    if schema_version(c) >= SCHEMA_VERSION: return False
+    with _migrate_lock():
+        c.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)")
+        current = schema_version(c)
+        for version, name, step in MIGRATIONS:
+            if version <= current: continue
+            t0 = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                step(c)
+                c.execute("INSERT INTO schema_version(version, name, applied_at) VALUES(?,?,?)",
+                          (version, name, datetime.utcnow().isoformat()))
+                c.commit()
+            except Exception:
+                c.rollback(); raise
+            print(f"Schema migrated to v{version} ({name}) in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    check_query_plans(c)
+    return True
+
+@app.cli.command("migrate")
+def migrate_cmd():
+    """执行未完成的结构迁移并打印当前版本。"""
+    init_db()
+    print(f"schema_version = {schema_version(conn())}")
 
 @app.before_request
 def _ctx():
@@ -728,6 +1791,487 @@ def _ctx():
 def _inject():
     return {"t": T(), "lang": get_lang()}
 
+# ----------------------- 观测：请求 / SQL / 模板计时 -----------------------
+# 每个请求在 g._obs 里记账：SQL（逐条语句的次数 / 耗时 / 行数）、写队列等待、模板渲染、响应大小；
+# 请求结束时汇总进进程内的 Prometheus 直方图（/metrics），超过 SLOW_REQUEST_MS 打印慢请求日志。
+# 指标按 worker 进程各自累计，多进程部署时每次抓取看到的是应答的那个进程。
+def _obs_current():
+    return g.get("_obs") if has_app_context() else None
+
+class _TimedCursor(sqlite3.Cursor):
+    # 请求外（写线程、CLI、启动迁移）没有 g._obs，不记录
+    _stmt = None
+
+    def execute(self, sql, params=()): return self._run(super().execute, sql, params)
+    def executemany(self, sql, seq): return self._run(super().executemany, sql, seq)
+
+    def _run(self, fn, sql, arg):
+        obs = _obs_current()
+        if obs is None:
+            self._stmt = None; return fn(sql, arg)
+        t0 = time.perf_counter()
+        try: return fn(sql, arg)
+        finally:
+            st = self._stmt = obs["sql"].setdefault(sql, [0, 0.0, 0])
+            st[0] += 1; st[1] += time.perf_counter() - t0; st[2] += max(self.rowcount, 0)
+
+    def _fetch(self, fn, *a, one=False):
+        st = self._stmt
+        if st is None: return fn(*a)
+        t0 = time.perf_counter(); rows = fn(*a)
+        st[1] += time.perf_counter() - t0
+        st[2] += (rows is not None) if one else len(rows)
+        return rows
+
+    def fetchone(self): return self._fetch(super().fetchone, one=True)
+    def fetchmany(self, size=None): return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+    def fetchall(self): return self._fetch(super().fetchall)
+
+    def __next__(self):
+        st = self._stmt
+        if st is None: return super().__next__()
+        t0 = time.perf_counter()
+        try: return super().__next__()
+        finally: st[1] += time.perf_counter() - t0; st[2] += 1
+
+class _TimedConnection(sqlite3.Connection):
+    # Connection.execute 是 C 层快捷方式，不走 cursor()，这里显式改道
+    def cursor(self, factory=_TimedCursor): return super().cursor(factory)
+    def execute(self, sql, params=()): return self.cursor().execute(sql, params)
+    def executemany(self, sql, seq): return self.cursor().executemany(sql, seq)
+
+class _Metric:
+    # 极简 Prometheus 指标：counter 或 histogram，标签值为元组
+    def __init__(self, name, kind, help, labels, buckets=None):
+        self.name, self.kind, self.help, self.labels, self.buckets = name, kind, help, labels, buckets
+        self.series = {}
+
+    def observe(self, v, *lv):
+        s = self.series.get(lv)
+        if s is None: s = self.series[lv] = {"count": 0, "sum": 0.0, "b": [0] * len(self.buckets or ())}
+        s["count"] += 1; s["sum"] += v
+        for i, le in enumerate(self.buckets or ()):
+            if v <= le: s["b"][i] += 1
+
+    def _labels(self, lv, le=None):
+        esc = lambda v: str(v).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+        pairs = [f'{k}="{esc(v)}"' for k, v in zip(self.labels, lv)]
+        if le is not None: pairs.append(f'le="{le}"')
+        return "{" + ",".join(pairs) + "}"
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for lv, s in sorted(self.series.items()):
+            if self.kind == "counter":
+                out.append(f"{self.name}{self._labels(lv)} {s['sum']:g}"); continue
+            for le, n in zip(self.buckets, s["b"]):
+                out.append(f"{self.name}_bucket{self._labels(lv, f'{le:g}')} {n}")
+            out += [f"{self.name}_bucket{self._labels(lv, '+Inf')} {s['count']}",
+                    f"{self.name}_sum{self._labels(lv)} {s['sum']:.6f}", f"{self.name}_count{self._labels(lv)} {s['count']}"]
+        return out
+
+_LAT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+_metrics_lock = threading.Lock()
+METRICS = {m.name: m for m in (
+    _Metric("http_requests_total", "counter", "Requests by route and status", ("method", "route", "status")),
+    _Metric("http_request_duration_seconds", "histogram", "Request latency including streaming", ("method", "route"), _LAT_BUCKETS),
+    _Metric("http_response_size_bytes", "histogram", "Response body size", ("route",), (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)),
+    _Metric("db_query_seconds", "histogram", "SQL time per request (pooled read connection)", ("route",), _LAT_BUCKETS),
+    _Metric("db_statements_total", "counter", "SQL statements executed", ("route",)),
+    _Metric("db_write_wait_seconds", "histogram", "Time spent waiting on the write queue per request", ("route",), _LAT_BUCKETS),
+    _Metric("template_render_seconds", "histogram", "Template render time", ("template",), _LAT_BUCKETS),
+)}
+
+class _Sampler:
+    """采样分析器：后台线程每 PROFILE_INTERVAL_MS 抓一次正在处理请求的线程调用栈，按折叠格式累计。"""
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self._active, self._pid = {}, None
+
+    def watch(self, obs):
+        if self._pid != os.getpid():  # fork 后在 worker 里重新起线程
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="profiler", daemon=True).start()
+        obs["stacks"] = {}
+        self._active[obs["tid"]] = obs
+
+    def unwatch(self, obs): self._active.pop(obs["tid"], None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for tid, obs in list(self._active.items()):
+                f = frames.get(tid)
+                if f is None: continue
+                stack = []
+                while f is not None:
+                    stack.append(f"{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_name}"); f = f.f_back
+                key = ";".join(reversed(stack))
+                obs["stacks"][key] = obs["stacks"].get(key, 0) + 1
+
+    @staticmethod
+    def dump(obs, ms):
+        # 输出 flamegraph.pl / speedscope 可直接读取的 folded stacks
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", obs["route"]).strip("_") or "root"
+        path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{obs['method']}-{slug}-{ms:.0f}ms-{os.getpid()}.folded")
+        with open(path, "w") as fh:
+            fh.writelines(f"{k} {n}\n" for k, n in sorted(obs["stacks"].items()))
+        return path
+
+_sampler = _Sampler(PROFILE_INTERVAL_MS)
+
+@app.before_request
+def _obs_start():
+    if not METRICS_ENABLED: return
+    g._obs = obs = {"t0": time.perf_counter(), "method": request.method, "path": request.full_path.rstrip("?"),
+                    "route": request.url_rule.rule if request.url_rule else "<unmatched>", "tid": threading.get_ident(),
+                    "sql": {}, "write_s": 0.0, "write_n": 0, "tpl": [], "tpl_depth": 0, "status": 500, "bytes": 0}
+    if PROFILE_SLOW_MS > 0: _sampler.watch(obs)
+
+def _obs_sql_totals(obs):
+    return sum(s[0] for s in obs["sql"].values()), sum(s[1] for s in obs["sql"].values())
+
+@app.after_request
+def _obs_end(resp):
+    obs = g.get("_obs")
+    if obs is None: return resp
+    obs["status"] = resp.status_code
+    if resp.is_streamed and resp.content_length is None:
+        # 流式响应（CSV 导出）：数据发完才算结束，在包装的迭代器里收尾
+        obs["streamed"] = True
+        resp.response = _obs_counted(resp.response, obs)
+        return resp
+    obs["bytes"] = resp.content_length or 0
+    n, sql_s = _obs_sql_totals(obs)
+    resp.headers["Server-Timing"] = (f"db;dur={sql_s * 1000:.1f};desc=\"{n} queries\", write;dur={obs['write_s'] * 1000:.1f}, "
+                                     f"tpl;dur={sum(t for _, t in obs['tpl']) * 1000:.1f}, app;dur={(time.perf_counter() - obs['t0']) * 1000:.1f}")
+    return resp
+
+def _obs_counted(body, obs):
+    try:
+        for chunk in body:
+            obs["bytes"] += len(chunk); yield chunk
+    finally:
+        if hasattr(body, "close"): body.close()
+        _obs_finish(obs)
+
+@app.teardown_request
+def _obs_teardown(exc):
+    obs = g.get("_obs")
+    if obs is not None and not obs.get("streamed"): _obs_finish(obs)
+
+def _obs_finish(obs):
+    if obs.get("done"): return
+    obs["done"] = True
+    secs = time.perf_counter() - obs["t0"]; ms = secs * 1000
+    if obs.get("stacks") is not None: _sampler.unwatch(obs)
+    n, sql_s = _obs_sql_totals(obs)
+    route, m = obs["route"], METRICS
+    with _metrics_lock:
+        m["http_requests_total"].observe(1, obs["method"], route, obs["status"])
+        m["http_request_duration_seconds"].observe(secs, obs["method"], route)
+        m["http_response_size_bytes"].observe(obs["bytes"], route)
+        m["db_query_seconds"].observe(sql_s, route)
+        m["db_statements_total"].observe(n, route)
+        if obs["write_n"]: m["db_write_wait_seconds"].observe(obs["write_s"], route)
+        for name, t in obs["tpl"]: m["template_render_seconds"].observe(t, name)
+    if SLOW_REQUEST_MS and ms >= SLOW_REQUEST_MS:
+        lines = [f"Slow request: {obs['method']} {obs['path']} {obs['status']} {ms:.0f} ms | sql {sql_s * 1000:.0f} ms / {n} stmts"
+                 f" | write {obs['write_s'] * 1000:.0f} ms / {obs['write_n']} | tpl {sum(t for _, t in obs['tpl']) * 1000:.0f} ms | {obs['bytes']} bytes"]
+        for sql, (cnt, t, rows) in sorted(obs["sql"].items(), key=lambda kv: -kv[1][1])[:5]:
+            lines.append(f"    {t * 1000:8.1f} ms  x{cnt:<4} rows={rows:<7} {' '.join(sql.split())[:160]}")
+        print("\n".join(lines), flush=True)
+    if obs.get("stacks") and ms >= PROFILE_SLOW_MS:
+        try: print(f"Profile written: {_sampler.dump(obs, ms)}", flush=True)
+        except OSError as e: print("Profile dump error:", e)
+
+def _tpl_start(sender, template, context, **kw):
+    obs = _obs_current()
+    if obs is not None:
+        obs["tpl_depth"] += 1; obs.setdefault("tpl_t0", []).append(time.perf_counter())
+
+def _tpl_done(sender, template, context, **kw):
+    obs = _obs_current()
+    if obs is not None and obs.get("tpl_t0"):
+        obs["tpl_depth"] -= 1
+        t = time.perf_counter() - obs["tpl_t0"].pop()
+        if obs["tpl_depth"] == 0: obs["tpl"].append((template.name or "<string>", t))
+
+before_render_template.connect(_tpl_start, app)
+template_rendered.connect(_tpl_done, app)
+
+@app.get("/metrics")
+def metrics():
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}": abort(401)
+    elif require_login(): return require_login()
+    with _metrics_lock: lines = [l for mt in METRICS.values() for l in mt.render()]
+    pool, writer = _pool.snapshot(), _writer.snapshot()
+    for k in ("open", "in_use", "idle", "waits", "checkouts"):
+        lines += [f"# TYPE db_pool_{k} gauge", f"db_pool_{k} {pool[k]}"]
+    for k in ("jobs", "commits", "errors", "queued"):
+        if k in writer: lines += [f"# TYPE db_writer_{k} gauge", f"db_writer_{k} {writer[k]}"]
+    for k, v in _pages.stats.items():
+        lines += [f"# TYPE page_cache_{k}_total counter", f"page_cache_{k}_total {v}"]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# ----------------------- 游标分页 -----------------------
+def _page_url(**kw):
+    args = {k: v for k, v in request.args.items() if k not in ("after", "before", "partial")}
+    return url_for(request.endpoint, **(request.view_args or {}), **args, **kw)
+
+def keyset_page(c, select_sql, id_col, where=(), params=()):
+    # 按 id 倒序的 keyset 分页：?after=<id> 取更旧一页，?before=<id> 取更新一页；每页代价与表大小无关
+    size = max(1, min(request.args.get("size", type=int) or PAGE_SIZE, PAGE_SIZE_MAX))
+    after, before = request.args.get("after", type=int), request.args.get("before", type=int)
+    conds, args = list(where), list(params)
+    if before is not None: conds.append(f"{id_col} > ?"); args.append(before); order = "ASC"
+    else:
+        order = "DESC"
+        if after is not None: conds.append(f"{id_col} < ?"); args.append(after)
+    sql = select_sql + (" WHERE " + " AND ".join(conds) if conds else "") + f" ORDER BY {id_col} {order} LIMIT ?"
+    rows = c.execute(sql, args + [size + 1]).fetchall()
+    more = len(rows) > size; rows = rows[:size]
+    if order == "ASC": rows.reverse()
+    has_next = more if before is None else True
+    has_prev = more if before is not None else after is not None
+    return {
+        "rows": rows, "size": size,
+        "next_url": _page_url(after=rows[-1]["id"]) if rows and has_next else None,
+        "prev_url": (_page_url(before=rows[0]["id"]) if rows else _page_url(before=after if after is not None else 0)) if has_prev else None,
+        "first_url": _page_url(),
+    }
+
+# ----------------------- 参考数据缓存 -----------------------
+# 工人下拉框、列表页的工人名 / 银行账户字段都从进程内缓存取，不再每次查表或 JOIN。
+# 每个请求最多读一次 table_versions（每张表一行），版本号变了才重新加载；
+# 本进程的增删改处理函数写完后直接 invalidate，其他 worker 进程靠版本号发现变化。
+REF_LOADERS = {
+    "workers":       "SELECT id, name, company, status FROM workers ORDER BY id DESC",
+    "bank_accounts": "SELECT id, bank_name, account_no, card_company, status FROM bank_accounts ORDER BY id DESC",
+}
+
+def table_versions(c):
+    # {表: (version, changed_at)}，同一请求内只查一次
+    memo = g.get("_table_versions") if has_app_context() else None
+    if memo is None:
+        memo = {r["tbl"]: (r["version"], r["changed_at"]) for r in c.execute("SELECT tbl, version, changed_at FROM table_versions")}
+        if has_app_context(): g._table_versions = memo
+    return memo
+
+class RefCache:
+    def __init__(self, loaders):
+        self.loaders = loaders
+        self._data, self._lock = {}, threading.Lock()
+
+    def get(self, c, table):
+        v = table_versions(c).get(table, (None, None))[0]
+        hit = self._data.get(table)
+        if hit and hit["version"] == v: return hit
+        rows = c.execute(self.loaders[table]).fetchall()
+        hit = {"version": v, "rows": rows, "by_id": {r["id"]: r for r in rows}}
+        with self._lock: self._data[table] = hit
+        return hit
+
+    def peek(self, c, table):
+        # 只在缓存版本与库里一致时返回，不触发重新加载（写线程里用，避免每次新建后整表重读）
+        hit = self._data.get(table)
+        return hit if hit and hit["version"] == table_versions(c).get(table, (None, None))[0] else None
+
+    @staticmethod
+    def index(hit, cols):
+        # 按任意列组合建的二级索引，随缓存条目一起失效
+        idx = hit.get(cols)
+        if idx is None: idx = hit[cols] = {tuple(r[k] for k in cols): r for r in hit["rows"]}
+        return idx
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for t in tables: self._data.pop(t, None)
+        if has_app_context(): g.pop("_table_versions", None)
+
+_refs = RefCache(REF_LOADERS)
+
+def ref_rows(c, table): return _refs.get(c, table)["rows"]
+
+def with_ref(rows, c, table, fk, **fields):
+    # 相当于 LEFT JOIN：rows 转成 dict，按外键 fk 从缓存补上 fields（新列名=缓存列名），找不到为 None
+    by_id = _refs.get(c, table)["by_id"]
+    out = []
+    for r in rows:
+        ref = by_id.get(r[fk])
+        out.append({**dict(r), **{k: ref[col] if ref else None for k, col in fields.items()}})
+    return out
+
+# ----------------------- 页面缓存（条件 GET） -----------------------
+# 列表页、编辑 / 新增 partial 的 ETag 由 (页面, 参数, 语言, 用户, 相关表版本号, 代码版本) 算出：
+# 浏览器带 If-None-Match 且没变化直接 304，不查库不渲染；否则先查进程内 LRU，再不行才真正渲染。
+# 有待显示的 flash 消息时不走缓存（消息只能显示一次）。
+_PAGE_BUILD = hashlib.sha1(open(__file__, "rb").read()).hexdigest()[:12]  # 部署新代码 / 模板后旧 ETag 全部失效
+
+class PageCache:
+    def __init__(self, size):
+        self.size, self._lock = size, threading.Lock()
+        self._items = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None: self._items.move_to_end(key)
+            self.stats["hits" if body is not None else "misses"] += 1
+            return body
+
+    def put(self, key, body):
+        if self.size <= 0: return
+        with self._lock:
+            self._items[key] = body; self._items.move_to_end(key)
+            while len(self._items) > self.size: self._items.popitem(last=False)
+
+_pages = PageCache(PAGE_CACHE_SIZE)
+
+def cached_view(*tables, key=None):
+    # key：可选，返回额外参与 ETag 的值（如按当天日期推出的默认时间窗口，跨月后自动失效）
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kw):
+            if require_login(): return require_login()
+            if session.get("_flashes"): return fn(*args, **kw)
+            vers = table_versions(conn())
+            sig = repr((_PAGE_BUILD, request.endpoint, sorted(request.view_args.items()), request.query_string,
+                        get_lang(), session.get("user_id"), [vers.get(t) for t in tables], key() if key else None))
+            etag = hashlib.sha1(sig.encode()).hexdigest()
+            if etag in request.if_none_match:
+                with _pages._lock: _pages.stats["not_modified"] += 1
+                resp = Response(status=304)
+            else:
+                body = _pages.get(etag)
+                if body is None:
+                    rv = fn(*args, **kw)
+                    if not isinstance(rv, str): return rv  # 重定向等不缓存
+                    body = rv.encode("utf-8"); _pages.put(etag, body)
+                resp = Response(body, mimetype="text/html")
+            resp.set_etag(etag)
+            changed = [vers[t][1] for t in tables if t in vers and vers[t][1]]
+            if changed: resp.last_modified = datetime.fromisoformat(max(changed)).replace(microsecond=0)
+            resp.cache_control.private = True; resp.cache_control.no_cache = True
+            return resp.make_conditional(request) if resp.status_code == 200 else resp
+        return wrapper
+    return deco
+
+def fragment_key(*tables):
+    # 弹窗表单在浏览器端片段缓存的键（base.html 里的 data-cache）：代码版本 + 语言 + 用户 + 相关表版本号。
+    # 只能用所在列表页 cached_view 覆盖的表，否则页面 304 / 命中 LRU 时带出去的是旧键。
+    # 模板预热时不查库（_bootstrap 之后 master 里不能留连接），返回固定键
+    if not has_request_context() or g.get("_warmup"): return _PAGE_BUILD
+    vers = table_versions(conn())
+    key = repr((_PAGE_BUILD, get_lang(), session.get("user_id"), [vers.get(t) for t in tables]))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+app.jinja_env.globals["fragment_key"] = fragment_key
+
+# ----------------------- 列表筛选 / 搜索 -----------------------
+# alias: 列表 SQL 里主表的别名；date: (开始列, 结束列)；bank: 银行名列；search: [(FTS 表, 关联 id 表达式)]
+LIST_FILTERS = {
+    "workers":       {"alias": "workers", "search": [("workers", "workers.id")]},
+    "bank_accounts": {"alias": "bank_accounts", "bank": "bank_accounts.bank_name", "search": [("bank_accounts", "bank_accounts.id")]},
+    "card_rentals":  {"alias": "cr", "date": ("start_date", "end_date"),
+                      "bank": "(SELECT bank_name FROM bank_accounts WHERE id = cr.bank_account_id)",
+                      "search": [("card_rentals", "cr.id"), ("bank_accounts", "cr.bank_account_id")]},
+    "salaries":      {"alias": "s", "date": ("pay_date", None), "worker": "s.worker_id",
+                      "search": [("salaries", "s.id"), ("workers", "s.worker_id")]},
+    "expenses":      {"alias": "e", "date": ("date", None), "worker": "e.worker_id",
+                      "search": [("expenses", "e.id"), ("workers", "e.worker_id")]},
+}
+_fts_ready = {}
+
+def _has_fts(c, table):
+    if table not in _fts_ready:
+        _fts_ready[table] = c.execute("SELECT 1 FROM sqlite_master WHERE name=?", (table + "_fts",)).fetchone() is not None
+    return _fts_ready[table]
+
+def _search_clause(c, spec, term):
+    # 一个搜索词：任一关联表命中即可。>=3 字走 FTS5 trigram，更短的词 trigram 无法匹配，退回 LIKE
+    ors, params = [], []
+    for table, id_expr in spec["search"]:
+        if len(term) >= 3 and _has_fts(c, table):
+            ors.append(f"{id_expr} IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)")
+            params.append('"' + term.replace('"', '""') + '"')
+        else:
+            like = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            cols = FTS_TABLES[table]
+            ors.append(f"{id_expr} IN (SELECT id FROM {table} WHERE " + " OR ".join(f"{x} LIKE ? ESCAPE '\\'" for x in cols) + ")")
+            params.extend([like] * len(cols))
+    return "(" + " OR ".join(ors) + ")", params
+
+def list_filters(c, table):
+    spec, a = LIST_FILTERS[table], request.args
+    alias, where, params = spec["alias"], [], []
+    if a.get("status") in ("0", "1"):
+        where.append(f"{alias}.status = ?"); params.append(int(a["status"]))
+    if spec.get("worker") and a.get("worker", type=int):
+        where.append(f"{spec['worker']} = ?"); params.append(a.get("worker", type=int))
+    if spec.get("bank") and a.get("bank", "").strip():
+        where.append(f"{spec['bank']} = ?"); params.append(a["bank"].strip())
+    if spec.get("date"):
+        start, end = spec["date"]
+        frm, to = (v if re.fullmatch(r"\d{4}-\d{2}-\d{2}", v or "") else None for v in (a.get("from"), a.get("to")))
+        if frm:
+            where.append(f"(IFNULL({alias}.{end}, '') = '' OR {alias}.{end} >= ?)" if end else f"{alias}.{start} >= ?"); params.append(frm)
+        if to: where.append(f"{alias}.{start} <= ?"); params.append(to)
+    for term in a.get("q", "").split()[:8]:
+        cond, p = _search_clause(c, spec, term); where.append(cond); params.extend(p)
+    return where, params
+
+def filter_form(c, table):
+    spec = LIST_FILTERS[table]
+    return {"worker": bool(spec.get("worker")), "bank": bool(spec.get("bank")), "date": bool(spec.get("date")),
+            "workers": ref_rows(c, "workers") if spec.get("worker") else []}
+
+# ----------------------- CSV 流式导出 -----------------------
+class _CsvChunk:
+    # csv.writer 的写入目标：攒一批行，再整块取出编码后 yield
+    def __init__(self): self.parts = []
+    def write(self, s): self.parts.append(s)
+    def take(self):
+        out = "".join(self.parts).encode("utf-8"); self.parts.clear()
+        return out
+
+def csv_stream(filename, columns, sql, params=()):
+    # 表头立即发出，之后按 EXPORT_BATCH 行一块边读边写，内存占用与表大小无关
+    def generate():
+        buf = _CsvChunk(); w = csv.writer(buf)
+        w.writerow(columns); yield buf.take()
+        cur = conn().execute(sql, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows: break
+            w.writerows([r[k] for k in columns] for r in rows)
+            yield buf.take()
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+# 表 -> (列, SQL)；同步下载与后台导出任务共用
+EXPORT_SPECS = {
+    "workers":       (["id","name","company","commission","expenses","status","created_at"],
+                      "SELECT * FROM workers ORDER BY id DESC"),
+    "bank_accounts": (["id","bank_name","account_no","holder","card_company","status","created_at"],
+                      "SELECT * FROM bank_accounts ORDER BY id DESC"),
+    "card_rentals":  (["id","bank_account_id","monthly_rent","start_date","end_date","note","status","created_at"],
+                      "SELECT * FROM card_rentals ORDER BY id DESC"),
+    "salaries":      (["id","worker_id","amount","pay_date","note","status","created_at"],
+                      "SELECT * FROM salaries ORDER BY id DESC"),
+    "expenses":      (["id","worker_id","amount","date","note","status","created_at"],
+                      "SELECT * FROM expenses ORDER BY id DESC"),
+}
+
+def export_response(table):
+    # GET 只做流式下载；后台导出会建任务，走 POST /jobs/export/<表>（防预取 / 爬虫 / 链接预览误触发）
+    columns, sql = EXPORT_SPECS[table]
+    return csv_stream(f"{table}.csv", columns, sql)
+
 # ----------------------- 鉴权 -----------------------
 def require_login():
     if not session.get("user_id"):
@@ -756,12 +2300,57 @@ def logout(): session.clear(); return redirect(url_for("login"))
 @app.get("/")
 def dashboard():
     if require_login(): return require_login()
-    with conn() as c:
-        total_workers = c.execute("SELECT COUNT(*) n FROM workers").fetchone()["n"]
-        total_rentals = c.execute("SELECT IFNULL(SUM(monthly_rent),0) s FROM card_rentals").fetchone()["s"]
-        total_salaries = c.execute("SELECT IFNULL(SUM(amount),0) s FROM salaries").fetchone()["s"]
-        total_expenses = c.execute("SELECT IFNULL(SUM(amount),0) s FROM expenses").fetchone()["s"]
-    return render_template("dashboard.html", total_workers=total_workers,total_rentals=total_rentals,total_salaries=total_salaries,total_expenses=total_expenses)
+    active_only = request.args.get("active") == "1"
+    n_col, s_col = ("n_active", "total_active") if active_only else ("n", "total")
+    month = datetime.utcnow().strftime("%Y-%m")
+    # 热表汇总 + 已归档月份的汇总
+    tot = {r["ledger"]: r for r in conn().execute(f"""
+        SELECT ledger, SUM({n_col}) n, SUM({s_col}) s FROM (
+            SELECT ledger, {n_col}, {s_col} FROM ledger_totals UNION ALL SELECT ledger, {n_col}, {s_col} FROM archive_totals
+        ) GROUP BY ledger""")}
+    val = lambda ledger, col: tot[ledger][col] or 0 if ledger in tot else 0
+    return render_template("dashboard.html", active_only=active_only,
+                           total_workers=val("workers", "n"), total_rentals=val("card_rentals", "s"),
+                           total_salaries=val("salaries", "s"), total_expenses=val("expenses", "s"),
+                           accrued_this_month=_accruals.months(conn(), [month], "daily")[month][1])
+
+def _month_seq(frm, to):
+    y, m = map(int, frm.split("-")); out = []
+    while f"{y:04d}-{m:02d}" <= to and len(out) < 240:
+        out.append(f"{y:04d}-{m:02d}"); y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+def month_window():
+    # ?from=YYYY-MM&to=YYYY-MM，默认最近 12 个月（含当月）
+    now = datetime.utcnow()
+    y, m = (now.year, now.month + 1) if now.month < 12 else (now.year + 1, 1)
+    to = request.args.get("to") or now.strftime("%Y-%m")
+    frm = request.args.get("from") or f"{y - 1:04d}-{m:02d}"
+    if not all(re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", v) for v in (frm, to)) or frm > to: abort(400)
+    return frm, to
+
+@app.get("/api/summary")
+def api_summary():
+    # static/dashboard.js 使用：按月的租金 / 工资 / 开销；?from=YYYY-MM&to=YYYY-MM（默认最近 12 个月），?active=1 只算启用记录
+    if require_login(): return require_login()
+    col = "total_active" if request.args.get("active") == "1" else "total"
+    months = _month_seq(*month_window())
+    data = {t: dict.fromkeys(months, 0) for t in MONTH_LEDGERS}
+    for r in conn().execute(f"""SELECT ledger, month, SUM(v) v FROM (
+            SELECT ledger, month, {col} v FROM monthly_totals WHERE month BETWEEN ?1 AND ?2
+            UNION ALL SELECT ledger, month, {col} FROM archive_totals WHERE month BETWEEN ?1 AND ?2
+        ) GROUP BY ledger, month""", (months[0], months[-1])):
+        data[r["ledger"]][r["month"]] = Money(r["v"] or 0).units()
+    resp = jsonify({"months": months, "rentals": list(data["card_rentals"].values()),
+                    "salaries": list(data["salaries"].values()), "expenses": list(data["expenses"].values())})
+    resp.cache_control.private = True; resp.cache_control.max_age = 60
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+@app.get("/api/db-pool")
+def api_db_pool():
+    if require_login(): return require_login()
+    return jsonify({**_pool.snapshot(), "profile": DB_PROFILE, "pragmas": db_pragmas(), "writer": _writer.snapshot()})
 
 # ----------------------- 账号安全（显式 endpoint，避免 BuildError） -----------------------
 @app.get("/account-security", endpoint="account_security")
@@ -769,15 +2358,80 @@ def account_security_page():
     if require_login(): return require_login()
     return render_template("account_security.html")
 
+# ----------------------- 启用 / 停用 / 删除（单条与批量） -----------------------
+# 一条 UPDATE/DELETE ... RETURNING 完成，不再先 SELECT 再写；并发点击也不会丢更新。
+# 批量操作的所有 id 在同一个写事务里完成（按 BULK_CHUNK 分批绑定参数）。
+STATUS_TABLES = ("workers", "bank_accounts", "card_rentals", "salaries", "expenses")
+BULK_CHUNK, BULK_MAX = 500, 10000
+
+def _chunks(ids):
+    for i in range(0, len(ids), BULK_CHUNK): yield ids[i:i + BULK_CHUNK]
+
+def _set_status_rows(c, table, ids, status=None):
+    # status 为 None 时逐行翻转，否则统一设为 0/1
+    expr = "CASE WHEN status = 1 THEN 0 ELSE 1 END" if status is None else "?"
+    out = []
+    for part in _chunks(ids):
+        args = ([] if status is None else [status]) + part
+        out += c.execute(f"UPDATE {table} SET status = {expr} WHERE id IN ({','.join('?' * len(part))}) RETURNING id, status", args).fetchall()
+    return out
+
+def _delete_rows(c, table, ids):
+    out = []
+    for part in _chunks(ids):
+        out += c.execute(f"DELETE FROM {table} WHERE id IN ({','.join('?' * len(part))}) RETURNING id", part).fetchall()
+    return out
+
+def set_status(table, ids, status=None):
+    rows = db_write(_set_status_rows, table, list(ids), status)
+    _refs.invalidate(table)
+    return rows
+
+def delete_ids(table, ids):
+    rows = db_write(_delete_rows, table, list(ids))
+    _refs.invalidate(table)
+    return rows
+
+def _bulk_ids():
+    # 支持多个 ids 字段，也支持逗号分隔（批量删除表单由前端同步成一个字段）
+    ids = []
+    for v in request.form.getlist("ids"):
+        ids += [int(x) for x in v.split(",") if x.strip().isdigit()]
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BULK_MAX: abort(400)
+    return ids
+
+def _bulk_done(table, action, rows):
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"table": table, action: len(rows), "rows": [dict(r) for r in rows]})
+    flash(f"{'已删除' if action == 'deleted' else '已更新'} {len(rows)} 条")
+    return redirect(url_for(table + "_list"))
+
+_BULK_LEDGERS = "any(" + ", ".join(f"'{t.replace('_', '-')}'" for t in STATUS_TABLES) + ")"
+
+@app.post(f"/<{_BULK_LEDGERS}:ledger>/bulk-toggle")
+def bulk_toggle(ledger):
+    if require_login(): return require_login()
+    table, status = ledger.replace("-", "_"), request.form.get("status")
+    return _bulk_done(table, "updated", set_status(table, _bulk_ids(), int(status) if status in ("0", "1") else None))
+
+@app.post(f"/<{_BULK_LEDGERS}:ledger>/bulk-delete")
+def bulk_delete(ledger):
+    if require_login(): return require_login()
+    table = ledger.replace("-", "_")
+    return _bulk_done(table, "deleted", delete_ids(table, _bulk_ids()))
+
 # ----------------------- 工人 / 平台 -----------------------
 @app.get("/workers")
+@cached_view("workers")
 def workers_list():
     if require_login(): return require_login()
-    with conn() as c:
-        rows = c.execute("SELECT * FROM workers ORDER BY id DESC").fetchall()
-    return render_template("workers_list.html", rows=rows)
+    c = conn(); where, params = list_filters(c, "workers")
+    page = keyset_page(c, "SELECT * FROM workers", "workers.id", where, params)
+    return render_template("workers_list.html", rows=page["rows"], page=page, filters=filter_form(c, "workers"))
 
 @app.get("/workers/add")
+@cached_view()
 def workers_add_form():
     if require_login(): return require_login()
     return render_template("partials/workers_form.html")
@@ -787,15 +2441,15 @@ def workers_add():
     if require_login(): return require_login()
     name = request.form.get("name","").strip()
     company = request.form.get("company","").strip()
-    commission = float(request.form.get("commission") or 0)
-    expenses = float(request.form.get("expenses") or 0)
-    with conn() as c:
-        c.execute("""INSERT INTO workers(name,company,commission,expenses,status,created_at) VALUES(?,?,?,?,1,?)""",
-                  (name, company, commission, expenses, datetime.utcnow().isoformat()))
-        c.commit()
+    commission = form_money("commission")
+    expenses = form_money("expenses")
+    db_write(lambda c: c.execute("""INSERT INTO workers(name,company,commission,expenses,status,created_at) VALUES(?,?,?,?,1,?)""",
+                                 (name, company, commission, expenses, datetime.utcnow().isoformat())))
+    _refs.invalidate("workers")
     return redirect(url_for("workers_list"))
 
 @app.get("/workers/<int:wid>/edit")
+@cached_view("workers")
 def workers_edit_form(wid):
     if require_login(): return require_login()
     with conn() as c:
@@ -810,49 +2464,41 @@ def workers_edit(wid):
     if require_login(): return require_login()
     name = request.form.get("name","").strip()
     company = request.form.get("company","").strip()
-    commission = float(request.form.get("commission") or 0)
-    expenses = float(request.form.get("expenses") or 0)
-    with conn() as c:
-        c.execute("""UPDATE workers SET name=?, company=?, commission=?, expenses=? WHERE id=?""",
-                  (name, company, commission, expenses, wid))
-        c.commit()
+    commission = form_money("commission")
+    expenses = form_money("expenses")
+    db_write(lambda c: c.execute("""UPDATE workers SET name=?, company=?, commission=?, expenses=? WHERE id=?""",
+                                 (name, company, commission, expenses, wid)))
+    _refs.invalidate("workers")
     return redirect(url_for("workers_list"))
 
 @app.post("/workers/<int:wid>/toggle")
 def workers_toggle(wid):
     if require_login(): return require_login()
-    with conn() as c:
-        cur = c.cursor(); cur.execute("SELECT status FROM workers WHERE id=?", (wid,)); row = cur.fetchone()
-        if not row: abort(404)
-        cur.execute("UPDATE workers SET status=? WHERE id=?", (0 if row['status']==1 else 1, wid)); c.commit()
+    if not set_status("workers", [wid]): abort(404)
     return redirect(url_for("workers_list"))
 
 @app.post("/workers/<int:wid>/delete")
 def workers_delete(wid):
     if require_login(): return require_login()
-    with conn() as c: c.execute("DELETE FROM workers WHERE id=?", (wid,)); c.commit()
+    delete_ids("workers", [wid])
     return redirect(url_for("workers_list"))
 
 @app.get("/export/workers.csv")
 def export_workers():
     if require_login(): return require_login()
-    out = io.StringIO(); w = csv.writer(out)
-    w.writerow(["id","name","company","commission","expenses","status","created_at"])
-    with conn() as c:
-        for r in c.execute("SELECT * FROM workers ORDER BY id DESC"):
-            w.writerow([r['id'],r['name'],r['company'],r['commission'],r['expenses'],r['status'],r['created_at']])
-    mem = io.BytesIO(out.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="workers.csv")
+    return export_response("workers")
 
 # ----------------------- 银行账户 -----------------------
 @app.get("/bank-accounts")
+@cached_view("bank_accounts")
 def bank_accounts_list():
     if require_login(): return require_login()
-    with conn() as c:
-        rows = c.execute("SELECT * FROM bank_accounts ORDER BY id DESC").fetchall()
-    return render_template("bank_accounts_list.html", rows=rows)
+    c = conn(); where, params = list_filters(c, "bank_accounts")
+    page = keyset_page(c, "SELECT * FROM bank_accounts", "bank_accounts.id", where, params)
+    return render_template("bank_accounts_list.html", rows=page["rows"], page=page, filters=filter_form(c, "bank_accounts"))
 
 @app.get("/bank-accounts/add")
+@cached_view()
 def bank_accounts_add_form():
     if require_login(): return require_login()
     return render_template("partials/bank_accounts_form.html")
@@ -865,13 +2511,16 @@ def bank_accounts_add():
     holder = request.form.get("holder","").strip()
     card_company = request.form.get("card_company","").strip()
     status = 1 if request.form.get("status") == "1" else 0
-    with conn() as c:
-        c.execute("""INSERT INTO bank_accounts(bank_name,account_no,holder,status,created_at,card_company) VALUES(?,?,?,?,?,?)""",
-                  (bank_name, account_no, holder, status, datetime.utcnow().isoformat(), card_company))
-        c.commit()
+    try:
+        db_write(lambda c: c.execute("""INSERT INTO bank_accounts(bank_name,account_no,holder,status,created_at,card_company) VALUES(?,?,?,?,?,?)""",
+                                     (bank_name, account_no, holder, status, datetime.utcnow().isoformat(), card_company)))
+    except sqlite3.IntegrityError:  # ux_bank_accounts_bank_acct
+        flash(f"账户已存在：{bank_name} / {account_no}", "error")
+    _refs.invalidate("bank_accounts")
     return redirect(url_for("bank_accounts_list"))
 
 @app.get("/bank-accounts/<int:bid>/edit")
+@cached_view("bank_accounts")
 def bank_accounts_edit_form(bid):
     if require_login(): return require_login()
     with conn() as c:
@@ -889,69 +2538,66 @@ def bank_accounts_edit(bid):
     holder = request.form.get("holder","").strip()
     card_company = request.form.get("card_company","").strip()
     status = 1 if request.form.get("status") == "1" else 0
-    with conn() as c:
-        c.execute("""UPDATE bank_accounts SET bank_name=?, account_no=?, holder=?, status=?, card_company=? WHERE id=?""",
-                  (bank_name, account_no, holder, status, card_company, bid)); c.commit()
+    try:
+        db_write(lambda c: c.execute("""UPDATE bank_accounts SET bank_name=?, account_no=?, holder=?, status=?, card_company=? WHERE id=?""",
+                                     (bank_name, account_no, holder, status, card_company, bid)))
+    except sqlite3.IntegrityError:  # 改成了另一个已有账户的 (银行名, 账号)
+        flash(f"账户已存在：{bank_name} / {account_no}", "error")
+    _refs.invalidate("bank_accounts")
     return redirect(url_for("bank_accounts_list"))
 
 @app.post("/bank-accounts/<int:bid>/toggle")
 def bank_accounts_toggle(bid):
     if require_login(): return require_login()
-    with conn() as c:
-        cur = c.cursor(); cur.execute("SELECT status FROM bank_accounts WHERE id=?", (bid,)); row = cur.fetchone()
-        if not row: abort(404)
-        cur.execute("UPDATE bank_accounts SET status=? WHERE id=?", (0 if row['status']==1 else 1, bid)); c.commit()
+    if not set_status("bank_accounts", [bid]): abort(404)
     return redirect(url_for("bank_accounts_list"))
 
 @app.post("/bank-accounts/<int:bid>/delete")
 def bank_accounts_delete(bid):
     if require_login(): return require_login()
-    with conn() as c: c.execute("DELETE FROM bank_accounts WHERE id=?", (bid,)); c.commit()
+    delete_ids("bank_accounts", [bid])
     return redirect(url_for("bank_accounts_list"))
 
 @app.get("/export/bank_accounts.csv")
 def export_bank_accounts():
     if require_login(): return require_login()
-    out = io.StringIO(); w = csv.writer(out)
-    w.writerow(["id","bank_name","account_no","holder","card_company","status","created_at"])
-    with conn() as c:
-        for r in c.execute("SELECT * FROM bank_accounts ORDER BY id DESC"):
-            w.writerow([r['id'],r['bank_name'],r['account_no'],r['holder'],r['card_company'],r['status'],r['created_at']])
-    mem = io.BytesIO(out.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="bank_accounts.csv")
+    return export_response("bank_accounts")
 
 # ----------------------- 银行卡租金 -----------------------
-def get_or_create_bank_account(bank_name:str, account_no:str, card_company:str):
+def get_or_create_bank_account(c, bank_name:str, account_no:str, card_company:str):
+    # 在调用方的写事务里执行（db_write 内），不单独提交。
+    # 参考数据缓存命中且无需补卡公司时直接返回；否则一条 upsert 完成 新建 / 补卡公司 / 取 id，
+    # 依赖 ux_bank_accounts_bank_acct，并发保存同一张卡也只会有一个账户
     bank_name = (bank_name or "").strip()
     account_no = (account_no or "").strip()
     card_company = (card_company or "").strip()
     if not bank_name or not account_no:
         raise ValueError("bank_name / account_no 必填")
-    with conn() as c:
-        ex = c.execute("SELECT id, card_company FROM bank_accounts WHERE bank_name=? AND account_no=?", (bank_name, account_no)).fetchone()
-        if ex:
-            if (not ex["card_company"]) and card_company:
-                c.execute("UPDATE bank_accounts SET card_company=? WHERE id=?", (card_company, ex["id"]))
-                c.commit()
-            return ex["id"]
-        c.execute("""INSERT INTO bank_accounts(bank_name, account_no, holder, status, created_at, card_company)
-                     VALUES(?,?,?,?,?,?)""", (bank_name, account_no, "", 1, datetime.utcnow().isoformat(), card_company))
-        c.commit()
-        nid = c.execute("SELECT last_insert_rowid() AS id").fetchone()["id"]
-        return nid
+    hit = _refs.peek(c, "bank_accounts")
+    if hit:
+        ex = _refs.index(hit, ("bank_name", "account_no")).get((bank_name, account_no))
+        if ex and (ex["card_company"] or not card_company): return ex["id"]
+    row = c.execute("""INSERT INTO bank_accounts(bank_name, account_no, holder, status, created_at, card_company)
+                       VALUES(?,?,?,?,?,?)
+                       ON CONFLICT(bank_name, account_no) DO UPDATE SET card_company = excluded.card_company
+                       WHERE IFNULL(bank_accounts.card_company, '') = '' AND excluded.card_company <> ''
+                       RETURNING id""", (bank_name, account_no, "", 1, datetime.utcnow().isoformat(), card_company)).fetchone()
+    if row: return row["id"]
+    # 已存在且不需要更新时 upsert 不返回行
+    return c.execute("SELECT id FROM bank_accounts WHERE bank_name=? AND account_no=?", (bank_name, account_no)).fetchone()["id"]
 
 @app.get("/card-rentals")
+@cached_view("card_rentals", "bank_accounts")
 def card_rentals_list():
     if require_login(): return require_login()
-    with conn() as c:
-        rows = c.execute("""
-            SELECT cr.*, ba.bank_name, ba.account_no, ba.card_company
-            FROM card_rentals cr LEFT JOIN bank_accounts ba ON ba.id = cr.bank_account_id
-            ORDER BY cr.id DESC
-        """).fetchall()
-    return render_template("card_rentals_list.html", rows=rows)
+    c = conn(); where, params = list_filters(c, "card_rentals")
+    page = keyset_page(c, "SELECT cr.* FROM card_rentals cr", "cr.id", where, params)
+    rows = with_ref(page["rows"], c, "bank_accounts", "bank_account_id",
+                    bank_name="bank_name", account_no="account_no", card_company="card_company")
+    return render_template("card_rentals_list.html", rows=rows, page=page, filters=filter_form(c, "card_rentals"))
 
 @app.get("/card-rentals/add")
+@cached_view()
 def card_rentals_add_form():
     if require_login(): return require_login()
     return render_template("partials/card_rentals_form.html")
@@ -962,27 +2608,27 @@ def card_rentals_add():
     bank_name    = request.form.get("bank_name","").strip()
     account_no   = request.form.get("account_no","").strip()
     card_company = request.form.get("card_company","").strip()
-    monthly_rent = float(request.form.get("monthly_rent") or 0)
-    start_date   = request.form.get("start_date","")
-    end_date     = request.form.get("end_date","")
+    monthly_rent = form_money("monthly_rent")
+    start_date   = form_date("start_date")
+    end_date     = form_date("end_date")
+    if start_date and end_date and end_date < start_date: abort(400)
     note         = request.form.get("note","")
-    bank_account_id = get_or_create_bank_account(bank_name, account_no, card_company)
-    with conn() as c:
+    def _add(c):
+        bank_account_id = get_or_create_bank_account(c, bank_name, account_no, card_company)
         c.execute("""INSERT INTO card_rentals(bank_account_id, monthly_rent, start_date, end_date, note, status, created_at)
                      VALUES(?,?,?,?,?,1,?)""",
                   (bank_account_id, monthly_rent, start_date, end_date, note, datetime.utcnow().isoformat()))
-        c.commit()
+    db_write(_add)
     return redirect(url_for("card_rentals_list"))
 
 @app.get("/card-rentals/<int:rid>/edit")
+@cached_view("card_rentals", "bank_accounts")
 def card_rentals_edit_form(rid):
     if require_login(): return require_login()
     with conn() as c:
-        r = c.execute("""
-            SELECT cr.*, ba.bank_name, ba.account_no, ba.card_company
-            FROM card_rentals cr LEFT JOIN bank_accounts ba ON ba.id = cr.bank_account_id
-            WHERE cr.id=?
-        """, (rid,)).fetchone()
+        r = c.execute("SELECT * FROM card_rentals WHERE id=?", (rid,)).fetchone()
+        if r: r = with_ref([r], c, "bank_accounts", "bank_account_id",
+                           bank_name="bank_name", account_no="account_no", card_company="card_company")[0]
     if not r: abort(404)
     if request.args.get("partial") == "1":
         return render_template("partials/card_rentals_form.html", r=r)
@@ -994,79 +2640,162 @@ def card_rentals_edit(rid):
     bank_name    = request.form.get("bank_name","").strip()
     account_no   = request.form.get("account_no","").strip()
     card_company = request.form.get("card_company","").strip()
-    monthly_rent = float(request.form.get("monthly_rent") or 0)
-    start_date   = request.form.get("start_date","")
-    end_date     = request.form.get("end_date","")
+    monthly_rent = form_money("monthly_rent")
+    start_date   = form_date("start_date")
+    end_date     = form_date("end_date")
+    if start_date and end_date and end_date < start_date: abort(400)
     note         = request.form.get("note","")
-    bank_account_id = get_or_create_bank_account(bank_name, account_no, card_company)
-    with conn() as c:
+    def _edit(c):
+        bank_account_id = get_or_create_bank_account(c, bank_name, account_no, card_company)
         c.execute("""UPDATE card_rentals SET bank_account_id=?, monthly_rent=?, start_date=?, end_date=?, note=? WHERE id=?""",
-                  (bank_account_id, monthly_rent, start_date, end_date, note, rid)); c.commit()
+                  (bank_account_id, monthly_rent, start_date, end_date, note, rid))
+    db_write(_edit)
     return redirect(url_for("card_rentals_list"))
 
 @app.post("/card-rentals/<int:rid>/toggle")
 def card_rentals_toggle(rid):
     if require_login(): return require_login()
-    with conn() as c:
-        cur = c.cursor(); cur.execute("SELECT status FROM card_rentals WHERE id=?", (rid,)); row = cur.fetchone()
-        if not row: abort(404)
-        cur.execute("UPDATE card_rentals SET status=? WHERE id=?", (0 if row['status']==1 else 1, rid)); c.commit()
+    if not set_status("card_rentals", [rid]): abort(404)
     return redirect(url_for("card_rentals_list"))
 
 @app.post("/card-rentals/<int:rid>/delete")
 def card_rentals_delete(rid):
     if require_login(): return require_login()
-    with conn() as c: c.execute("DELETE FROM card_rentals WHERE id=?", (rid,)); c.commit()
+    delete_ids("card_rentals", [rid])
     return redirect(url_for("card_rentals_list"))
 
 @app.get("/export/card_rentals.csv")
 def export_card_rentals():
     if require_login(): return require_login()
-    out = io.StringIO(); w = csv.writer(out)
-    w.writerow(["id","bank_account_id","monthly_rent","start_date","end_date","note","status","created_at"])
-    with conn() as c:
-        for r in c.execute("SELECT * FROM card_rentals ORDER BY id DESC"):
-            w.writerow([r['id'],r['bank_account_id'],r['monthly_rent'],r['start_date'],r['end_date'],r['note'],r['status'],r['created_at']])
-    mem = io.BytesIO(out.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="card_rentals.csv")
+    return export_response("card_rentals")
+
+# ----------------------- 租金计提 -----------------------
+# 每条启用的租约按月展开成应计金额：daily 按当月在租天数折算（月租 * 天数 / 当月天数，四舍五入到分），
+# monthly 只要当月有一天在租就计整月。展开由一条递归 CTE 在库里整体完成：月份序列和窗口内的租约各自先换算成
+# 儒略日整数，再按区间重叠 JOIN，逐行只剩整数运算；按月 / 按租约的汇总都在外层 GROUP BY 里完成。
+# 按月汇总按 (方式, 月份) 缓存在进程内；card_rentals 的版本号一变（新增 / 编辑 / 启停 / 删除，任何进程）缓存整体作废。
+ACCRUAL_MODES = ("daily", "monthly")
+ACCRUAL_CACHE_MONTHS = 480  # 缓存的 (方式, 月份) 条目上限
+
+_ACCRUAL_SQL = """
+WITH RECURSIVE months(m) AS (
+    SELECT ?1 || '-01' UNION ALL SELECT date(m, '+1 month') FROM months WHERE m < ?2 || '-01'
+), spans AS MATERIALIZED (
+    SELECT m, CAST(julianday(m) AS INTEGER) ms, CAST(julianday(m, '+1 month') AS INTEGER) - 1 me FROM months
+), rentals AS MATERIALIZED (
+    SELECT id, IFNULL(monthly_rent, 0) rent, CAST(julianday(start_date) AS INTEGER) rs,
+           IFNULL(CAST(julianday(NULLIF(end_date, '')) AS INTEGER), 99999999) re
+    FROM card_rentals
+    WHERE status = 1 AND start_date <> '' AND start_date < date(?2 || '-01', '+1 month') AND (IFNULL(end_date, '') = '' OR end_date >= ?1 || '-01')
+)
+SELECT substr(s.m, 1, 7) month, r.id rental_id, MIN(s.me, r.re) - MAX(s.ms, r.rs) + 1 days,
+       CASE WHEN ?3 = 'monthly' THEN r.rent
+            ELSE (r.rent * (MIN(s.me, r.re) - MAX(s.ms, r.rs) + 1) * 2 + s.me - s.ms + 1) / (2 * (s.me - s.ms + 1)) END cents
+FROM spans s JOIN rentals r ON r.rs <= s.me AND r.re >= s.ms
+"""
+_ACCRUAL_BY_MONTH = f"SELECT month, COUNT(*) rentals, SUM(cents) accrued FROM ({_ACCRUAL_SQL}) GROUP BY month"
+_ACCRUAL_BY_RENTAL = f"""
+SELECT cr.*, a.months, a.days, a.accrued FROM (
+    SELECT rental_id, COUNT(*) months, SUM(days) days, SUM(cents) accrued FROM ({_ACCRUAL_SQL}) GROUP BY rental_id
+) a JOIN card_rentals cr ON cr.id = a.rental_id
+ORDER BY a.accrued DESC, cr.id
+"""
+
+class AccrualCache:
+    def __init__(self, size):
+        self.size, self._version, self._data, self._lock = size, None, OrderedDict(), threading.Lock()
+
+    def months(self, c, months, mode):
+        # -> {月份: (计提租约数, 应计分)}；缺的月份用一次查询补齐（取缺失月份的首尾区间）
+        v = table_versions(c).get("card_rentals", (None, None))[0]
+        with self._lock:
+            if v != self._version: self._data.clear(); self._version = v
+            out = {m: self._data.get((mode, m)) for m in months}
+            for m in months:
+                if out[m] is not None: self._data.move_to_end((mode, m))
+        missing = [m for m in months if out[m] is None]
+        if missing:
+            got = dict.fromkeys(_month_seq(missing[0], missing[-1]), (0, 0))
+            got.update((r["month"], (r["rentals"], r["accrued"])) for r in c.execute(_ACCRUAL_BY_MONTH, (missing[0], missing[-1], mode)))
+            with self._lock:
+                if v == self._version:
+                    for m, rows in got.items(): self._data[(mode, m)] = rows
+                    while len(self._data) > self.size: self._data.popitem(last=False)
+            out.update((m, got[m]) for m in missing)
+        return out
+
+_accruals = AccrualCache(ACCRUAL_CACHE_MONTHS)
+
+def rental_accruals(c, frm, to, mode):
+    months = _month_seq(frm, to)
+    per = _accruals.months(c, months, mode)
+    rentals = with_ref(c.execute(_ACCRUAL_BY_RENTAL, (frm, to, mode)).fetchall(), c, "bank_accounts", "bank_account_id",
+                       bank_name="bank_name", account_no="account_no")
+    return {"from": months[0], "to": months[-1], "mode": mode,
+            "months": [{"month": m, "rentals": per[m][0], "accrued": per[m][1]} for m in months],
+            "rentals": rentals, "total": sum(per[m][1] for m in months)}
+
+def _accrual_args():
+    mode = request.args.get("mode") or "daily"
+    if mode not in ACCRUAL_MODES: abort(400)
+    return (*month_window(), mode)
+
+@app.get("/reports/rentals")
+@cached_view("card_rentals", "bank_accounts", key=_accrual_args)
+def rental_accruals_report():
+    if require_login(): return require_login()
+    return render_template("rental_accruals.html", report=rental_accruals(conn(), *_accrual_args()))
+
+@app.get("/api/rental-accruals")
+def api_rental_accruals():
+    # ?from=YYYY-MM&to=YYYY-MM&mode=daily|monthly；金额单位为元
+    if require_login(): return require_login()
+    rep = rental_accruals(conn(), *_accrual_args())
+    resp = jsonify({**rep, "total": Money(rep["total"]).units(),
+                    "months": [{**m, "accrued": Money(m["accrued"]).units()} for m in rep["months"]],
+                    "rentals": [{"id": r["id"], "bank_account_id": r["bank_account_id"], "bank_name": r["bank_name"], "account_no": r["account_no"],
+                                 "monthly_rent": Money(r["monthly_rent"] or 0).units(), "start_date": r["start_date"], "end_date": r["end_date"],
+                                 "months": r["months"], "days": r["days"], "accrued": Money(r["accrued"]).units()} for r in rep["rentals"]]})
+    resp.cache_control.private = True; resp.cache_control.max_age = 60
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 # ----------------------- 出粮记录 -----------------------
 @app.get("/salaries")
+@cached_view("salaries", "workers")
 def salaries_list():
     if require_login(): return require_login()
-    with conn() as c:
-        rows = c.execute("""
-            SELECT s.*, w.name AS worker_name FROM salaries s
-            LEFT JOIN workers w ON w.id = s.worker_id ORDER BY s.id DESC
-        """).fetchall()
-    return render_template("salaries_list.html", rows=rows)
+    c = conn(); where, params = list_filters(c, "salaries")
+    page = keyset_page(c, "SELECT s.* FROM salaries s", "s.id", where, params)
+    rows = with_ref(page["rows"], c, "workers", "worker_id", worker_name="name")
+    return render_template("salaries_list.html", rows=rows, page=page, filters=filter_form(c, "salaries"))
 
 @app.get("/salaries/add")
+@cached_view("workers")
 def salaries_add_form():
     if require_login(): return require_login()
     with conn() as c:
-        workers = c.execute("SELECT id, name FROM workers ORDER BY id DESC").fetchall()
+        workers = ref_rows(c, "workers")
     return render_template("partials/salaries_form.html", workers=workers)
 
 @app.post("/salaries/add")
 def salaries_add():
     if require_login(): return require_login()
     worker_id = int(request.form.get("worker_id") or 0)
-    amount = float(request.form.get("amount") or 0)
-    pay_date = request.form.get("pay_date","")
+    amount = form_money("amount")
+    pay_date = form_date("pay_date", required=True)
     note = request.form.get("note","")
-    with conn() as c:
-        c.execute("""INSERT INTO salaries(worker_id, amount, pay_date, note, status, created_at) VALUES(?,?,?,?,1,?)""",
-                  (worker_id, amount, pay_date, note, datetime.utcnow().isoformat()))
-        c.commit()
+    db_write(lambda c: c.execute("""INSERT INTO salaries(worker_id, amount, pay_date, note, status, created_at) VALUES(?,?,?,?,1,?)""",
+                                 (worker_id, amount, pay_date, note, datetime.utcnow().isoformat())))
     return redirect(url_for("salaries_list"))
 
 @app.get("/salaries/<int:sid>/edit")
+@cached_view("salaries", "workers")
 def salaries_edit_form(sid):
     if require_login(): return require_login()
     with conn() as c:
         r = c.execute("SELECT * FROM salaries WHERE id=?", (sid,)).fetchone()
-        workers = c.execute("SELECT id, name FROM workers ORDER BY id DESC").fetchall()
+        workers = ref_rows(c, "workers")
     if not r: abort(404)
     if request.args.get("partial") == "1":
         return render_template("partials/salaries_form.html", r=r, workers=workers)
@@ -1076,77 +2805,66 @@ def salaries_edit_form(sid):
 def salaries_edit(sid):
     if require_login(): return require_login()
     worker_id = int(request.form.get("worker_id") or 0)
-    amount = float(request.form.get("amount") or 0)
-    pay_date = request.form.get("pay_date","")
+    amount = form_money("amount")
+    pay_date = form_date("pay_date", required=True)
     note = request.form.get("note","")
-    with conn() as c:
-        c.execute("""UPDATE salaries SET worker_id=?, amount=?, pay_date=?, note=? WHERE id=?""",
-                  (worker_id, amount, pay_date, note, sid)); c.commit()
+    db_write(lambda c: c.execute("""UPDATE salaries SET worker_id=?, amount=?, pay_date=?, note=? WHERE id=?""",
+                                 (worker_id, amount, pay_date, note, sid)))
     return redirect(url_for("salaries_list"))
 
 @app.post("/salaries/<int:sid>/toggle")
 def salaries_toggle(sid):
     if require_login(): return require_login()
-    with conn() as c:
-        cur = c.cursor(); cur.execute("SELECT status FROM salaries WHERE id=?", (sid,)); row = cur.fetchone()
-        if not row: abort(404)
-        cur.execute("UPDATE salaries SET status=? WHERE id=?", (0 if row['status']==1 else 1, sid)); c.commit()
+    if not set_status("salaries", [sid]): abort(404)
     return redirect(url_for("salaries_list"))
 
 @app.post("/salaries/<int:sid>/delete")
 def salaries_delete(sid):
     if require_login(): return require_login()
-    with conn() as c: c.execute("DELETE FROM salaries WHERE id=?", (sid,)); c.commit()
+    delete_ids("salaries", [sid])
     return redirect(url_for("salaries_list"))
 
 @app.get("/export/salaries.csv")
 def export_salaries():
     if require_login(): return require_login()
-    out = io.StringIO(); w = csv.writer(out)
-    w.writerow(["id","worker_id","amount","pay_date","note","status","created_at"])
-    with conn() as c:
-        for r in c.execute("SELECT * FROM salaries ORDER BY id DESC"):
-            w.writerow([r['id'],r['worker_id'],r['amount'],r['pay_date'],r['note'],r['status'],r['created_at']])
-    mem = io.BytesIO(out.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="salaries.csv")
+    return export_response("salaries")
 
 # ----------------------- 开销记录 -----------------------
 @app.get("/expenses")
+@cached_view("expenses", "workers")
 def expenses_list():
     if require_login(): return require_login()
-    with conn() as c:
-        rows = c.execute("""
-            SELECT e.*, w.name AS worker_name FROM expenses e
-            LEFT JOIN workers w ON w.id = e.worker_id ORDER BY e.id DESC
-        """).fetchall()
-    return render_template("expenses_list.html", rows=rows)
+    c = conn(); where, params = list_filters(c, "expenses")
+    page = keyset_page(c, "SELECT e.* FROM expenses e", "e.id", where, params)
+    rows = with_ref(page["rows"], c, "workers", "worker_id", worker_name="name")
+    return render_template("expenses_list.html", rows=rows, page=page, filters=filter_form(c, "expenses"))
 
 @app.get("/expenses/add")
+@cached_view("workers")
 def expenses_add_form():
     if require_login(): return require_login()
     with conn() as c:
-        workers = c.execute("SELECT id, name FROM workers ORDER BY id DESC").fetchall()
+        workers = ref_rows(c, "workers")
     return render_template("partials/expenses_form.html", workers=workers)
 
 @app.post("/expenses/add")
 def expenses_add():
     if require_login(): return require_login()
     worker_id = int(request.form.get("worker_id") or 0)
-    amount = float(request.form.get("amount") or 0)
-    date = request.form.get("date","")
+    amount = form_money("amount")
+    date = form_date("date", required=True)
     note = request.form.get("note","")
-    with conn() as c:
-        c.execute("""INSERT INTO expenses(worker_id, amount, date, note, status, created_at)
-                     VALUES(?,?,?,?,1,?)""", (worker_id, amount, date, note, datetime.utcnow().isoformat()))
-        c.commit()
+    db_write(lambda c: c.execute("""INSERT INTO expenses(worker_id, amount, date, note, status, created_at)
+                                    VALUES(?,?,?,?,1,?)""", (worker_id, amount, date, note, datetime.utcnow().isoformat())))
     return redirect(url_for("expenses_list"))
 
 @app.get("/expenses/<int:eid>/edit")
+@cached_view("expenses", "workers")
 def expenses_edit_form(eid):
     if require_login(): return require_login()
     with conn() as c:
         r = c.execute("SELECT * FROM expenses WHERE id=?", (eid,)).fetchone()
-        workers = c.execute("SELECT id, name FROM workers ORDER BY id DESC").fetchall()
+        workers = ref_rows(c, "workers")
     if not r: abort(404)
     if request.args.get("partial") == "1":
         return render_template("partials/expenses_form.html", r=r, workers=workers)
@@ -1156,44 +2874,607 @@ def expenses_edit_form(eid):
 def expenses_edit(eid):
     if require_login(): return require_login()
     worker_id = int(request.form.get("worker_id") or 0)
-    amount = float(request.form.get("amount") or 0)
-    date = request.form.get("date","")
+    amount = form_money("amount")
+    date = form_date("date", required=True)
     note = request.form.get("note","")
-    with conn() as c:
-        c.execute("""UPDATE expenses SET worker_id=?, amount=?, date=?, note=? WHERE id=?""",
-                  (worker_id, amount, date, note, eid)); c.commit()
+    db_write(lambda c: c.execute("""UPDATE expenses SET worker_id=?, amount=?, date=?, note=? WHERE id=?""",
+                                 (worker_id, amount, date, note, eid)))
     return redirect(url_for("expenses_list"))
 
 @app.post("/expenses/<int:eid>/toggle")
 def expenses_toggle(eid):
     if require_login(): return require_login()
-    with conn() as c:
-        cur = c.cursor(); cur.execute("SELECT status FROM expenses WHERE id=?", (eid,)); row = cur.fetchone()
-        if not row: abort(404)
-        cur.execute("UPDATE expenses SET status=? WHERE id=?", (0 if row['status']==1 else 1, eid)); c.commit()
+    if not set_status("expenses", [eid]): abort(404)
     return redirect(url_for("expenses_list"))
 
 @app.post("/expenses/<int:eid>/delete")
 def expenses_delete(eid):
     if require_login(): return require_login()
-    with conn() as c: c.execute("DELETE FROM expenses WHERE id=?", (eid,)); c.commit()
+    delete_ids("expenses", [eid])
     return redirect(url_for("expenses_list"))
 
 @app.get("/export/expenses.csv")
 def export_expenses():
     if require_login(): return require_login()
-    out = io.StringIO(); w = csv.writer(out)
-    w.writerow(["id","worker_id","amount","date","note","status","created_at"])
-    with conn() as c:
-        for r in c.execute("SELECT * FROM expenses ORDER BY id DESC"):
-            w.writerow([r['id'],r['worker_id'],r['amount'],r['date'],r['note'],r['status'],r['created_at']])
-    mem = io.BytesIO(out.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="expenses.csv")
+    return export_response("expenses")
+
+# ----------------------- 工人台账 / 结余 -----------------------
+# 结余（应付给工人）= 佣金 + 开销（工人资料里的固定项）+ 开销记录 − 已发工资，只计启用的记录。
+# 汇总部分读 worker_balances（含已归档部分）；台账明细按 (日期, 类型, id) 倒序做 keyset 分页，
+# 每页顶行的滚动结余 = 总结余 − 更新记录的净额，后者由 (worker_id, 日期, 金额, status) 覆盖索引求和。
+_LEDGER_PARTS = (("salaries", "s", "pay_date"), ("expenses", "e", "date"))
+
+def worker_balance_rows(c, where="", params=()):
+    return c.execute(f"""
+        SELECT w.*, IFNULL(b.sal_n, 0) sal_n, IFNULL(b.sal, 0) sal, IFNULL(b.exp_n, 0) exp_n, IFNULL(b.exp, 0) exp, IFNULL(b.archived, 0) archived,
+               IFNULL(w.commission, 0) + IFNULL(w.expenses, 0) + IFNULL(b.exp, 0) - IFNULL(b.sal, 0) balance
+        FROM workers w LEFT JOIN (
+            SELECT worker_id, SUM(n_active * (ledger = 'salaries')) sal_n, SUM(total_active * (ledger = 'salaries')) sal,
+                   SUM(n_active * (ledger = 'expenses')) exp_n, SUM(total_active * (ledger = 'expenses')) exp, SUM(n * (part = 'archive')) archived
+            FROM worker_balances GROUP BY worker_id
+        ) b ON b.worker_id = w.id {where}""", params).fetchall()
+
+def _ledger_key(v):
+    # 游标 '日期.类型.id'，日期可能为空
+    try: d, k, i = (v or "").rsplit(".", 2); return (d, k, int(i)) if k in ("s", "e") else None
+    except ValueError: return None
+
+def ledger_page(c, wid, balance):
+    size = max(1, min(request.args.get("size", type=int) or PAGE_SIZE, PAGE_SIZE_MAX))
+    after, before = _ledger_key(request.args.get("after")), _ledger_key(request.args.get("before"))
+    key, cmp, order = (before, ">", "ASC") if before else (after, "<", "DESC")
+    parts, args = [], []
+    for t, k, dcol in _LEDGER_PARTS:
+        parts.append(f"SELECT '{k}' k, id, {dcol} d, amount, note, status FROM {t} WHERE worker_id = ?"
+                     + (f" AND ({dcol}, '{k}', id) {cmp} (?, ?, ?)" if key else ""))
+        args += [wid, *key] if key else [wid]
+    rows = c.execute("SELECT * FROM (" + " UNION ALL ".join(parts) + f") ORDER BY d {order}, k {order}, id {order} LIMIT ?",
+                     args + [size + 1]).fetchall()
+    more = len(rows) > size; rows = [dict(r) for r in rows[:size]]
+    if order == "ASC": rows.reverse()
+    if rows:
+        # 比本页顶行更新的记录的净额（开销记录 +，工资 −）
+        top = (rows[0]["d"], rows[0]["k"], rows[0]["id"])
+        newer = 0
+        for t, k, dcol in _LEDGER_PARTS:
+            s = c.execute(f"SELECT IFNULL(SUM(amount), 0) s FROM {t} WHERE worker_id = ? AND status = 1 AND ({dcol}, '{k}', id) > (?, ?, ?)",
+                          (wid, *top)).fetchone()["s"]
+            newer += s if k == "e" else -s
+        bal = balance - newer
+        for r in rows:
+            r["balance"] = bal
+            if r["status"] == 1: bal -= (r["amount"] or 0) * (1 if r["k"] == "e" else -1)
+    cursor = lambda r: f"{r['d'] or ''}.{r['k']}.{r['id']}"
+    has_next = more if not before else True
+    has_prev = more if before else after is not None
+    return {"rows": rows, "size": size,
+            "next_url": _page_url(after=cursor(rows[-1])) if rows and has_next else None,
+            "prev_url": _page_url(before=cursor(rows[0])) if rows and has_prev else (_page_url() if has_prev else None),
+            "first_url": _page_url()}
+
+@app.get("/workers/<int:wid>/ledger")
+@cached_view("workers", "salaries", "expenses")
+def worker_ledger(wid):
+    if require_login(): return require_login()
+    c = conn()
+    w = next(iter(worker_balance_rows(c, "WHERE w.id = ?", (wid,))), None)
+    if not w: abort(404)
+    return render_template("worker_ledger.html", w=w, page=ledger_page(c, wid, w["balance"]))
+
+@app.get("/reports/balances")
+@cached_view("workers", "salaries", "expenses")
+def worker_balances_report():
+    if require_login(): return require_login()
+    where = "WHERE w.status = 1" if request.args.get("active") == "1" else ""
+    rows = sorted(worker_balance_rows(conn(), where), key=lambda r: (-r["balance"], r["id"]))
+    return render_template("worker_balances.html", rows=rows, active_only=bool(where),
+                           totals={k: sum(r[k] or 0 for r in rows) for k in ("commission", "expenses", "sal", "exp", "balance")})
+
+# ----------------------- CSV 批量导入 -----------------------
+# 列格式与 /export/*.csv 相同（id 列忽略）；另外接受 worker_name 代替 worker_id，
+# bank_name + account_no (+ card_company) 代替 bank_account_id。整个文件在一个写事务里分批 executemany。
+IMPORT_MAX_ERRORS = 200
+
+def _imp_text(row, key, required=False):
+    v = (row.get(key) or "").strip()
+    if required and not v: raise ValueError(f"{key} 必填")
+    return v
+
+def _imp_money(row, key):
+    v = _imp_text(row, key)
+    try: return Money.parse(v)
+    except ValueError: raise ValueError(f"{key} 不是数字: {v!r}") from None
+
+def _imp_status(row):
+    v = _imp_text(row, "status") or "1"
+    if v not in ("0", "1"): raise ValueError(f"status 只能是 0 或 1: {v!r}")
+    return int(v)
+
+def _imp_date(row, key):
+    v = _imp_text(row, key)
+    try: return norm_date(v)
+    except ValueError: raise ValueError(f"{key} 不是日期: {v!r}") from None
+
+def _imp_created(row):
+    v = _imp_text(row, "created_at")
+    try: return norm_timestamp(v) or datetime.utcnow().isoformat()
+    except ValueError: raise ValueError(f"created_at 不是日期: {v!r}") from None
+
+def _imp_worker(row, refs, required):
+    wid, name = _imp_text(row, "worker_id"), _imp_text(row, "worker_name")
+    if wid == "0" and not required: wid = ""  # 表单里“不关联工人”存的是 0，导出后原样导回
+    if wid:
+        if not wid.isdigit() or int(wid) not in refs["worker_ids"]: raise ValueError(f"worker_id {wid} 不存在")
+        return int(wid)
+    if name:
+        if name not in refs["worker_names"]: raise ValueError(f"找不到工人 {name!r}")
+        return refs["worker_names"][name]
+    if required: raise ValueError("缺少 worker_id / worker_name")
+    return None
+
+def _imp_bank_account(row, refs, c):
+    bid = _imp_text(row, "bank_account_id")
+    if bid:
+        if not bid.isdigit() or int(bid) not in refs["account_ids"]: raise ValueError(f"bank_account_id {bid} 不存在")
+        return int(bid)
+    key = (_imp_text(row, "bank_name", True), _imp_text(row, "account_no", True))
+    if key not in refs["accounts"]:
+        refs["accounts"][key] = get_or_create_bank_account(c, *key, _imp_text(row, "card_company"))
+        refs["account_ids"].add(refs["accounts"][key])
+    return refs["accounts"][key]
+
+def _imp_new_account(row, refs):
+    # ux_bank_accounts_bank_acct：库里已有或本文件前面出现过的 (银行名, 账号) 记为行错误，不让整批插入失败
+    key = (_imp_text(row, "bank_name", True), _imp_text(row, "account_no", True))
+    if key in refs["account_keys"]: raise ValueError(f"银行账户已存在: {key[0]} / {key[1]}")
+    refs["account_keys"].add(key)
+    return key
+
+def _import_refs(c, table):
+    # 一次性把关联表读进内存，逐行校验不再查库
+    refs = {}
+    if table in ("salaries", "expenses"):
+        ws = c.execute("SELECT id, name FROM workers ORDER BY id").fetchall()
+        refs["worker_ids"] = {w["id"] for w in ws}
+        refs["worker_names"] = {w["name"]: w["id"] for w in ws}  # 重名取最新
+    if table == "card_rentals":
+        bs = c.execute("SELECT id, bank_name, account_no FROM bank_accounts").fetchall()
+        refs["account_ids"] = {b["id"] for b in bs}
+        refs["accounts"] = {(b["bank_name"], b["account_no"]): b["id"] for b in bs}
+    if table == "bank_accounts":
+        refs["account_keys"] = {(b["bank_name"], b["account_no"]) for b in c.execute("SELECT bank_name, account_no FROM bank_accounts")}
+    return refs
+
+# 表 -> (INSERT 语句, 行转换函数(row, refs, c) -> 参数元组)
+IMPORT_SPECS = {
+    "workers": ("INSERT INTO workers(name, company, commission, expenses, status, created_at) VALUES(?,?,?,?,?,?)",
+                lambda r, refs, c: (_imp_text(r, "name", True), _imp_text(r, "company"), _imp_money(r, "commission"),
+                                    _imp_money(r, "expenses"), _imp_status(r), _imp_created(r))),
+    "bank_accounts": ("INSERT INTO bank_accounts(bank_name, account_no, holder, card_company, status, created_at) VALUES(?,?,?,?,?,?)",
+                      lambda r, refs, c: (*_imp_new_account(r, refs), _imp_text(r, "holder"),
+                                          _imp_text(r, "card_company"), _imp_status(r), _imp_created(r))),
+    "card_rentals": ("INSERT INTO card_rentals(bank_account_id, monthly_rent, start_date, end_date, note, status, created_at) VALUES(?,?,?,?,?,?,?)",
+                     lambda r, refs, c: (_imp_bank_account(r, refs, c), _imp_money(r, "monthly_rent"), _imp_date(r, "start_date"),
+                                         _imp_date(r, "end_date"), _imp_text(r, "note"), _imp_status(r), _imp_created(r))),
+    "salaries": ("INSERT INTO salaries(worker_id, amount, pay_date, note, status, created_at) VALUES(?,?,?,?,?,?)",
+                 lambda r, refs, c: (_imp_worker(r, refs, True), _imp_money(r, "amount"), _imp_date(r, "pay_date"),
+                                     _imp_text(r, "note"), _imp_status(r), _imp_created(r))),
+    "expenses": ("INSERT INTO expenses(worker_id, amount, date, note, status, created_at) VALUES(?,?,?,?,?,?)",
+                 lambda r, refs, c: (_imp_worker(r, refs, False), _imp_money(r, "amount"), _imp_date(r, "date"),
+                                     _imp_text(r, "note"), _imp_status(r), _imp_created(r))),
+}
+
+def _import_rows(c, table, rows, report, refs, progress=None):
+    # rows: [(行号, dict)]；校验失败的行记入 report，其余按 IMPORT_BATCH 一批 executemany
+    # 整批违反约束时回滚这一批，改为逐行插入，只把出错的行记入 report
+    sql, convert = IMPORT_SPECS[table]
+    batch, lines = [], []
+    def fail(line, e):
+        report["failed"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS: report["errors"].append({"line": line, "error": str(e)})
+    def flush():
+        c.execute("SAVEPOINT import_batch")
+        try:
+            c.executemany(sql, batch); report["rows"] += len(batch)
+        except sqlite3.IntegrityError:
+            c.execute("ROLLBACK TO import_batch")
+            for line, args in zip(lines, batch):
+                try: c.execute(sql, args); report["rows"] += 1
+                except sqlite3.IntegrityError as e: fail(line, e)
+        c.execute("RELEASE import_batch")
+        batch.clear(); lines.clear()
+        if progress: progress(report)
+    for line, row in rows:
+        try: batch.append(convert(row, refs, c)); lines.append(line)
+        except (ValueError, sqlite3.IntegrityError) as e:
+            fail(line, e); continue
+        if len(batch) >= IMPORT_BATCH: flush()
+    if batch: flush()
+
+def _import_report(table):
+    return {"table": table, "rows": 0, "failed": 0, "errors": []}
+
+def _import_finish(report, t0):
+    elapsed = time.perf_counter() - t0
+    report["seconds"], report["rows_per_sec"] = round(elapsed, 3), round(report["rows"] / elapsed) if elapsed else report["rows"]
+    return report
+
+def _import_file_error(e):
+    # 整个文件读不下去：编码不是 UTF-8，或 CSV 格式本身有错（不是某一行的数据问题）
+    return f"文件无法读取（需要 UTF-8 编码的 CSV）: {e.__class__.__name__}: {e}"
+
+def import_csv_stream(c, table, text_stream, progress=None):
+    # 在写事务里执行（db_write 内）；返回导入报告。文件级错误时整个文件不导入，report["error"] 说明原因
+    t0, report = time.perf_counter(), _import_report(table)
+    c.execute("SAVEPOINT import_file")
+    try:
+        _import_rows(c, table, enumerate(csv.DictReader(text_stream), start=2), report, _import_refs(c, table), progress)
+    except (UnicodeDecodeError, csv.Error) as e:
+        c.execute("ROLLBACK TO import_file")
+        report.update(rows=0, failed=0, errors=[], error=_import_file_error(e))
+    c.execute("RELEASE import_file")
+    return _import_finish(report, t0)
+
+@app.post("/import/<table>.csv")
+def import_csv(table):
+    if require_login(): return require_login()
+    if table not in IMPORT_SPECS: abort(404)
+    f = request.files.get("file")
+    if not f: abort(400)
+    if request.values.get("background") == "1":
+        job_id = uuid.uuid4().hex
+        os.makedirs(JOBS_DIR, exist_ok=True); f.save(_job_path(job_id, ".upload.csv"))
+        return job_accepted(_jobs.submit("import", {"table": table, "path": _job_path(job_id, ".upload.csv")}, job_id=job_id))
+    report = db_write(import_csv_stream, table, io.TextIOWrapper(f.stream, encoding="utf-8-sig", newline=""))
+    if table in ("workers", "bank_accounts"): _refs.invalidate(table)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report), 400 if report.get("error") else 200
+    if report.get("error"):
+        flash(report["error"], "error"); return redirect(url_for(table + "_list"))
+    flash(f"导入 {report['rows']} 行，失败 {report['failed']} 行，{report['rows_per_sec']} 行/秒"
+          + "".join(f"；第 {e['line']} 行: {e['error']}" for e in report["errors"][:5]))
+    return redirect(url_for(table + "_list"))
+
+# ----------------------- 后台任务 -----------------------
+# 大导出 / 导入 / 汇总重算放到后台线程执行，不受 gunicorn timeout 限制；请求立即返回任务 id。
+# 状态与进度写在 jobs 表里，任何 worker 进程都能查询；任务在提交它的进程里执行，
+# 进程退出（重启、max_requests 回收）会中断任务，启动和查询时据 pid 标记为失败。
+JOB_PROGRESS_INTERVAL = 0.5  # 进度最多每 0.5 秒写一次库
+
+def _job_path(job_id, suffix):
+    return os.path.join(JOBS_DIR, job_id + suffix)
+
+def _pid_alive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except (PermissionError, TypeError): return pid is not None
+    return True
+
+class Job:
+    def __init__(self, job_id):
+        self.id, self.done, self.total, self.file, self._last = job_id, 0, None, None, 0.0
+
+    def update(self, **cols):
+        sets = ", ".join(f"{k}=?" for k in cols)
+        db_write(lambda c: c.execute(f"UPDATE jobs SET {sets} WHERE id=?", (*cols.values(), self.id)))
+
+    def progress(self, done, total=None, force=False):
+        self.done = done
+        if total is not None: self.total = total
+        if force or time.monotonic() - self._last >= JOB_PROGRESS_INTERVAL:
+            self._last = time.monotonic(); self.update(progress=done, total=self.total)
+
+class JobRunner:
+    """进程内线程池执行 jobs 表里的任务；fork 后在子进程里重新建池。"""
+    def __init__(self, workers):
+        self.workers, self._pid, self._pool, self._lock = max(1, workers), None, None, threading.Lock()
+
+    def _executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="job"); self._pid = os.getpid()
+        return self._pool
+
+    def submit(self, kind, params, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        owner = session.get("user_id") if has_app_context() else None
+        db_write(lambda c: c.execute("""INSERT INTO jobs(id, kind, params, status, progress, owner, pid, created_at)
+                                        VALUES(?,?,?,'queued',0,?,?,?)""",
+                                     (job_id, kind, json.dumps(params), owner, os.getpid(), datetime.utcnow().isoformat())))
+        self._executor().submit(self._run, job_id, kind, params)
+        return job_id
+
+    def _run(self, job_id, kind, params):
+        job = Job(job_id)
+        try:
+            job.update(status="running", started_at=datetime.utcnow().isoformat())
+            result = JOB_KINDS[kind](job, **params)
+            job.update(status="done", progress=job.total if job.total is not None else job.done, total=job.total,
+                       result=json.dumps(result or {}, ensure_ascii=False), file=job.file, finished_at=datetime.utcnow().isoformat())
+        except Exception as e:
+            traceback.print_exc()
+            try: job.update(status="failed", message=f"{e.__class__.__name__}: {e}", finished_at=datetime.utcnow().isoformat())
+            except Exception: traceback.print_exc()
+
+_jobs = JobRunner(JOB_WORKERS)
+
+def _job_export(job, table):
+    columns, sql = EXPORT_SPECS[table]
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _job_path(job.id, ".csv"); n = 0
+    c = db_connect()  # 独立读连接：WAL 下不阻塞写，也不占请求连接池
+    try:
+        job.progress(0, c.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], force=True)
+        with open(path + ".part", "wb") as fh:
+            buf = _CsvChunk(); w = csv.writer(buf)
+            w.writerow(columns); fh.write(buf.take())
+            cur = c.execute(sql)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH)
+                if not rows: break
+                w.writerows([r[k] for k in columns] for r in rows); fh.write(buf.take())
+                n += len(rows); job.progress(n)
+    finally:
+        c.close()
+    os.replace(path + ".part", path)
+    job.file = path
+    return {"table": table, "rows": n, "filename": f"{table}.csv", "bytes": os.path.getsize(path)}
+
+def _import_chunk(c, table, chunk, report, refs):
+    refs = _import_refs(c, table) if refs is None else refs
+    _import_rows(c, table, chunk, report, refs)
+    return refs
+
+def _job_import(job, table, path):
+    # 与同步导入不同，按 IMPORT_BATCH*10 行一个写事务分批提交：进度可见，也不长时间独占写线程
+    with open(path, "rb") as fh: total = max(0, sum(1 for _ in fh) - 1)
+    t0, report, refs = time.perf_counter(), _import_report(table), None
+    job.progress(0, total, force=True)
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            rows = enumerate(csv.DictReader(fh), start=2)
+            while True:
+                chunk = list(itertools.islice(rows, IMPORT_BATCH * 10))
+                if not chunk: break
+                refs = db_write(_import_chunk, table, chunk, report, refs)
+                job.progress(report["rows"] + report["failed"])
+    except (UnicodeDecodeError, csv.Error) as e:
+        # 之前的分批已提交；任务标记为失败，消息里带已导入的行数
+        raise ValueError(f"{_import_file_error(e)}（已导入 {report['rows']} 行）") from None
+    finally:
+        os.remove(path)
+    if table in ("workers", "bank_accounts"): _refs.invalidate(table)
+    return _import_finish(report, t0)
+
+def _job_rebuild_totals(job):
+    job.progress(0, 1, force=True)
+    db_write(lambda c: (rebuild_totals(c), rebuild_monthly(c), rebuild_balances(c)))
+    job.progress(1, force=True)
+    return {"rebuilt": ["ledger_totals", "monthly_totals", "worker_balances"]}
+
+JOB_KINDS = {"export": _job_export, "import": _job_import, "rebuild-totals": _job_rebuild_totals}
+
+def recover_jobs(c):
+    # 启动时：执行进程已不在的 queued/running 任务标记为失败；清理过期任务及其文件
+    stale = [r["id"] for r in c.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')") if not _pid_alive(r["pid"])]
+    c.executemany("UPDATE jobs SET status='failed', message='interrupted: worker process exited', finished_at=? WHERE id=?",
+                  [(datetime.utcnow().isoformat(), j) for j in stale])
+    cutoff = (datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS)).isoformat()
+    for r in c.execute("SELECT id, file FROM jobs WHERE created_at < ?", (cutoff,)).fetchall():
+        for path in (r["file"], _job_path(r["id"], ".upload.csv")):
+            if path and os.path.exists(path): os.remove(path)
+    c.execute("DELETE FROM jobs WHERE created_at < ?", (cutoff,))
+    return len(stale)
+
+def job_dict(r):
+    d = {k: r[k] for k in ("id", "kind", "status", "progress", "total", "message", "owner", "created_at", "started_at", "finished_at")}
+    d["params"], d["result"] = json.loads(r["params"] or "{}"), json.loads(r["result"] or "null")
+    d["percent"] = round(100 * r["progress"] / r["total"], 1) if r["total"] else (100.0 if r["status"] == "done" else 0.0)
+    d["status_url"] = url_for("job_status", job_id=r["id"])
+    d["download_url"] = url_for("job_download", job_id=r["id"]) if r["status"] == "done" and r["file"] else None
+    return d
+
+def _load_job(job_id):
+    r = conn().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if not r: abort(404)
+    if r["status"] in ("queued", "running") and not _pid_alive(r["pid"]):
+        db_write(lambda c: c.execute("UPDATE jobs SET status='failed', message='interrupted: worker process exited', finished_at=? WHERE id=? AND status IN ('queued', 'running')",
+                                     (datetime.utcnow().isoformat(), job_id)))
+        r = conn().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return r
+
+def job_accepted(job_id):
+    # API 调用返回 202 + 任务信息；浏览器跳到任务页看进度
+    if request.accept_mimetypes.best == "application/json":
+        resp = jsonify(job_dict(_load_job(job_id)))
+        resp.status_code = 202; resp.headers["Location"] = url_for("job_status", job_id=job_id)
+        return resp
+    return redirect(url_for("job_status", job_id=job_id))
+
+@app.get("/jobs")
+def jobs_list():
+    if require_login(): return require_login()
+    rows = conn().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT 50").fetchall()
+    return render_template("jobs.html", jobs=[job_dict(r) for r in rows])
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    if require_login(): return require_login()
+    job = job_dict(_load_job(job_id))
+    if request.accept_mimetypes.best == "application/json" or request.args.get("format") == "json":
+        return jsonify(job)
+    return render_template("job.html", job=job)
+
+@app.get("/jobs/<job_id>/download")
+def job_download(job_id):
+    if require_login(): return require_login()
+    r = _load_job(job_id)
+    if r["status"] != "done" or not r["file"] or not os.path.exists(r["file"]): abort(404)
+    return send_file(r["file"], mimetype="text/csv", as_attachment=True,
+                     download_name=json.loads(r["result"] or "{}").get("filename", "export.csv"))
+
+@app.post("/jobs/export/<table>")
+def jobs_export(table):
+    if require_login(): return require_login()
+    if table not in EXPORT_SPECS: abort(404)
+    return job_accepted(_jobs.submit("export", {"table": table}))
+
+@app.post("/jobs/rebuild-totals")
+def jobs_rebuild_totals():
+    if require_login(): return require_login()
+    return job_accepted(_jobs.submit("rebuild-totals", {}))
+
+@app.post("/jobs/archive")
+def jobs_archive():
+    if require_login(): return require_login()
+    before = request.form.get("before") or archive_cutoff()
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", before): abort(400)
+    return job_accepted(_jobs.submit("archive", {"before": before}))
+
+# ----------------------- 归档（已结账月份移到按年的附属库） -----------------------
+# 工资 / 开销的旧月份几乎只读，却占了热表的大头。归档把 before 之前的月份逐月搬进
+# ARCHIVE_DIR/<库名>-<年>.db（ATTACH 后 INSERT ... SELECT），再从主库删除；删除触发器照常扣减
+# ledger_totals / monthly_totals / worker_balances / FTS，移走的金额记进 archive_totals 和 worker_balances 的 archive 部分，
+# Dashboard、/api/summary 与工人结余的总数不变。
+# 每个月分两步提交：先写归档库（INSERT OR REPLACE），再在主库记汇总并删除，中途中断重跑即可，不会丢也不会重复计数。
+# 两步之间写队列照常写：第二步只删与归档副本逐列相同的行（改过的留在主库，下次归档再搬），
+# 第一步复制过、之后被删掉或日期移出本月的行，撤掉其副本。
+# 归档后的记录不在列表 / 导出里；需要修改时 flask unarchive <年> 整年搬回。
+ARCHIVE_LEDGERS = {t: MONTH_LEDGERS[t] for t in ("salaries", "expenses")}
+
+def archive_path(year):
+    return os.path.join(ARCHIVE_DIR, f"{os.path.splitext(os.path.basename(APP_DB))[0]}-{year}.db")
+
+def archive_years():
+    prefix = os.path.splitext(os.path.basename(APP_DB))[0] + "-"
+    names = os.listdir(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else []
+    return sorted(n[len(prefix):-3] for n in names if n.startswith(prefix) and n.endswith(".db") and n[len(prefix):-3].isdigit())
+
+def archive_cutoff():
+    # 默认保留当月及之前 ARCHIVE_KEEP_MONTHS 个月
+    now = datetime.utcnow()
+    y, m = divmod(now.year * 12 + now.month - 1 - ARCHIVE_KEEP_MONTHS, 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+def _next_month(month):
+    y, m = divmod(int(month[:4]) * 12 + int(month[5:7]), 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+def _cols(c, schema, table):
+    return ", ".join(r["name"] for r in c.execute(f"PRAGMA {schema}.table_info({table})"))
+
+@contextmanager
+def _attached(c, year):
+    # ATTACH / DETACH 不能在事务里执行；归档表结构照抄主库（含 CENTS 列类型）
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    c.execute("ATTACH DATABASE ? AS arc", (archive_path(year),))
+    try:
+        for t, dcol in ARCHIVE_LEDGERS.items():
+            sql = c.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (t,)).fetchone()["sql"]
+            c.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?\s*\(', f"CREATE TABLE IF NOT EXISTS arc.{t}(", sql))
+            c.execute(f"CREATE INDEX IF NOT EXISTS arc.ix_{t}_{dcol} ON {t}({dcol})")
+        yield
+    finally:
+        if c.in_transaction: c.rollback()
+        c.execute("DETACH DATABASE arc")
+
+def archive_before(before, progress=None):
+    # before: 'YYYY-MM'（不含）。单独开连接（ATTACH 会留在连接上，不能用连接池的），返回 {账本: 移走行数}
+    cutoff, moved, now = before + "-01", dict.fromkeys(ARCHIVE_LEDGERS, 0), datetime.utcnow().isoformat()
+    c = db_connect()
+    try:
+        c.execute("CREATE TEMP TABLE arc_copied(ledger TEXT, id INTEGER, PRIMARY KEY(ledger, id))")  # 第一步复制了哪些行
+        months = sorted({r["m"] for t, dcol in ARCHIVE_LEDGERS.items()
+                         for r in c.execute(f"SELECT DISTINCT substr({dcol}, 1, 7) m FROM {t} WHERE {dcol} >= '0000' AND {dcol} < ?", (cutoff,))})
+        for year, group in itertools.groupby(months, key=lambda m: m[:4]):
+            with _attached(c, year):
+                for month in group:
+                    lo, hi = month + "-01", _next_month(month) + "-01"
+                    c.execute("BEGIN IMMEDIATE")
+                    c.execute("DELETE FROM temp.arc_copied")
+                    for t, dcol in ARCHIVE_LEDGERS.items():
+                        cols = _cols(c, "main", t)
+                        c.execute(f"INSERT INTO temp.arc_copied SELECT '{t}', id FROM main.{t} WHERE {dcol} >= ? AND {dcol} < ?", (lo, hi))
+                        c.execute(f"""INSERT OR REPLACE INTO arc.{t}({cols}) SELECT {cols} FROM main.{t}
+                                      WHERE id IN (SELECT id FROM temp.arc_copied WHERE ledger = '{t}')""")
+                    c.commit()
+                    c.execute("BEGIN IMMEDIATE")
+                    for t, dcol in ARCHIVE_LEDGERS.items():
+                        c.execute(f"""DELETE FROM arc.{t} WHERE id IN (SELECT id FROM temp.arc_copied WHERE ledger = '{t}')
+                                      AND id NOT IN (SELECT id FROM main.{t} WHERE {dcol} >= ? AND {dcol} < ?)""", (lo, hi))
+                        same = " AND ".join(f"a.{k} IS {t}.{k}" for k in _cols(c, "main", t).split(", "))
+                        a, where = _amount(t, t), (f"{dcol} >= ? AND {dcol} < ? AND id IN (SELECT id FROM temp.arc_copied WHERE ledger = '{t}') "
+                                                   f"AND EXISTS (SELECT 1 FROM arc.{t} a WHERE {same})")
+                        c.execute(f"""INSERT INTO archive_totals(ledger, month, n, total, n_active, total_active, archived_at)
+                                      SELECT '{t}', substr({dcol}, 1, 7) m, COUNT(*), SUM({a}), SUM(status IS 1), SUM({a} * (status IS 1)), ?
+                                      FROM main.{t} WHERE {where} GROUP BY m
+                                      ON CONFLICT(ledger, month) DO UPDATE SET n = n + excluded.n, total = total + excluded.total,
+                                      n_active = n_active + excluded.n_active, total_active = total_active + excluded.total_active,
+                                      archived_at = excluded.archived_at""", (now, lo, hi))
+                        c.execute(_balance_upsert(t, "archive", f"main.{t}", where), (lo, hi))
+                        moved[t] += c.execute(f"DELETE FROM main.{t} WHERE {where}", (lo, hi)).rowcount
+                    c.commit()
+                    if progress: progress(month, len(months))
+    finally: c.close()
+    return moved
+
+def unarchive_year(year):
+    # 整年搬回主库（插入触发器重新计入汇总 / FTS），删掉对应的 archive_totals 和归档文件
+    if not os.path.exists(archive_path(year)): return None
+    restored = {}
+    c = db_connect()
+    try:
+        with _attached(c, year):
+            c.execute("BEGIN IMMEDIATE")
+            for t in ARCHIVE_LEDGERS:
+                cols = _cols(c, "arc", t)
+                c.execute(_balance_upsert(t, "archive", f"arc.{t}", f"id NOT IN (SELECT id FROM main.{t})", sign="-"))
+                restored[t] = c.execute(f"INSERT OR IGNORE INTO main.{t}({cols}) SELECT {cols} FROM arc.{t}").rowcount
+                c.execute("DELETE FROM archive_totals WHERE ledger = ? AND month LIKE ?", (t, f"{year}-%"))
+            c.commit()
+    finally: c.close()
+    os.remove(archive_path(year))
+    return restored
+
+def _job_archive(job, before):
+    done = []
+    moved = archive_before(before, progress=lambda month, total: (done.append(month), job.progress(len(done), total)))
+    return {"before": before, "months": done, "moved": moved}
+
+JOB_KINDS["archive"] = _job_archive
+
+@app.cli.command("archive")
+@click.option("--before", help="YYYY-MM：归档该月之前的记录（默认保留最近 ARCHIVE_KEEP_MONTHS 个月）")
+def archive_cmd(before):
+    """把已结账月份的工资 / 开销移到 ARCHIVE_DIR 下按年的归档库。"""
+    before = before or archive_cutoff()
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", before): raise click.BadParameter("expected YYYY-MM", param_hint="--before")
+    moved = archive_before(before, progress=lambda month, total: print(f"archived {month}"))
+    print(f"archived before {before}: " + ", ".join(f"{t} {n}" for t, n in moved.items()))
+
+@app.cli.command("unarchive")
+@click.argument("year")
+def unarchive_cmd(year):
+    """把某一年的归档记录搬回主库并删除该年的归档文件。"""
+    restored = unarchive_year(year)
+    if restored is None: raise click.ClickException(f"no archive for {year}: {archive_path(year)}")
+    print(f"restored {year}: " + ", ".join(f"{t} {n}" for t, n in restored.items()))
 
 # ----------------------- 启动 -----------------------
 def _bootstrap():
-    try: init_db()
+    try:
+        with app.app_context():
+            init_db()
+            c = conn(); n = recover_jobs(c); c.commit()
+            if n: print(f"Marked {n} interrupted background job(s) as failed")
     except Exception as e: print("DB init error:", e)
+    if TEMPLATE_WARMUP:
+        t0 = time.perf_counter(); report = warmup_templates()
+        for name, _, _, err in report:
+            if err: print(f"Template warm-up error in {name}: {err}")
+        print(f"Templates warmed: {len(report)} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    _pool.close_idle()  # 放在最后：不把连接带进 fork 出来的 gunicorn worker
 
 _bootstrap()
 
@@ -0,0 +1,178 @@
+# bench.py – 压测 / 基准：在临时 APP_DB 里造数据，逐个路由测延迟、吞吐、内存，结果存 JSON 便于对比
+#   python bench.py --salaries 200000 --expenses 200000 --out run.json
+#   python bench.py --mode gunicorn --concurrency 16 --compare run.json
+import argparse, json, os, sys, time, random, resource, subprocess, tempfile, socket, platform
+import urllib.request, urllib.parse, http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta, datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Seed a scratch APP_DB and benchmark every route")
+    p.add_argument("--workers", type=int, default=200)
+    p.add_argument("--bank-accounts", type=int, default=500)
+    p.add_argument("--rentals", type=int, default=2000)
+    p.add_argument("--salaries", type=int, default=50000)
+    p.add_argument("--expenses", type=int, default=50000)
+    p.add_argument("--requests", type=int, default=50, help="每个路由的请求数")
+    p.add_argument("--concurrency", type=int, default=8, help="gunicorn 模式的并发客户端数")
+    p.add_argument("--mode", choices=["client", "gunicorn", "both"], default="client")
+    p.add_argument("--db", help="数据库路径（默认临时目录；已存在则跳过造数据）")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--routes", help="只测包含该子串的路由")
+    p.add_argument("--out", help="结果 JSON 路径")
+    p.add_argument("--compare", help="与之前的结果 JSON 对比")
+    return p.parse_args()
+
+# ----------------------- 造数据 -----------------------
+def seed(db, a):
+    import app as A  # 导入时执行迁移
+    rnd = random.Random(42)
+    day0 = date(2020, 1, 1)
+    d = lambda: (day0 + timedelta(days=rnd.randrange(2400))).isoformat()
+    now = datetime.utcnow().isoformat()
+    # 金额列存整数分（见 app.Money），直接插整数
+    words = ["工资", "奖金", "taxi", "meal", "hotel", "月结", "补发", "advance", "fuel", "office"]
+    note = lambda: " ".join(rnd.sample(words, 2)) + f" #{rnd.randrange(10**6)}"
+    c = A.db_connect(db)
+    t0 = time.perf_counter()
+    with c:
+        c.executemany("INSERT INTO workers(name, company, commission, expenses, status, created_at) VALUES(?,?,?,?,?,?)",
+                      ((f"工人{i:05d}", f"Co{i % 17}", rnd.randrange(10000), rnd.randrange(5000), int(rnd.random() > .1), now)
+                       for i in range(a.workers)))
+        c.executemany("INSERT INTO bank_accounts(bank_name, account_no, holder, card_company, status, created_at) VALUES(?,?,?,?,?,?)",
+                      ((f"Bank{i % 9}", f"{1000000000 + i}", f"holder {i}", rnd.choice(["Visa", "Master", "银联"]), 1, now)
+                       for i in range(a.bank_accounts)))
+        c.executemany("INSERT INTO card_rentals(bank_account_id, monthly_rent, start_date, end_date, note, status, created_at) VALUES(?,?,?,?,?,?,?)",
+                      ((rnd.randrange(1, a.bank_accounts + 1), rnd.randrange(5000, 50000), d(), rnd.choice(["", d()]), note(), 1, now)
+                       for _ in range(a.rentals)))
+        c.executemany("INSERT INTO salaries(worker_id, amount, pay_date, note, status, created_at) VALUES(?,?,?,?,?,?)",
+                      ((rnd.randrange(1, a.workers + 1), rnd.randrange(100000, 500000), d(), note(), int(rnd.random() > .05), now)
+                       for _ in range(a.salaries)))
+        c.executemany("INSERT INTO expenses(worker_id, amount, date, note, status, created_at) VALUES(?,?,?,?,?,?)",
+                      ((rnd.randrange(1, a.workers + 1), rnd.randrange(100, 50000), d(), note(), int(rnd.random() > .05), now)
+                       for _ in range(a.expenses)))
+    c.execute("ANALYZE"); c.close()
+    print(f"seeded {db} in {time.perf_counter() - t0:.1f}s")
+
+# ----------------------- 路由清单 -----------------------
+def routes(a):
+    import app as A
+    skip = {"logout", "login_post", "static"}
+    out = []
+    for rule in A.app.url_map.iter_rules():
+        if "GET" not in rule.methods or rule.endpoint in skip or rule.arguments: continue
+        out.append(rule.rule)
+    # 带 id 的编辑 partial：取第一条记录
+    for path in ("workers", "bank-accounts", "card-rentals", "salaries", "expenses"):
+        out.append(f"/{path}/1/edit?partial=1")
+    out += ["/salaries?q=taxi", "/expenses?from=2022-01-01&to=2022-03-31", "/salaries?after=1000"]
+    out = sorted(set(out))
+    return [u for u in out if not a.routes or a.routes in u]
+
+def stats(lat, wall, n_bytes):
+    lat = sorted(lat)
+    pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2)
+    return {"n": len(lat), "p50_ms": pick(.50), "p95_ms": pick(.95), "p99_ms": pick(.99), "max_ms": round(lat[-1] * 1000, 2),
+            "rps": round(len(lat) / wall, 1) if wall else None, "bytes": n_bytes}
+
+def rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+# ----------------------- Flask test client -----------------------
+def bench_client(a):
+    import app as A
+    cl = A.app.test_client()
+    res = {}
+    t = time.perf_counter(); r = cl.post("/login", data={"username": A.ADMIN_USERNAME, "password": A.ADMIN_PASSWORD})
+    res["POST /login"] = {**stats([time.perf_counter() - t], time.perf_counter() - t, 0), "status": r.status_code}
+    for u in routes(a):
+        before = rss_mb(); lat = []; size = 0; status = None
+        w0 = time.perf_counter()
+        for _ in range(a.requests):
+            t = time.perf_counter(); r = cl.get(u); body = r.get_data(); lat.append(time.perf_counter() - t)
+            size, status = len(body), r.status_code
+        res[u] = {**stats(lat, time.perf_counter() - w0, size), "status": status, "rss_peak_mb": rss_mb(), "rss_growth_mb": round(rss_mb() - before, 1)}
+        print(f"[client]   {u:50s} p50 {res[u]['p50_ms']:8.2f}  p95 {res[u]['p95_ms']:8.2f}  p99 {res[u]['p99_ms']:8.2f} ms  {res[u]['rps']:8.1f} rps")
+    return res
+
+# ----------------------- 真实 gunicorn -----------------------
+def _proc_tree_hwm(pid):
+    # master + 所有 worker 的 VmHWM 之和（MB），仅 Linux
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            with open(f"/proc/{p}/status") as fh:
+                total += next((int(l.split()[1]) for l in fh if l.startswith("VmHWM:")), 0)
+            with open(f"/proc/{p}/task/{p}/children") as fh:
+                todo += [int(x) for x in fh.read().split()]
+        except OSError: pass
+    return round(total / 1024, 1)
+
+def bench_gunicorn(a, db):
+    port = a.port or _free_port()
+    env = {**os.environ, "APP_DB": db, "PORT": str(port)}
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py"], cwd=HERE, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try: urllib.request.urlopen(base + "/health", timeout=1).read(); break
+            except OSError: time.sleep(.2)
+        else: raise RuntimeError("gunicorn did not start")
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        import app as A
+        t = time.perf_counter()
+        opener.open(base + "/login", data=urllib.parse.urlencode({"username": A.ADMIN_USERNAME, "password": A.ADMIN_PASSWORD}).encode()).read()
+        res = {"POST /login": stats([time.perf_counter() - t], time.perf_counter() - t, 0)}
+        def hit(u):
+            t = time.perf_counter(); body = opener.open(base + u, timeout=300).read()
+            return time.perf_counter() - t, len(body)
+        with ThreadPoolExecutor(a.concurrency) as pool:
+            for u in routes(a):
+                w0 = time.perf_counter()
+                out = list(pool.map(hit, [u] * a.requests))
+                res[u] = {**stats([x[0] for x in out], time.perf_counter() - w0, out[-1][1]), "rss_peak_mb": _proc_tree_hwm(proc.pid)}
+                print(f"[gunicorn] {u:50s} p50 {res[u]['p50_ms']:8.2f}  p95 {res[u]['p95_ms']:8.2f}  p99 {res[u]['p99_ms']:8.2f} ms  {res[u]['rps']:8.1f} rps")
+        return res
+    finally:
+        proc.terminate(); proc.wait(30)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+# ----------------------- 对比 -----------------------
+def compare(cur, old_path):
+    with open(old_path) as fh: old = json.load(fh)
+    print(f"\n对比 {old_path}（比值 <1 表示变快）")
+    for mode, routes_ in cur["results"].items():
+        for u, r in routes_.items():
+            o = old.get("results", {}).get(mode, {}).get(u)
+            if not o: continue
+            ratio = lambda k: f"{r[k] / o[k]:6.2f}x" if o.get(k) else "   n/a"
+            print(f"[{mode:8s}] {u:50s} p50 {ratio('p50_ms')}  p95 {ratio('p95_ms')}  p99 {ratio('p99_ms')}")
+
+def main():
+    a = parse_args()
+    db = a.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    fresh = not os.path.exists(db)
+    os.environ["APP_DB"] = db
+    sys.path.insert(0, HERE)
+    if fresh: seed(db, a)
+    result = {"meta": {"when": datetime.utcnow().isoformat(), "python": platform.python_version(), "db": db,
+                       "volumes": {k: getattr(a, k) for k in ("workers", "bank_accounts", "rentals", "salaries", "expenses")},
+                       "requests": a.requests, "concurrency": a.concurrency},
+              "results": {}}
+    if a.mode in ("client", "both"): result["results"]["client"] = bench_client(a)
+    if a.mode in ("gunicorn", "both"): result["results"]["gunicorn"] = bench_gunicorn(a, db)
+    if a.out:
+        with open(a.out, "w") as fh: json.dump(result, fh, indent=2, ensure_ascii=False)
+        print(f"results written to {a.out}")
+    if a.compare: compare(result, a.compare)
+
+if __name__ == "__main__":
+    main()
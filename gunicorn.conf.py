@@ -0,0 +1,40 @@
+# gunicorn.conf.py – 服务档位（Procfile: gunicorn app:app -c gunicorn.conf.py）
+# 默认 gthread：少量进程 + 每进程多线程。SQLite 同一时刻只有一个写者，进程开多了只会抢写锁，
+# 并发主要靠线程；慢请求（大导出、长列表）只占一个线程，不再占掉半个服务。
+# 只支持 gthread（调试可用 sync）：sqlite3 调用不会让出 gevent / eventlet 的事件循环，
+# 协程 worker 里一条慢查询或一次大导出照样卡住同进程的所有请求，所以不提供协程档位。
+import os, multiprocessing
+
+WORKER_CLASS = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")   # gthread / sync
+if WORKER_CLASS not in ("gthread", "sync"):
+    raise SystemExit(f"GUNICORN_WORKER_CLASS={WORKER_CLASS!r} is not supported; use gthread")
+
+def _autotune():
+    # 进程数：WEB_CONCURRENCY（Heroku 按 dyno 大小自动设置）优先，否则取 CPU 数，封顶 WEB_CONCURRENCY_MAX
+    cpu = multiprocessing.cpu_count()
+    procs = int(os.environ.get("WEB_CONCURRENCY") or min(cpu, int(os.environ.get("WEB_CONCURRENCY_MAX", "4"))))
+    # 线程数：GUNICORN_THREADS 优先，否则每核 4 个，限制在 4..16
+    threads = int(os.environ.get("GUNICORN_THREADS") or max(4, min(16, cpu * 4 // max(1, procs))))
+    return max(1, procs), max(1, threads)
+
+workers, _threads = _autotune()
+worker_class = WORKER_CLASS
+threads = _threads if WORKER_CLASS == "gthread" else 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+# preload：迁移、模板预热等 _bootstrap() 只在 master 执行一次，worker fork 后直接共享；
+# conn() 的连接池和写线程按 pid 懒创建，master 里打开过的连接在 _bootstrap 结束时已关闭。
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# 读连接池与并发度对齐：每个线程同一时刻最多占一条连接
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+
+def on_starting(server):
+    server.log.info("Serving profile: %s workers=%s threads=%s pool=%s preload=%s",
+                    worker_class, workers, threads, os.environ["DB_POOL_SIZE"], preload_app)
@@ -0,0 +1,30 @@
+# 所有测试共用一个临时 APP_DB：必须在第一次 import app 之前设好环境变量（导入时执行迁移）
+import os, sys, tempfile
+
+import pytest
+
+TMP = tempfile.mkdtemp(prefix="app-test-")
+os.environ["APP_DB"] = os.path.join(TMP, "test.db")
+os.environ.setdefault("JINJA_CACHE_DIR", os.path.join(TMP, "jinja"))
+os.environ.setdefault("TEMPLATE_WARMUP", "0")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def A():
+    import app
+    return app
+
+@pytest.fixture(scope="session")
+def client(A):
+    cl = A.app.test_client()
+    cl.post("/login", data={"username": A.ADMIN_USERNAME, "password": A.ADMIN_PASSWORD})
+    return cl
+
+@pytest.fixture(scope="session")
+def query(A):
+    # 测试里直接读库（走连接池，需要 app context）
+    def run(sql, params=()):
+        with A.app.app_context():
+            return [tuple(r) for r in A.conn().execute(sql, params).fetchall()]
+    return run
@@ -0,0 +1,51 @@
+# 归档 / 取消归档往返：Dashboard、/api/summary、/reports/balances 的数字不变，取消归档后明细原样回到主库
+import os, re
+
+import pytest
+
+import app as A
+
+OLD, RECENT = ("2019-03-05", "2019-04-20"), "2024-06-01"
+
+@pytest.fixture(scope="module")
+def worker(client, query):
+    client.post("/workers/add", data={"name": "归档测试", "commission": "10", "expenses": "1"})
+    wid = query("SELECT MAX(id) FROM workers")[0][0]
+    for d in OLD + (RECENT,):
+        client.post("/salaries/add", data={"worker_id": wid, "amount": "120.50", "pay_date": d, "note": "arc"})
+        client.post("/expenses/add", data={"worker_id": wid, "amount": "8.25", "date": d, "note": "arc"})
+    client.post("/salaries/add", data={"worker_id": wid, "amount": "0.01", "pay_date": OLD[0], "note": "off"})
+    sid = query("SELECT MAX(id) FROM salaries")[0][0]
+    client.post(f"/salaries/{sid}/toggle")  # 停用的记录也要原样往返
+    return wid
+
+def _snapshot(client):
+    dash = re.findall(r'class="card-value">([^<]*)<', client.get("/").get_data(as_text=True))
+    summary = client.get("/api/summary?from=2019-01&to=2024-12").get_json()
+    summary_active = client.get("/api/summary?from=2019-01&to=2024-12&active=1").get_json()
+    balances = client.get("/reports/balances").get_data(as_text=True)
+    return dash, summary, summary_active, balances
+
+def _rows(query, wid):
+    return {t: query(f"SELECT * FROM {t} WHERE worker_id = ? ORDER BY id", (wid,)) for t in A.ARCHIVE_LEDGERS}
+
+def test_archive_round_trip(client, query, worker):
+    before, rows = _snapshot(client), _rows(query, worker)
+    assert len(rows["salaries"]) == 4 and len(rows["expenses"]) == 3
+
+    moved = A.archive_before("2020-01")
+    assert moved == {"salaries": 3, "expenses": 2}
+    assert os.path.exists(A.archive_path("2019"))
+    assert [len(v) for v in _rows(query, worker).values()] == [1, 1]
+    assert _snapshot(client) == before
+
+    A.archive_before("2020-01")  # 重跑：没有可归档的行，不重复计数
+    assert _snapshot(client) == before
+
+    restored = A.unarchive_year("2019")
+    assert restored == {"salaries": 3, "expenses": 2}
+    assert not os.path.exists(A.archive_path("2019"))
+    assert _rows(query, worker) == rows
+    assert query("SELECT COUNT(*) FROM archive_totals WHERE month LIKE '2019-%'") == [(0,)]
+    assert query("SELECT COUNT(*) FROM worker_balances WHERE part = 'archive' AND n <> 0") == [(0,)]
+    assert _snapshot(client) == before
@@ -0,0 +1,58 @@
+# 导出的 CSV 原样再导入：每张可导入的表都不应 500；bank_accounts 的重复账户记为行错误
+import io
+
+import pytest
+
+import app as A  # conftest 已设好 APP_DB
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded(client):
+    for i in range(3):
+        client.post("/workers/add", data={"name": f"工人{i}", "company": "Co", "commission": "1.50", "expenses": "2"})
+        client.post("/bank-accounts/add", data={"bank_name": "Bank", "account_no": f"100{i}", "holder": f"h{i}", "status": "1"})
+        client.post("/card-rentals/add", data={"bank_name": "Bank", "account_no": f"100{i}", "monthly_rent": "300",
+                                               "start_date": "2024-01-01", "note": "n"})
+        client.post("/salaries/add", data={"worker_id": "1", "amount": "100.10", "pay_date": "2024-02-03", "note": "工资"})
+        client.post("/expenses/add", data={"worker_id": "", "amount": "7.05", "date": "2024-02-04", "note": "taxi"})
+
+def _count(table):
+    with A.app.app_context():
+        return A.conn().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+@pytest.mark.parametrize("table", sorted(A.IMPORT_SPECS))
+def test_export_then_import(client, table):
+    body = client.get(f"/export/{table}.csv").get_data()
+    n = _count(table)
+    r = client.post(f"/import/{table}.csv", data={"file": (io.BytesIO(body), f"{table}.csv")},
+                    headers={"Accept": "application/json"})
+    assert r.status_code == 200
+    report = r.get_json()
+    assert report["rows"] + report["failed"] == n
+    if table == "bank_accounts":
+        # 同一 (银行名, 账号) 已存在：逐行报错，不插入
+        assert report["rows"] == 0 and len(report["errors"]) == n
+        assert all("已存在" in e["error"] for e in report["errors"])
+        assert _count(table) == n
+    else:
+        assert report["failed"] == 0
+        assert _count(table) == 2 * n
+
+def test_bank_accounts_partial_duplicates(client):
+    n = _count("bank_accounts")
+    csv_text = "bank_name,account_no,holder\nBank,1000,dup\nNew,2000,a\nNew,2000,again\n"
+    r = client.post("/import/bank_accounts.csv", data={"file": (io.BytesIO(csv_text.encode()), "b.csv")},
+                    headers={"Accept": "application/json"})
+    report = r.get_json()
+    assert r.status_code == 200 and report["rows"] == 1 and report["failed"] == 2
+    assert [e["line"] for e in report["errors"]] == [2, 4]
+    assert _count("bank_accounts") == n + 1
+
+# 编码不是 UTF-8 / 字段超过 csv.field_size_limit：文件级错误，整个文件不导入
+@pytest.mark.parametrize("body", ["name,company\nJosé,Café\n".encode("latin-1"), b"name\n" + b"x" * (1 << 18) + b"\n"])
+def test_unreadable_file_is_rejected(client, body):
+    n = _count("workers")
+    r = client.post("/import/workers.csv", data={"file": (io.BytesIO(body), "w.csv")}, headers={"Accept": "application/json"})
+    assert r.status_code == 400
+    report = r.get_json()
+    assert report["error"] and report["rows"] == 0
+    assert _count("workers") == n
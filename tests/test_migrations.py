@@ -0,0 +1,61 @@
+# 旧库升级：按 baseline 的表结构（金额 REAL、日期写法不统一）建库，在子进程里 import app 跑完全部迁移后检查结果
+import os, sqlite3, subprocess, sys, tempfile
+
+import pytest
+
+from conftest import ROOT
+
+LEGACY_SCHEMA = """
+CREATE TABLE users(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password_hash TEXT, is_admin INTEGER DEFAULT 1);
+CREATE TABLE workers(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, company TEXT, commission REAL DEFAULT 0.0, expenses REAL DEFAULT 0.0, created_at TEXT);
+CREATE TABLE bank_accounts(id INTEGER PRIMARY KEY AUTOINCREMENT, bank_name TEXT, account_no TEXT, holder TEXT, created_at TEXT);
+CREATE TABLE card_rentals(id INTEGER PRIMARY KEY AUTOINCREMENT, bank_account_id INTEGER, monthly_rent REAL, start_date TEXT, end_date TEXT, note TEXT, created_at TEXT);
+CREATE TABLE salaries(id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, pay_date TEXT, note TEXT, created_at TEXT);
+CREATE TABLE expenses(id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id INTEGER, amount REAL, date TEXT, note TEXT, created_at TEXT);
+INSERT INTO workers(name, company, commission, expenses, created_at) VALUES('old w', 'co', 12.5, 3, '2024-01-01T00:00:00.123');
+INSERT INTO bank_accounts(bank_name, account_no, holder, created_at) VALUES('B', '1', 'h', '2024-01-01'), ('C', '2', 'x', '2024-01-03');
+INSERT INTO card_rentals(bank_account_id, monthly_rent, start_date, end_date, note, created_at)
+    VALUES(1, 99.9, '2024-02-10', '2024-05-31', 'a', '2024-02-10'), (2, 10, '2024/03/01', NULL, 'slashes', '2024-03-01');
+INSERT INTO salaries(worker_id, amount, pay_date, note, created_at)
+    VALUES(1, 1000.1, '2024-01-31', 'jan', '2024-01-31'), (1, 1000.2, '2024年2月29日', 'feb', '2024-02-29'), (1, 0.1, '2024/2/1', 'x', '2024-02-01');
+INSERT INTO expenses(worker_id, amount, date, note, created_at) VALUES(1, 20.5, '2024-01-15', 'taxi', '2024-01-15'), (NULL, 3.3, '20240201', 'misc', '2024-02-01');
+"""
+
+@pytest.fixture(scope="module")
+def legacy():
+    d = tempfile.mkdtemp(prefix="app-legacy-")
+    path = os.path.join(d, "legacy.db")
+    c = sqlite3.connect(path); c.executescript(LEGACY_SCHEMA); c.commit(); c.close()
+    env = {**os.environ, "APP_DB": path, "TEMPLATE_WARMUP": "0", "JINJA_CACHE_DIR": os.path.join(d, "jinja")}
+    r = subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+    c = sqlite3.connect(path)
+    yield c
+    c.close()
+
+def test_money_columns_become_integer_cents(legacy):
+    rows = legacy.execute("SELECT amount, typeof(amount) FROM salaries ORDER BY id").fetchall()
+    assert rows == [(100010, "integer"), (100020, "integer"), (10, "integer")]
+    assert legacy.execute("SELECT amount FROM expenses ORDER BY id").fetchall() == [(2050,), (330,)]
+    assert legacy.execute("SELECT monthly_rent FROM card_rentals ORDER BY id").fetchall() == [(9990,), (1000,)]
+    assert legacy.execute("SELECT commission, expenses FROM workers").fetchall() == [(1250, 300)]
+    # 表重建后 id 和自增序列不变，新行接着编号
+    assert legacy.execute("SELECT seq FROM sqlite_sequence WHERE name = 'salaries'").fetchone() == (3,)
+
+def test_totals_rebuilt_from_cents(legacy):
+    totals = dict((r[0], r[1:]) for r in legacy.execute("SELECT ledger, n, total, n_active, total_active FROM ledger_totals"))
+    assert totals["salaries"] == (3, 200040, 3, 200040)
+    assert totals["expenses"] == (2, 2380, 2, 2380)
+    assert totals["card_rentals"] == (2, 10990, 2, 10990)
+    assert totals["workers"][0] == 1
+    assert legacy.execute("SELECT typeof(total) FROM ledger_totals WHERE ledger = 'salaries'").fetchone() == ("integer",)
+
+def test_dates_rewritten_to_iso(legacy):
+    assert legacy.execute("SELECT pay_date FROM salaries ORDER BY id").fetchall() == [("2024-01-31",), ("2024-02-29",), ("2024-02-01",)]
+    assert legacy.execute("SELECT date FROM expenses ORDER BY id").fetchall() == [("2024-01-15",), ("2024-02-01",)]
+    assert legacy.execute("SELECT start_date, end_date FROM card_rentals ORDER BY id").fetchall() == [("2024-02-10", "2024-05-31"), ("2024-03-01", "")]
+    assert legacy.execute("SELECT created_at FROM bank_accounts ORDER BY id").fetchall() == [("2024-01-01T00:00:00",), ("2024-01-03T00:00:00",)]
+    assert legacy.execute("SELECT created_at FROM workers").fetchall() == [("2024-01-01T00:00:00.123",)]  # 已是 ISO，原样保留
+    # 月汇总按规整后的月份计：旧写法的键不留空行
+    months = legacy.execute("SELECT month, n, total FROM monthly_totals WHERE ledger = 'salaries' ORDER BY month").fetchall()
+    assert months == [("2024-01", 1, 100010), ("2024-02", 2, 100030)]
@@ -0,0 +1,53 @@
+# 工人流水分页：跨页的滚动余额前后衔接，顶行余额等于工人当前余额；上一页与下一页看到的行一致
+import html, re
+from decimal import Decimal
+
+import pytest
+
+ROW = re.compile(r"<tr>\s*<td>([^<]*)</td><td>[^<]*</td><td>(\d+)</td>\s*<td>([+-][\d.]+)</td><td>[^<]*</td><td>([^<]*)</td><td>([-\d.]+)</td>")
+
+@pytest.fixture(scope="module")
+def worker(client, query):
+    client.post("/workers/add", data={"name": "流水测试", "commission": "50", "expenses": "3.5"})
+    wid = query("SELECT MAX(id) FROM workers")[0][0]
+    for i in range(7):
+        d = f"2023-0{1 + i // 2}-1{i % 2}"  # 两两同日，工资与开销交错
+        client.post("/salaries/add", data={"worker_id": wid, "amount": f"{10 + i}.25", "pay_date": d, "note": "s"})
+        client.post("/expenses/add", data={"worker_id": wid, "amount": f"{i}.10", "date": d, "note": "e"})
+    sid = query("SELECT MAX(id) FROM salaries WHERE worker_id = ?", (wid,))[0][0]
+    client.post(f"/salaries/{sid}/toggle")  # 停用的记录照常列出，但不计入余额
+    return wid
+
+def _page(client, url):
+    body = client.get(url).get_data(as_text=True)
+    rows = [(d, int(i), Decimal(a), s == "✅", Decimal(b)) for d, i, a, s, b in ROW.findall(body)]
+    links = {m[1]: html.unescape(m[0]) for m in re.findall(r'<a class="btn" href="([^"]*)">[^<]*?(上一页|下一页)', body)}
+    balance = re.findall(r'class="card-value">([^<]*)<', body)[-1]
+    return rows, links, Decimal(balance)
+
+def test_running_balance_across_pages(client, query, worker):
+    url, pages = f"/workers/{worker}/ledger?size=3", []
+    while url:
+        rows, links, balance = _page(client, url)
+        pages.append((url, rows))
+        url = links.get("下一页")
+    rows = [r for _, p in pages for r in p]
+    assert len(pages) == 5 and len(rows) == 14
+    assert [r[0] for r in rows] == sorted((r[0] for r in rows), reverse=True)
+
+    assert rows[0][4] == balance
+    for cur, older in zip(rows, rows[1:]):
+        assert cur[4] - (cur[2] if cur[3] else 0) == older[4], (cur, older)
+    last = rows[-1]
+    assert last[4] - (last[2] if last[3] else 0) == Decimal("53.50")  # 佣金 + 开销：没有任何流水时的余额
+
+def test_prev_link_returns_same_rows(client, worker):
+    url, seen = f"/workers/{worker}/ledger?size=3", []
+    while True:
+        rows, links, _ = _page(client, url)
+        seen.append(rows)
+        if "下一页" not in links: break
+        url = links["下一页"]
+    for expected in reversed(seen[:-1]):
+        rows, links, _ = _page(client, links["上一页"])
+        assert rows == expected